@@ -1,41 +1,79 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Blueprint, Flask, current_app, request, jsonify, make_response
 from service.flask_sqlalchemy.api_database import db
-from service.api_methods import startup_event, fake_users_db, upload_file, paginate_query 
-from service.api_methods import backup_table_to_avro, restore_table_from_s3_avro, execute_query
+from service.sqlalchemy.engine import get_database_uri, get_pool_stats
+from service.sqlalchemy.replicas import get_read_session, get_replica_router
+from service.sqlalchemy.profiling import get_query_profiler
+from service.metrics import start_request_timer, observe_request, render_metrics
+from service.api_methods import fake_users_db, upload_file, paginate_query
+from service.api_methods import backup_tables_to_avro, restore_table_from_s3_avro, restore_table_from_s3_parquet, execute_query
+from service.api_methods import get_upload_job_status, get_cached_report, get_report_cache_stats
+from service.api_methods import paginate_query_by_cursor, paginate_windowed_query, decode_cursor, InvalidCursorError
 import datetime
 import jwt
 from security.auth_middleware import token_required
 from flask_swagger_ui import get_swaggerui_blueprint
 import json
 from config import config
-
-file_types = ["job", "department", "employee"]
-
-app = Flask(__name__)
-# Retrieve database uri
-database_uri = (
-    f"{config.database_config['DATABASE_DIALECT']}://{config.database_config['DATABASE_USER']}:{config.database_config['DATABASE_PASSWORD']}"
-    f"@{config.database_config['DATABASE_HOST']}:{config.database_config['DATABASE_PORT']}/{config.database_config['DATABASE_NAME']}"
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
 )
-app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
 
-db.init_app(app)
-startup_event()
-
-# Security using JWT Token
-app.config["JWT_SECRET_KEY"] = config.jwt_config["JWT_SECRET_KEY"]  # This will be my secret key
+file_types = ["job", "department", "employee"]
 
 # Configuración de Swagger
 SWAGGER_URL = '/swagger'
 API_URL = '/spec'  # URL donde se servirá la especificación de Swagger
-swaggerui_blueprint = get_swaggerui_blueprint(
-    SWAGGER_URL,
-    API_URL,
-    config={'app_name': "DataChallenge API"}
-)
-app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
-@app.route("/spec")
+api = Blueprint('api', __name__)
+
+# Types of the sort values of the cursors of the reports, see decode_cursor
+EMPLOYEES_BY_QUARTER_CURSOR = (str, str)  # department, job
+HIRED_ABOVE_MEAN_CURSOR = (int, int)  # hired, id
+
+def create_app():
+    """Create and configure the Flask application.
+
+    Nothing is connected here: the engine (shared with the scripts) opens its
+    connections on first use, and the DB creators are created for every request
+    (see `get_db_creator`), so the app can be created once by the gunicorn master
+    (preload_app) and used by every forked worker and thread. The workers dispose
+    the engines inherited from the master after the fork, see gunicorn.conf.py.
+
+    Returns:
+        Flask: The application.
+    """
+    app = Flask(__name__)
+    # Retrieve database uri, the engine and its pool are shared with the scripts
+    app.config['SQLALCHEMY_DATABASE_URI'] = get_database_uri()
+    db.init_app(app)
+
+    # Security using JWT Token
+    app.config["JWT_SECRET_KEY"] = config.jwt_config["JWT_SECRET_KEY"]  # This will be my secret key
+
+    swaggerui_blueprint = get_swaggerui_blueprint(
+        SWAGGER_URL,
+        API_URL,
+        config={'app_name': "DataChallenge API"}
+    )
+    app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+    app.register_blueprint(api)
+    app.teardown_appcontext(remove_read_session)
+    # Latency of every request by route, see /metrics
+    app.before_request(start_request_timer)
+    app.after_request(observe_request)
+    logger.info("DB Connections Startup")
+    return app
+
+def remove_read_session(exception=None):
+    # Give back the connections of the report queries, as Flask-SQLAlchemy does with db.session
+    get_read_session().remove()
+
+@api.route("/spec")
 def spec():
     """Generate the Swagger specification.
 
@@ -46,7 +84,7 @@ def spec():
         swag = json.load(spec_file)
     return jsonify(swag)
 
-@app.route("/login")
+@api.route("/login")
 def login():
     """Authenticate user and return a Bearer token.
 
@@ -60,11 +98,11 @@ def login():
     auth = request.authorization
     if auth and auth.password == fake_users_db[auth.username]["password"]:
         token = jwt.encode({'user': auth.username, 'exp': datetime.datetime.now(datetime.timezone.utc) + 
-                            datetime.timedelta(seconds=1800)}, app.config['JWT_SECRET_KEY'])
+                            datetime.timedelta(seconds=1800)}, current_app.config['JWT_SECRET_KEY'])
         return jsonify({'token': f'{token}'})
     return make_response('Could not Verify', 401, {'WWW-Authenticate': 'Basic realm ="Login Required"'})
 
-@app.route('/upload', methods=['POST'])
+@api.route('/upload', methods=['POST'])
 @token_required
 def upload_any_file():
     """Upload file to the database specifying the type of the file.
@@ -79,7 +117,7 @@ def upload_any_file():
         return jsonify({"error": "file_type is required"}), 400
     return upload_file(file_type=file_type)
 
-@app.route('/jobs/upload', methods=['POST'])
+@api.route('/jobs/upload', methods=['POST'])
 @token_required
 def upload_job_file():
     """Upload job file to the database.
@@ -91,7 +129,7 @@ def upload_job_file():
     """
     return upload_file(file_type="job")
 
-@app.route('/departments/upload', methods=['POST'])
+@api.route('/departments/upload', methods=['POST'])
 @token_required
 def upload_department_file():
     """Upload department file to the database.
@@ -103,7 +141,7 @@ def upload_department_file():
     """
     return upload_file(file_type="department")
 
-@app.route('/employees/upload', methods=['POST'])
+@api.route('/employees/upload', methods=['POST'])
 @token_required
 def upload_employee_file():
     """Upload employee file to the database.
@@ -115,33 +153,87 @@ def upload_employee_file():
     """
     return upload_file(file_type="employee")
 
-@app.route('/backup', methods=['GET'])
+@api.route('/upload/jobs/<job_id>', methods=['GET'])
+@token_required
+def upload_job_status(job_id):
+    """Get the progress of an upload sent with the async option.
+
+    Returns:
+        jsonify: The job status with the rows parsed, valid, invalid and inserted and the elapsed time.
+    """
+    return get_upload_job_status(job_id)
+
+@api.route('/backup', methods=['GET'])
 @token_required
 def backup_database():
     """Create the backup file for all the tables in the database.
 
-    This endpoint allows users to request the creation of a AVRO file as a backup
+    This endpoint allows users to request the creation of a AVRO file as a backup,
+    the tables are backed up at the same time from a consistent snapshot.
+    With mode=incremental only the rows added since the last backup are saved.
+    With format=parquet the tables are saved as Parquet files, the employees partitioned by hire year.
     
     Returns:
-        jsonify: A response indicating success or failure of the backup process.
+        jsonify: A response indicating success or failure of the backup process, with the seconds of each table.
     """    
-    messages = [backup_table_to_avro(file_type) for file_type in file_types]
-    return jsonify({"message": " - ".join(messages)}), 200
+    mode = request.args.get('mode', 'full', type=str)
+    backup_format = request.args.get('format', 'avro', type=str)
+    if mode not in ('full', 'incremental'):
+        return jsonify({'error': 'mode must be full or incremental'}), 400
+    if backup_format not in ('avro', 'parquet'):
+        return jsonify({'error': 'format must be avro or parquet'}), 400
+    if backup_format == 'parquet' and mode == 'incremental':
+        return jsonify({'error': 'incremental backups are only available in avro format'}), 400
+    return jsonify(backup_tables_to_avro(file_types, incremental=mode == 'incremental',
+                                         backup_format=backup_format)), 200
+
+def get_int_list_arg(name):
+    """
+    Get a list of integers from a query parameter, repeated (?year=2020&year=2021) or comma separated.
+
+    Args:
+        name (str): Name of the query parameter.
+
+    Returns:
+        list: The integers, None when the parameter is not given.
+
+    Raises:
+        ValueError: If a value is not an integer.
+    """
+    values = [value for arg in request.args.getlist(name) for value in arg.split(',') if value.strip()]
+    return [int(value) for value in values] or None
 
-@app.route('/restore', methods=['GET'])
+@api.route('/restore', methods=['GET'])
 @token_required
 def restore_database():
     """Create the restored table from all the existing avro backup files in the database.
 
     This endpoint allows users to request the creation of the table using the existin AVRO file backup
+    With format=parquet the Parquet backup is restored, and the employees can be
+    filtered by hire year (year) and department (department_id), reading only the
+    partitions and row groups that match.
     
     Returns:
         jsonify: A response indicating success or failure of the backup process.
     """
-    messages = [restore_table_from_s3_avro(file_type) for file_type in file_types]
+    backup_format = request.args.get('format', 'avro', type=str)
+    if backup_format not in ('avro', 'parquet'):
+        return jsonify({'error': 'format must be avro or parquet'}), 400
+    try:
+        years = get_int_list_arg('year')
+        department_ids = get_int_list_arg('department_id')
+    except ValueError:
+        return jsonify({'error': 'year and department_id must be integers'}), 400
+    if backup_format == 'avro':
+        if years or department_ids:
+            return jsonify({'error': 'year and department_id filters need format=parquet'}), 400
+        messages = [restore_table_from_s3_avro(file_type) for file_type in file_types]
+    else:
+        messages = [restore_table_from_s3_parquet(file_type, years=years, department_ids=department_ids)
+                    for file_type in file_types]
     return jsonify({"message": " - ".join(messages)}), 200
 
-@app.route('/employees/by_quarter', methods=['GET'])
+@api.route('/employees/by_quarter', methods=['GET'])
 @token_required
 def hired_employees_by_quarter():
     """
@@ -151,11 +243,23 @@ def hired_employees_by_quarter():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     query_year = request.args.get('year', 2021, type=str)
+    # Keyset pagination when a cursor is sent (empty for the first page)
+    cursor = request.args.get('cursor', None, type=str)
+    try:
+        decode_cursor(cursor, EMPLOYEES_BY_QUARTER_CURSOR)
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return get_cached_report('employees_by_quarter', build_employees_by_quarter, query_year, page, per_page, cursor), 200
 
-    query = execute_query("get_employees_by_quarter", query_year)
-     
+def build_employees_by_quarter(query_year, page, per_page, cursor=None):
     # Apply pagination
-    items, metadata = paginate_query(query, page, per_page)
+    if cursor is None:
+        query = execute_query("get_employees_by_quarter", query_year)
+        items, metadata = paginate_query(query, page, per_page)
+    else:
+        query = execute_query("get_employees_by_quarter", query_year, after=decode_cursor(cursor, EMPLOYEES_BY_QUARTER_CURSOR))
+        items, metadata = paginate_query_by_cursor(query, per_page, ['department', 'job'])
     
     # Serialización del resultado
     result = [
@@ -170,28 +274,34 @@ def hired_employees_by_quarter():
         for row in items
     ]
 
-    return jsonify({'data': result, **metadata}), 200
+    return {'data': result, **metadata}
 
-@app.route('/departments/hired_above_mean', methods=['GET'])
+@api.route('/departments/hired_above_mean', methods=['GET'])
 @token_required
 def get_departments_hired_above_mean():
         # Get pagination parameters by request
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
     query_year = request.args.get('year', 2021, type=str)
-
-    # Step 1: Calculate the mean number of employees hired in 2021
-    mean_query = execute_query("get_employees_mean", query_year)
-    mean_hired = mean_query.scalar()
-    if mean_hired is None:
-        mean_hired = 0
-    # Step 2: Get departments that hired more than the mean
-    query =  execute_query("get_departments_above_mean", query_year, mean_hired)
-
-    # Apply pagination
-    items, metadata = paginate_query(query, page, per_page)
-
-    # Step 5: Format the results
+    # Keyset pagination when a cursor is sent (empty for the first page)
+    cursor = request.args.get('cursor', None, type=str)
+    try:
+        decode_cursor(cursor, HIRED_ABOVE_MEAN_CURSOR)
+    except InvalidCursorError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return get_cached_report('departments_hired_above_mean', build_departments_hired_above_mean, query_year, page, per_page, cursor), 200
+
+def build_departments_hired_above_mean(query_year, page, per_page, cursor=None):
+    # The mean, the filter and the total are computed by a single statement
+    if cursor is None:
+        query = execute_query("get_departments_hired_above_mean", query_year)
+        items, metadata = paginate_windowed_query(query, page, per_page)
+    else:
+        query = execute_query("get_departments_hired_above_mean", query_year, after=decode_cursor(cursor, HIRED_ABOVE_MEAN_CURSOR))
+        items, metadata = paginate_query_by_cursor(query, per_page, ['hired', 'id'])
+
+    # Format the results
     result = [
         {
             "id": row.id,
@@ -201,12 +311,59 @@ def get_departments_hired_above_mean():
         for row in items
     ]
 
-    return jsonify({'data': result, **metadata}), 200
+    return {'data': result, **metadata}
+
+@api.route('/reports/cache', methods=['GET'])
+@token_required
+def report_cache_stats():
+    """
+    Get the hit/miss counters of the report cache.
+    """
+    return get_report_cache_stats()
+
+@api.route('/admin/pool', methods=['GET'])
+@token_required
+def database_pool_stats():
+    """
+    Get the state of the database connection pools and how long the requests waited for a connection.
+    """
+    return jsonify(get_pool_stats())
+
+@api.route('/admin/replicas', methods=['GET'])
+@token_required
+def read_replicas_stats():
+    """
+    Get the health of the read replicas and the reads sent to each of them and to the primary.
+    """
+    return jsonify(get_replica_router().stats())
+
+@api.route('/admin/queries', methods=['GET'])
+@token_required
+def query_profile():
+    """
+    Get the SQL statements that took the most time with their calls, latency, rows
+    and the plans captured for the slow ones; `limit` sets how many are returned.
+    """
+    profiler = get_query_profiler()
+    if profiler is None:
+        return jsonify({'error': 'Query profiling is disabled, see the [profiling] settings'}), 404
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(profiler.summary(limit=limit))
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Get the latency histograms of the routes and of the upload, backup, restore and
+    report phases, and the rows processed by every phase, in the Prometheus text format.
 
+    Not protected by the token so Prometheus can scrape it, the metrics of every
+    gunicorn worker are added up (see the `multiprocess_dir` setting).
+    """
+    return current_app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True)
-    #app.run(host='0.0.0.0', port=5000)
+    create_app().run(debug=True)
+    #create_app().run(host='0.0.0.0', port=5000)
 
 # TEST API BY TERMINAL
 # curl -X POST -F "file=@C:\Users\a_f_e\Downloads\Data Challenge\jobs2.csv" http://localhost:5000/jobs/upload
\ No newline at end of file
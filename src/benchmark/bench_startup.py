@@ -0,0 +1,86 @@
+"""
+Benchmark of the cold start of the API: time to import `app`, to create the app
+and to answer the first request, each one measured in a new Python process, and
+the heavy dependencies loaded by then (they should only be loaded by the uploads,
+backups and restores that use them).
+
+It does not need a database, /spec and a failed /login do not connect.
+
+Usage (from the repository root):
+    PYTHONPATH=src python -m benchmark.bench_startup --runs 10 --max-import-seconds 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Dependencies that the API must not load to start and serve the first request
+HEAVY_MODULES = ['pandas', 'pandera', 'numpy', 'avro', 'boto3', 'botocore', 'pyarrow']
+
+# Code run in every new process, it prints its timings as JSON
+STARTUP_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get({path!r})
+answered = time.perf_counter()
+heavy = {heavy!r}
+print(json.dumps({{
+    'import_seconds': imported - start,
+    'create_app_seconds': created - imported,
+    'first_request_seconds': answered - created,
+    'status_code': response.status_code,
+    # Modules loaded for real, a pending lazy import has no submodules yet
+    'loaded_heavy_modules': [name for name in heavy if any(module.startswith(name + '.') for module in sys.modules)],
+}}))
+"""
+
+def measure_startup(path='/spec'):
+    """
+    Start a new Python process that imports the API, creates it and answers one request.
+
+    Args:
+        path (str): Path of the first request.
+
+    Returns:
+        dict: The seconds of every step, the status code and the heavy modules loaded.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, ['src', os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-c', STARTUP_CODE.format(path=path, heavy=HEAVY_MODULES)],
+                            capture_output=True, text=True, env=env, check=True)
+    # The last line is the JSON, the logs go before it
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the API")
+    parser.add_argument("--runs", type=int, default=10, help="new processes started")
+    parser.add_argument("--path", default="/spec", help="path of the first request")
+    parser.add_argument("--max-import-seconds", type=float, default=None,
+                        help="fail (exit code 1) when the median import time is above it")
+    args = parser.parse_args()
+
+    runs = [measure_startup(args.path) for _ in range(args.runs)]
+    for step in ('import_seconds', 'create_app_seconds', 'first_request_seconds'):
+        values = [run[step] * 1000 for run in runs]
+        print(f"{step.replace('_seconds', '') + ':':<16}{statistics.median(values):.1f} ms median, {max(values):.1f} ms max")
+    total = statistics.median(sum(run[step] for step in ('import_seconds', 'create_app_seconds', 'first_request_seconds'))
+                              for run in runs)
+    loaded = sorted({name for run in runs for name in run['loaded_heavy_modules']})
+    print(f"{'first response:':<16}{total * 1000:.1f} ms median (status {runs[-1]['status_code']})")
+    print(f"{'heavy modules:':<16}{', '.join(loaded) or 'none'}")
+
+    failed = bool(loaded)
+    if args.max_import_seconds is not None:
+        median_import = statistics.median(run['import_seconds'] for run in runs)
+        if median_import > args.max_import_seconds:
+            print(f"import time {median_import:.3f} s above the budget of {args.max_import_seconds} s")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
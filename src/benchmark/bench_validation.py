@@ -0,0 +1,70 @@
+"""
+Benchmark of the vectorized data validation against the original per-row validation.
+
+Usage (from the repository root):
+    PYTHONPATH=src python -m benchmark.bench_validation --rows 2000
+"""
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+from validation.data_validation import validate_data, validate_data_by_row, employees_schema
+
+def build_employees_frame(rows: int, invalid_ratio: float = 0.05, seed: int = 42) -> pd.DataFrame:
+    """
+    Build a synthetic employees DataFrame as it looks after `cast_fields` in the ETL.
+
+    Args:
+        rows (int): Number of rows to generate.
+        invalid_ratio (float): Fraction of rows with a missing department (-1).
+        seed (int): Seed for the random generator.
+
+    Returns:
+        pd.DataFrame: A DataFrame with the employees schema columns.
+    """
+    rng = np.random.default_rng(seed)
+    hired = pd.Timestamp("2021-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s")
+    departments = rng.integers(1, 13, rows)
+    departments[rng.random(rows) < invalid_ratio] = -1
+    return pd.DataFrame({
+        "column1": np.arange(1, rows + 1),
+        "column2": [f"Employee {i}" for i in range(rows)],
+        "column3": hired.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "column4": departments,
+        "column5": rng.integers(1, 184, rows),
+    })
+
+def time_validation(function, df_data: pd.DataFrame):
+    """
+    Run a validation function and measure its wall time.
+
+    Returns:
+        tuple: Elapsed seconds and the (valid, invalid) result.
+    """
+    start = time.perf_counter()
+    result = function(df_data, employees_schema)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-row vs vectorized validation")
+    parser.add_argument("--rows", type=int, default=2000, help="rows of the synthetic employees file")
+    args = parser.parse_args()
+
+    # Keep the validation summary out of the benchmark output
+    logging.getLogger("validation.data_validation").setLevel(logging.WARNING)
+    df_data = build_employees_frame(args.rows)
+
+    row_seconds, (row_valid, row_invalid) = time_validation(validate_data_by_row, df_data)
+    vector_seconds, (vector_valid, vector_invalid) = time_validation(validate_data, df_data)
+
+    same_split = (row_valid.index.equals(vector_valid.index)
+                  and row_invalid.index.equals(vector_invalid.index))
+    print(f"rows:           {args.rows}")
+    print(f"per-row:        {row_seconds:.3f} s ({args.rows / row_seconds:,.0f} rows/s)")
+    print(f"vectorized:     {vector_seconds:.3f} s ({args.rows / vector_seconds:,.0f} rows/s)")
+    print(f"speedup:        {row_seconds / vector_seconds:,.1f}x")
+    print(f"same split:     {same_split}")
+
+if __name__ == "__main__":
+    main()
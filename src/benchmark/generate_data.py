@@ -0,0 +1,168 @@
+"""
+Generator of synthetic jobs, departments and employees CSV files at any scale.
+
+The employees are spread over the departments and jobs with a Zipf-like skew
+(0 is uniform, the larger the skew the more hires go to the first ones), their
+hire datetimes over a range of years, and a fraction of them is invalid (missing
+name or datetime; the id columns stay complete, a blank id would turn the whole
+column into floats and `validate_data` would reject every row of the file).
+The employees are written by chunks, so 10M rows do not need 10M rows in memory.
+
+Usage (from the repository root):
+    PYTHONPATH=src python -m benchmark.generate_data --employees 1000000 --skew 1.1 --output-dir data/1m
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = ['Alice', 'Bruno', 'Camila', 'Diego', 'Elena', 'Facundo', 'Gabriela', 'Hugo', 'Isabel', 'Julian',
+               'Karina', 'Lucas', 'Martina', 'Nicolas', 'Olivia', 'Pablo', 'Renata', 'Santiago', 'Valentina', 'Tomas']
+LAST_NAMES = ['Garcia', 'Rodriguez', 'Gonzalez', 'Fernandez', 'Lopez', 'Martinez', 'Sanchez', 'Perez', 'Gomez',
+              'Diaz', 'Romero', 'Alvarez', 'Torres', 'Ruiz', 'Flores', 'Acosta', 'Medina', 'Herrera', 'Silva', 'Castro']
+DEPARTMENTS = ['Product Management', 'Sales', 'Research and Development', 'Business Development', 'Engineering',
+               'Human Resources', 'Services', 'Support', 'Marketing', 'Training', 'Legal', 'Accounting']
+JOB_LEVELS = ['Junior', 'Senior', 'Staff', 'Principal', 'Lead', 'Associate', 'Assistant', 'Chief']
+JOB_ROLES = ['Software Engineer', 'Data Analyst', 'Accountant', 'Recruiter', 'Designer', 'Sales Representative',
+             'Support Engineer', 'Product Manager', 'Marketing Specialist', 'Legal Counsel', 'Trainer',
+             'Business Analyst', 'Financial Analyst', 'QA Engineer', 'Database Administrator', 'Project Manager',
+             'Technical Writer', 'Web Developer', 'Systems Administrator', 'Research Scientist', 'Nurse',
+             'Operator', 'Auditor']
+
+def generate_jobs(count: int) -> pd.DataFrame:
+    """Jobs with ids 1..count, named as level and role."""
+    titles = [f"{level} {role}" for role in JOB_ROLES for level in JOB_LEVELS]
+    return pd.DataFrame({
+        'id': np.arange(1, count + 1),
+        'job': [titles[i] if i < len(titles) else f"Job {i + 1}" for i in range(count)],
+    })
+
+def generate_departments(count: int) -> pd.DataFrame:
+    """Departments with ids 1..count."""
+    return pd.DataFrame({
+        'id': np.arange(1, count + 1),
+        'department': [DEPARTMENTS[i] if i < len(DEPARTMENTS) else f"Department {i + 1}" for i in range(count)],
+    })
+
+def skewed_ids(rng, size: int, count: int, skew: float) -> np.ndarray:
+    """
+    Draw ids in 1..count, the id of rank k with a weight of 1 / k ** skew.
+
+    Args:
+        rng (Generator): Random generator.
+        size (int): Number of ids.
+        count (int): Number of distinct ids.
+        skew (float): Exponent of the weights, 0 draws them uniformly.
+
+    Returns:
+        np.ndarray: The ids.
+    """
+    if skew <= 0:
+        return rng.integers(1, count + 1, size)
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return rng.choice(count, size, p=weights / weights.sum()) + 1
+
+def iter_employee_chunks(rows: int, departments: int, jobs: int, skew: float = 0.0, invalid_ratio: float = 0.02,
+                         start_year: int = 2020, end_year: int = 2022, seed: int = 42, chunk_rows: int = 500000):
+    """
+    Generate the employees by chunks, with ids 1..rows.
+
+    Args:
+        rows (int): Number of employees.
+        departments (int): Number of departments.
+        jobs (int): Number of jobs.
+        skew (float): Skew of the departments and jobs, see `skewed_ids`.
+        invalid_ratio (float): Fraction of employees with a missing name or datetime.
+        start_year (int): First year of the hire datetimes.
+        end_year (int): Last year of the hire datetimes.
+        seed (int): Seed for the random generator.
+        chunk_rows (int): Employees of each chunk.
+
+    Yields:
+        pd.DataFrame: A chunk with the columns id, name, datetime, department_id and job_id.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(f"{start_year}-01-01")
+    seconds = int((pd.Timestamp(f"{end_year + 1}-01-01") - start).total_seconds())
+    first_names = np.array(FIRST_NAMES, dtype=object)
+    last_names = np.array(LAST_NAMES, dtype=object)
+    for offset in range(0, rows, chunk_rows):
+        size = min(chunk_rows, rows - offset)
+        hired = start + pd.to_timedelta(rng.integers(0, seconds, size), unit="s")
+        df_chunk = pd.DataFrame({
+            'id': np.arange(offset + 1, offset + size + 1),
+            'name': first_names[rng.integers(0, len(FIRST_NAMES), size)] + ' ' +
+                    last_names[rng.integers(0, len(LAST_NAMES), size)],
+            'datetime': hired.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'department_id': skewed_ids(rng, size, departments, skew),
+            'job_id': skewed_ids(rng, size, jobs, skew),
+        })
+        # Invalid rows miss one of their values, written as an empty field
+        invalid = np.flatnonzero(rng.random(size) < invalid_ratio)
+        missing_column = rng.integers(0, 2, len(invalid))
+        for column_index, column in enumerate(['name', 'datetime']):
+            df_chunk.loc[invalid[missing_column == column_index], column] = None
+        yield df_chunk
+
+def write_dataset(output_dir: str, employees: int, departments: int = 12, jobs: int = 183, skew: float = 0.0,
+                  invalid_ratio: float = 0.02, start_year: int = 2020, end_year: int = 2022, seed: int = 42,
+                  header: bool = True) -> dict:
+    """
+    Write jobs.csv, departments.csv and hired_employees.csv to a folder.
+
+    Args:
+        output_dir (str): Folder of the files, created if needed.
+        employees (int): Number of employees.
+        departments (int): Number of departments.
+        jobs (int): Number of jobs.
+        skew (float): Skew of the departments and jobs of the employees.
+        invalid_ratio (float): Fraction of invalid employees.
+        start_year (int): First year of the hire datetimes.
+        end_year (int): Last year of the hire datetimes.
+        seed (int): Seed for the random generator.
+        header (bool): Write the header line, as the API uploads expect (the ETL source files have none).
+
+    Returns:
+        dict: The path and the rows of every file, by file type.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = {
+        'job': os.path.join(output_dir, 'jobs.csv'),
+        'department': os.path.join(output_dir, 'departments.csv'),
+        'employee': os.path.join(output_dir, 'hired_employees.csv'),
+    }
+    generate_jobs(jobs).to_csv(files['job'], index=False, header=header)
+    generate_departments(departments).to_csv(files['department'], index=False, header=header)
+    with open(files['employee'], 'w', newline='') as employees_file:
+        chunks = iter_employee_chunks(employees, departments, jobs, skew, invalid_ratio, start_year, end_year, seed)
+        for index, df_chunk in enumerate(chunks):
+            df_chunk.to_csv(employees_file, index=False, header=header and index == 0)
+    rows = {'job': jobs, 'department': departments, 'employee': employees}
+    return {file_type: {'path': path, 'rows': rows[file_type]} for file_type, path in files.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic jobs, departments and employees files")
+    parser.add_argument("--employees", type=int, default=1000000)
+    parser.add_argument("--departments", type=int, default=12)
+    parser.add_argument("--jobs", type=int, default=183)
+    parser.add_argument("--skew", type=float, default=0.0,
+                        help="Zipf exponent of the departments and jobs of the employees, 0 is uniform")
+    parser.add_argument("--invalid-ratio", type=float, default=0.02, help="fraction of employees with a missing value")
+    parser.add_argument("--start-year", type=int, default=2020)
+    parser.add_argument("--end-year", type=int, default=2022)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-header", action="store_true", help="write the files without header, as the ETL sources")
+    parser.add_argument("--output-dir", default="data")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    files = write_dataset(args.output_dir, args.employees, args.departments, args.jobs, args.skew,
+                          args.invalid_ratio, args.start_year, args.end_year, args.seed, header=not args.no_header)
+    for file_type, entry in files.items():
+        print(f"{file_type + ':':<12}{entry['rows']:>12,} rows  {entry['path']} "
+              f"({os.path.getsize(entry['path']) / 1024 / 1024:.1f} MB)")
+    print(f"{'seconds:':<12}{time.perf_counter() - start:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+HTTP load test of a running API (gunicorn or the Flask dev server).
+
+It gets a token from /login and sends a weighted mix of report and upload
+requests, either from `--concurrency` workers that send their next request as
+soon as the previous one is answered (closed model) or at a fixed `--rate` of
+requests per second (open model, the latency counts from the scheduled time, so
+the requests queued behind slow ones are not hidden). It reports the throughput,
+the p50/p95/p99 latency and the errors of every route, and fails (exit code 1)
+above the `--max-p99-ms` or `--max-error-rate` budgets.
+
+Every upload sends new employees (ids from `--upload-id-start` on), so repeated
+uploads do not collide on the primary key; `--upload-file` sends a fixed file instead.
+
+Usage (from the repository root):
+    PYTHONPATH=src python -m benchmark.load_test --url http://localhost:5000 \
+        --mix by_quarter=70,hired_above_mean=25,upload=5 --concurrency 16 --duration 60
+    PYTHONPATH=src python -m benchmark.load_test --rate 200 --duration 60 --output load.json
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmark.generate_data import iter_employee_chunks
+
+ROUTES = {
+    'by_quarter': '/employees/by_quarter',
+    'hired_above_mean': '/departments/hired_above_mean',
+    'upload': '/employees/upload',
+}
+# The tokens of /login expire after 30 minutes
+TOKEN_REFRESH_SECONDS = 25 * 60
+
+def parse_mix(text):
+    """
+    Parse a route mix such as by_quarter=70,hired_above_mean=25,upload=5.
+
+    Returns:
+        dict: The weight of every route.
+    """
+    mix = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route {name}, expected one of {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("The mix needs at least one route with a positive weight")
+    return mix
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class TokenProvider:
+    """Bearer token of /login, renewed before it expires."""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self._token = None
+        self._created_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._token is None or time.monotonic() - self._created_at > TOKEN_REFRESH_SECONDS:
+                response = requests.get(f"{self.base_url}/login", auth=(self.username, self.password), timeout=30)
+                response.raise_for_status()
+                self._token = response.json()['token']
+                self._created_at = time.monotonic()
+            return self._token
+
+class UploadFactory:
+    """
+    Body of the upload requests: new employees on every call, or a fixed file.
+
+    Args:
+        rows (int): Employees of every generated file.
+        id_start (int): First id of the generated employees.
+        path (str): File sent by every upload instead of generated ones.
+    """
+
+    def __init__(self, rows=1000, id_start=10000000, path=None):
+        self.rows = rows
+        self.path = path
+        self._next_id = itertools.count(id_start, rows)
+        self._lock = threading.Lock()
+
+    def build(self):
+        """
+        Returns:
+            tuple: The file name and the CSV content.
+        """
+        if self.path:
+            with open(self.path, 'rb') as upload_file:
+                return os.path.basename(self.path), upload_file.read()
+        with self._lock:
+            first_id = next(self._next_id)
+        df_data = next(iter_employee_chunks(self.rows, 12, 183, invalid_ratio=0, seed=first_id, chunk_rows=self.rows))
+        df_data['id'] += first_id - 1
+        return f"load_test_{first_id}.csv", df_data.to_csv(index=False).encode()
+
+class LoadTest:
+    """
+    Send the requests of a route mix and keep their latencies and errors.
+
+    Args:
+        base_url (str): URL of the API.
+        mix (dict): Weight of every route.
+        tokens (TokenProvider): Source of the bearer token.
+        uploads (UploadFactory): Source of the upload files.
+        year (int): Year of the reports.
+        per_page (int): Page size of the reports.
+        pages (int): Reports ask for a random page among the first `pages`.
+        timeout (float): Seconds before a request is counted as an error.
+        seed (int): Seed of the route and page choices.
+    """
+
+    def __init__(self, base_url, mix, tokens, uploads, year=2021, per_page=50, pages=1, timeout=30, seed=42):
+        self.base_url = base_url.rstrip('/')
+        self.routes = list(mix)
+        self.weights = [mix[name] for name in self.routes]
+        self.tokens = tokens
+        self.uploads = uploads
+        self.year = year
+        self.per_page = per_page
+        self.pages = pages
+        self.timeout = timeout
+        self.seed = seed
+        self.results = {name: {'latencies_ms': [], 'status_codes': {}, 'exceptions': 0} for name in self.routes}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _session(self):
+        # One session (and keep-alive connection) by worker thread
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            self._local.random = random.Random(f"{self.seed}-{threading.get_ident()}")
+        return self._local.session, self._local.random
+
+    def send(self, scheduled_at=None):
+        """
+        Send one request of the mix and record it.
+
+        Args:
+            scheduled_at (float): perf_counter time it was due (open model), the latency counts from it.
+        """
+        session, rng = self._session()
+        name = rng.choices(self.routes, self.weights)[0]
+        headers = {'Authorization': f'Bearer {self.tokens.get()}'}
+        if name == 'upload':
+            file_name, content = self.uploads.build()
+            request = dict(method='POST', files={'file': (file_name, content, 'text/csv')})
+        else:
+            params = {'year': self.year, 'per_page': self.per_page, 'page': rng.randint(1, self.pages)}
+            request = dict(method='GET', params=params)
+        start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        status_code = None
+        try:
+            response = session.request(url=f"{self.base_url}{ROUTES[name]}", headers=headers,
+                                       timeout=self.timeout, **request)
+            status_code = response.status_code
+        except requests.RequestException:
+            pass
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            result = self.results[name]
+            result['latencies_ms'].append(latency_ms)
+            if status_code is None:
+                result['exceptions'] += 1
+            else:
+                result['status_codes'][status_code] = result['status_codes'].get(status_code, 0) + 1
+
+    def run_closed(self, concurrency, duration, max_requests=None):
+        """`concurrency` workers send a request as soon as their previous one is answered."""
+        deadline = time.perf_counter() + duration
+        sent = itertools.count()
+
+        def worker():
+            while time.perf_counter() < deadline and (max_requests is None or next(sent) < max_requests):
+                self.send()
+
+        threads = [threading.Thread(target=worker, name=f"load-{index}") for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open(self, rate, duration, concurrency):
+        """Send `rate` requests per second whatever the latency, with at most `concurrency` in flight."""
+        interval = 1.0 / rate
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as executor:
+            for index in range(int(rate * duration)):
+                scheduled_at = start + index * interval
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.send, scheduled_at)
+
+    def summary(self, seconds):
+        """
+        Get the throughput, latency percentiles and errors of every route and of all of them.
+
+        Args:
+            seconds (float): Wall time of the test.
+
+        Returns:
+            dict: The results by route and the total.
+        """
+        def summarize(latencies, status_codes, exceptions):
+            latencies = sorted(latencies)
+            errors = exceptions + sum(count for code, count in status_codes.items() if code >= 400)
+            return {
+                'requests': len(latencies),
+                'throughput_rps': round(len(latencies) / seconds, 2) if seconds else None,
+                'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+                'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+                'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+                'max_ms': round(latencies[-1], 2) if latencies else None,
+                'errors': errors,
+                'error_rate': round(errors / len(latencies), 4) if latencies else 0.0,
+                'status_codes': {str(code): count for code, count in sorted(status_codes.items())},
+                'exceptions': exceptions,
+            }
+
+        with self._lock:
+            routes = {name: summarize(result['latencies_ms'], result['status_codes'], result['exceptions'])
+                      for name, result in self.results.items()}
+            all_codes = {}
+            for result in self.results.values():
+                for code, count in result['status_codes'].items():
+                    all_codes[code] = all_codes.get(code, 0) + count
+            total = summarize([latency for result in self.results.values() for latency in result['latencies_ms']],
+                              all_codes, sum(result['exceptions'] for result in self.results.values()))
+        return {'seconds': round(seconds, 3), 'routes': routes, 'total': total}
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with a mix of report and upload requests")
+    parser.add_argument("--url", default="http://localhost:5000", help="URL of the API")
+    parser.add_argument("--username", default="user1")
+    parser.add_argument("--password", default="password123")
+    parser.add_argument("--mix", default="by_quarter=70,hired_above_mean=25,upload=5",
+                        help=f"weights of the routes, among {', '.join(ROUTES)}")
+    parser.add_argument("--concurrency", type=int, default=8, help="workers, or requests in flight with --rate")
+    parser.add_argument("--rate", type=float, default=None, help="requests per second (open model)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of the test")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this number of requests (closed model)")
+    parser.add_argument("--year", type=int, default=2021)
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=1, help="reports ask for a random page among the first ones")
+    parser.add_argument("--upload-rows", type=int, default=1000, help="employees of every generated upload")
+    parser.add_argument("--upload-id-start", type=int, default=10000000, help="first id of the generated employees")
+    parser.add_argument("--upload-file", default=None, help="send this file on every upload")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="fail when the p99 of any route is above it")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="fail when the error rate is above it")
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    tokens = TokenProvider(args.url.rstrip('/'), args.username, args.password)
+    tokens.get()
+    load_test = LoadTest(args.url, mix, tokens, UploadFactory(args.upload_rows, args.upload_id_start, args.upload_file),
+                         year=args.year, per_page=args.per_page, pages=args.pages, timeout=args.timeout,
+                         seed=args.seed)
+    start = time.perf_counter()
+    if args.rate:
+        load_test.run_open(args.rate, args.duration, args.concurrency)
+    else:
+        load_test.run_closed(args.concurrency, args.duration, args.requests)
+    summary = load_test.summary(time.perf_counter() - start)
+    summary['parameters'] = {key: value for key, value in vars(args).items() if key != 'password'}
+
+    print(f"{'route':<18}{'requests':>9}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    for name, result in itertools.chain(summary['routes'].items(), [('total', summary['total'])]):
+        if not result['requests']:
+            continue
+        print(f"{name:<18}{result['requests']:>9}{result['throughput_rps']:>9.1f}{result['p50_ms']:>10.1f}"
+              f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['max_ms']:>10.1f}{result['errors']:>8}")
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as output_file:
+            json.dump(summary, output_file, indent=2)
+
+    failed = False
+    if args.max_p99_ms is not None:
+        for name, result in summary['routes'].items():
+            if result['p99_ms'] is not None and result['p99_ms'] > args.max_p99_ms:
+                print(f"p99 of {name} ({result['p99_ms']} ms) above the budget of {args.max_p99_ms} ms")
+                failed = True
+    if args.max_error_rate is not None and summary['total']['error_rate'] > args.max_error_rate:
+        print(f"error rate {summary['total']['error_rate']} above the budget of {args.max_error_rate}")
+        failed = True
+    raise SystemExit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,27 @@
 import configparser
+import os
+
+# Settings file, relative to the working directory (the repository root) unless it is absolute
+CONFIG_FILE = os.environ.get("DATACHALLENGE_CONFIG", "src/config.ini")
 
 class Config:
     general_config = None
     database_config = None
     jwt_config = None
+    upload_config = None
+    report_cache_config = None
+    backup_config = None
+    server_config = None
+    metrics_config = None
+    profiling_config = None
+    etl_config = None
 
     def __init__(self):
         self.load_ini_config()
 
     def load_ini_config(self):
         _config = configparser.ConfigParser()
-        _config.read("src/config.ini")
+        _config.read(CONFIG_FILE)
 
         self.general_config = {
             "PROJECT_NAME": _config.get("general", "project_name"),
@@ -23,12 +34,109 @@ class Config:
             "DATABASE_PORT": int(_config.get("database", "port")),
             "DATABASE_USER": _config.get("database", "user"),
             "DATABASE_PASSWORD": _config.get("database", "password"),
-            "DATABASE_NAME": _config.get("database", "name")
+            "DATABASE_NAME": _config.get("database", "name"),
+            # Connection pool shared by the API and the scripts
+            "POOL_SIZE": _config.getint("database", "pool_size", fallback=5),
+            "MAX_OVERFLOW": _config.getint("database", "max_overflow", fallback=10),
+            "POOL_TIMEOUT": _config.getint("database", "pool_timeout", fallback=30),
+            "POOL_PRE_PING": _config.getboolean("database", "pool_pre_ping", fallback=True),
+            # Seconds before a connection is replaced, -1 keeps them open
+            "POOL_RECYCLE": _config.getint("database", "pool_recycle", fallback=1800),
+            # PostgreSQL statement_timeout of every connection, 0 disables it
+            "STATEMENT_TIMEOUT_MS": _config.getint("database", "statement_timeout_ms", fallback=0),
+            # Seconds to open a PostgreSQL connection before failing, 0 waits for the TCP timeout
+            "CONNECT_TIMEOUT": _config.getint("database", "connect_timeout", fallback=5),
+            # Checkouts that wait longer are counted and logged as slow
+            "SLOW_CHECKOUT_MS": _config.getint("database", "slow_checkout_ms", fallback=100),
+            # Read replicas of the reports and backups (comma separated URIs), empty reads from the primary
+            "REPLICA_URLS": [url.strip() for url in _config.get("database", "replica_urls", fallback="").split(",")
+                             if url.strip()],
+            # Seconds a replica health check is trusted, and the replication lag above which it is skipped
+            "REPLICA_CHECK_SECONDS": _config.getint("database", "replica_check_seconds", fallback=30),
+            "REPLICA_MAX_LAG_SECONDS": _config.getint("database", "replica_max_lag_seconds", fallback=30),
         }
 
         self.jwt_config = {
             "JWT_SECRET_KEY": _config.get("jwt", "secret_key"),
         }
 
+        self.upload_config = {
+            # Rows read, validated and inserted at once, 0 loads the whole file
+            "CHUNK_SIZE": _config.getint("upload", "chunk_size", fallback=0),
+            # Background upload jobs (async uploads)
+            "JOB_CHUNK_SIZE": _config.getint("upload", "job_chunk_size", fallback=50000),
+            "JOB_WORKERS": _config.getint("upload", "job_workers", fallback=2),
+            "JOB_MAX_PENDING": _config.getint("upload", "job_max_pending", fallback=10),
+            "SPOOL_DIR": _config.get("upload", "spool_dir", fallback=""),
+            # Where the job status is kept: database (any gunicorn worker answers it) or memory
+            "JOB_REGISTRY": _config.get("upload", "job_registry", fallback="database"),
+        }
+
+        self.report_cache_config = {
+            "ENABLED": _config.getboolean("report_cache", "enabled", fallback=True),
+            "MAX_ENTRIES": _config.getint("report_cache", "max_entries", fallback=256),
+            "TTL_SECONDS": _config.getint("report_cache", "ttl_seconds", fallback=300),
+            # Keep the serialized JSON response, repeated hits skip jsonify
+            "CACHE_JSON": _config.getboolean("report_cache", "cache_json", fallback=True),
+            # Where the data version is kept: database (shared by the API workers and the ETL) or memory
+            "VERSION_STORE": _config.get("report_cache", "version_store", fallback="database"),
+        }
+
+        self.backup_config = {
+            # Rows fetched from the database on each round trip
+            "FETCH_SIZE": _config.getint("backup", "fetch_size", fallback=10000),
+            # Avro block compression: null or deflate
+            "CODEC": _config.get("backup", "codec", fallback="deflate"),
+            # Size of the parts of the S3 multipart upload (minimum 5 MB)
+            "PART_SIZE_MB": _config.getint("backup", "part_size_mb", fallback=8),
+            # Processes that decode the Avro blocks of a restore, 0 decodes them in the API process
+            "RESTORE_PROCESSES": _config.getint("backup", "restore_processes", fallback=0),
+            # Rows of each row group of the Parquet backups
+            "ROW_GROUP_SIZE": _config.getint("backup", "row_group_size", fallback=100000),
+        }
+
+        self.server_config = {
+            "BIND": _config.get("server", "bind", fallback="0.0.0.0:5000"),
+            # Worker processes of gunicorn, 0 uses 2 * CPUs + 1
+            "WORKERS": _config.getint("server", "workers", fallback=0),
+            # Threads of every worker (gthread worker class)
+            "THREADS": _config.getint("server", "threads", fallback=4),
+            "TIMEOUT": _config.getint("server", "timeout", fallback=120),
+        }
+
+        self.metrics_config = {
+            # Timers and counters of the requests and their phases, exposed at /metrics
+            "ENABLED": _config.getboolean("metrics", "enabled", fallback=True),
+            # Upper bounds (seconds) of the buckets of the latency histograms
+            "BUCKETS": [float(bound) for bound in _config.get(
+                "metrics", "buckets", fallback="0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,300").split(",")
+                if bound.strip()],
+            # Directory where every gunicorn worker writes its metrics for /metrics to add them up,
+            # empty keeps them in the process (gunicorn.conf.py sets one when it is empty)
+            "MULTIPROCESS_DIR": _config.get("metrics", "multiprocess_dir", fallback=""),
+            # Seconds between the writes of the metrics of a process to its file
+            "FLUSH_SECONDS": _config.getfloat("metrics", "flush_seconds", fallback=1),
+        }
+
+        self.profiling_config = {
+            # Latency and rows of every SQL statement, see /admin/queries (off by default)
+            "ENABLED": _config.getboolean("profiling", "enabled", fallback=False),
+            # Statements that take longer are logged
+            "SLOW_QUERY_MS": _config.getint("profiling", "slow_query_ms", fallback=500),
+            # Capture the plan of the slow SELECT statements, EXPLAIN ANALYZE runs them again
+            "EXPLAIN_SLOW": _config.getboolean("profiling", "explain_slow", fallback=False),
+            # Distinct statements kept, the next ones are added up together
+            "MAX_STATEMENTS": _config.getint("profiling", "max_statements", fallback=200),
+        }
+
+        self.etl_config = {
+            # Processes that parse, cast and validate the files, 0 uses one per file (up to the CPUs)
+            "VALIDATE_PROCESSES": _config.getint("etl", "validate_processes", fallback=0),
+            # Files are split in shards of about this size, parsed and loaded in parallel, 0 disables it
+            "SHARD_MB": _config.getint("etl", "shard_mb", fallback=64),
+            # Shards loaded at the same time, each on its own connection of the engine pool
+            "LOAD_CONNECTIONS": _config.getint("etl", "load_connections", fallback=4),
+        }
+
 # Create a global instance of the Config class
 config = Config()
\ No newline at end of file
@@ -1,22 +1,219 @@
 from abc import ABC, abstractmethod
+import csv
+import io
+import time
+from sqlalchemy import insert, select
+from service.sqlalchemy.profiling import get_query_profiler
+
+# Text used by COPY to tell a NULL value apart from an empty string
+COPY_NULL = r'\N'
 
 class Creator(ABC):
     """
     The Creator class declares the factory method that is supposed to return an
     object of a Product class. The Creator's subclasses usually provide the
     implementation of this method.
+
+    Besides the ORM insert, it provides a bulk load mode shared by every table:
+    the rows are streamed with PostgreSQL COPY or, for other dialects, with a
+    batched executemany. The subclasses only declare `model` and `columns`.
     """
+    # ORM model of the table and its columns, in the same order as the file
+    model = None
+    columns = []
+    # Number of rows sent to the database on each COPY/executemany call
+    batch_size = 10000
 
     @abstractmethod
     def factory_orm_insert_data(self):
         """
-        Method definition to implement insert data 
+        Method definition to implement insert data
         """
         pass
-    
+
     @abstractmethod
     def get_all_data(self):
         """
-        Method definition to implement select data 
+        Method definition to implement select data
         """
         pass
+
+    def insert_data(self, df_data, headers=False, use_orm=False):
+        """
+        Insert a DataFrame in the table, using the bulk load unless the ORM is requested.
+
+        Args:
+            df_data (pd.DataFrame): The validated data to insert.
+            headers (bool): True if the columns are named as the model (id, job, ...),
+                            False if they are named column1, column2, ...
+            use_orm (bool): Use the ORM insert (`factory_orm_insert_data`) instead of the bulk load.
+        """
+        if use_orm:
+            self.factory_orm_insert_data(df_data, headers=headers)
+        else:
+            self.bulk_insert_data(df_data, headers=headers)
+
+    def iter_all_data(self, batch_size=None, after_id=None):
+        """
+        Stream every row of the table ordered by its primary key.
+
+        The rows are fetched `batch_size` at a time (yield_per), with a server-side
+        cursor on PostgreSQL, so the table is never loaded in memory at once.
+
+        Args:
+            batch_size (int): Rows fetched on each round trip, `batch_size` of the class by default.
+            after_id (int): Only the rows with a greater id (incremental backups).
+
+        Yields:
+            Row: A row with the table columns as attributes.
+        """
+        table = self.model.__table__
+        statement = select(table).order_by(*table.primary_key.columns)
+        if after_id is not None:
+            statement = statement.where(table.c.id > after_id)
+        yield from self.conn.execute(statement, execution_options={'yield_per': batch_size or self.batch_size})
+
+    def get_records_frame(self, df_data, headers=False):
+        """
+        Select the table columns from a DataFrame and name them as the model.
+
+        Args:
+            df_data (pd.DataFrame): The data to insert.
+            headers (bool): True if the columns are already named as the model.
+
+        Returns:
+            pd.DataFrame: The data with the model column names, in the table order.
+        """
+        if headers:
+            return df_data[self.columns]
+        df_records = df_data[[f"column{i+1}" for i in range(len(self.columns))]]
+        df_records.columns = self.columns
+        return df_records
+
+    def iter_row_batches(self, df_records):
+        """
+        Split a DataFrame into batches of tuples with python values (NaN as None).
+
+        Args:
+            df_records (pd.DataFrame): The data with the model column names.
+
+        Yields:
+            list: A list of row tuples with at most `batch_size` rows.
+        """
+        for start in range(0, len(df_records.index), self.batch_size):
+            df_batch = df_records.iloc[start:start + self.batch_size].astype(object)
+            df_batch = df_batch.where(df_batch.notna(), None)
+            yield list(df_batch.itertuples(index=False, name=None))
+
+    def bulk_insert_data(self, df_data, headers=False):
+        """
+        Insert a DataFrame in the table with the bulk load and commit once.
+
+        Args:
+            df_data (pd.DataFrame): The validated data to insert.
+            headers (bool): True if the columns are named as the model (id, job, ...).
+
+        Returns:
+            int: The number of inserted rows.
+        """
+        df_records = self.get_records_frame(df_data, headers=headers)
+        inserted = self.bulk_insert_rows(self.iter_row_batches(df_records))
+        self.conn.commit()
+        return inserted
+
+    def load_rows(self, row_batches):
+        """
+        Insert batches of rows with the bulk load and commit once.
+
+        Args:
+            row_batches (iterable): Lists of row tuples following `columns` order,
+                                    consumed as they are loaded.
+
+        Returns:
+            int: The number of inserted rows.
+        """
+        inserted = self.bulk_insert_rows(row_batches)
+        self.conn.commit()
+        return inserted
+
+    def parse_text_values(self, rows):
+        """
+        Convert the text values of rows read from a file (e.g. ISO datetimes) to python values.
+
+        COPY parses the text itself, this is only needed by the executemany load.
+
+        Args:
+            rows (list): Row tuples following `columns` order.
+
+        Returns:
+            list: The rows ready for executemany.
+        """
+        return rows
+
+    def bulk_insert_rows(self, row_batches):
+        """
+        Load batches of rows in the table inside the current transaction.
+
+        PostgreSQL (psycopg2) connections stream each batch with COPY FROM STDIN,
+        any other dialect falls back to a batched executemany.
+
+        Args:
+            row_batches (iterable): Lists of row tuples following `columns` order.
+
+        Returns:
+            int: The number of inserted rows.
+        """
+        connection = self.conn.connection()
+        row_batches = self._notify_inserted_rows(row_batches)
+        if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+            return self._copy_rows(connection, row_batches)
+        return self._executemany_rows(connection, row_batches)
+
+    def after_insert_rows(self, rows):
+        """
+        Hook called inside the insert transaction after every batch of rows is loaded.
+
+        Args:
+            rows (list): The inserted row tuples, following `columns` order.
+        """
+        pass
+
+    def _notify_inserted_rows(self, row_batches):
+        for batch in row_batches:
+            yield batch
+            # The consumer asks for the next batch once this one is loaded
+            self.after_insert_rows(batch)
+
+    def _copy_rows(self, connection, row_batches):
+        table = self.model.__table__
+        preparer = connection.dialect.identifier_preparer
+        column_names = ", ".join(preparer.quote(column) for column in self.columns)
+        copy_sql = (f"COPY {preparer.format_table(table)} ({column_names}) "
+                    f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')")
+        cursor = connection.connection.driver_connection.cursor()
+        # COPY runs on the driver cursor, without the cursor events of the profiler
+        profiler = get_query_profiler()
+        inserted = 0
+        try:
+            for batch in row_batches:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator="\n")
+                writer.writerows(tuple(COPY_NULL if value is None else value for value in row) for row in batch)
+                buffer.seek(0)
+                start = time.perf_counter()
+                cursor.copy_expert(copy_sql, buffer)
+                if profiler is not None:
+                    profiler.observe(copy_sql, (time.perf_counter() - start) * 1000, len(batch))
+                inserted += len(batch)
+        finally:
+            cursor.close()
+        return inserted
+
+    def _executemany_rows(self, connection, row_batches):
+        statement = insert(self.model.__table__)
+        inserted = 0
+        for batch in row_batches:
+            if batch:
+                connection.execute(statement, [dict(zip(self.columns, row)) for row in self.parse_text_values(batch)])
+                inserted += len(batch)
+        return inserted
@@ -1,9 +1,10 @@
 from dao.creator import Creator
 from model.deparment import Department
 class Departments_Db_Creator(Creator):
+    model = Department
+    columns = ['id', 'department']
 
     def __init__(self, conn):
-        print("Initialize the new instance for departments")
         self.conn = conn
 
     def factory_orm_insert_data(self, df_data, headers=False):
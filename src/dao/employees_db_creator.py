@@ -1,23 +1,75 @@
 from dao.creator import Creator
 from model.employee import Employee
+from dao.hiring_summary_db import Hiring_Summary_Db
+from util.transversal import parse_datetime_column, parse_datetime_value
+from util.lazy_import import lazy_import
+from sqlalchemy import select
+pd = lazy_import("pandas")
 class Employees_Db_Creator(Creator):
+    model = Employee
+    columns = ['id', 'name', 'datetime', 'department_id', 'job_id']
 
-    def __init__(self, conn):
-        print("Initialize the new instance for employees")
+    def __init__(self, conn, update_summary=True):
         self.conn = conn
+        # Without it the caller adds the hires to the summary itself (see main_etl_process)
+        self.update_summary = update_summary
 
     def factory_orm_insert_data(self, df_data, headers=False):
+        # Parse the hire datetime of the whole file at once
+        datetime_column = 'datetime' if headers else 'column3'
+        df_data = df_data.assign(**{datetime_column: parse_datetime_column(df_data[datetime_column])})
         # Add data file to the database
         for _, row in df_data.iterrows():
+            # Employees without hire datetime (e.g. of a backup) are stored with NULL
+            hire_datetime = None if pd.isna(row[datetime_column]) else row[datetime_column]
             if headers:
-                new_employee = Employee(id=row['id'], name=row['name'], datetime=row['datetime'],
+                new_employee = Employee(id=row['id'], name=row['name'], datetime=hire_datetime,
                                    department_id=row['department_id'], job_id=row['job_id'])
             else:
-                new_employee = Employee(id=row['column1'], name=row['column2'], datetime=row['column3'],
+                new_employee = Employee(id=row['column1'], name=row['column2'], datetime=hire_datetime,
                                    department_id=row['column4'], job_id=row['column5'])
             self.conn.add(new_employee)
+        df_records = self.get_records_frame(df_data, headers=headers)
+        self.after_insert_rows(list(df_records.itertuples(index=False, name=None)))
         self.conn.commit()
     
+    def get_records_frame(self, df_data, headers=False):
+        # The hire datetime is stored as timestamptz, parsed once for the whole frame
+        df_records = super().get_records_frame(df_data, headers=headers)
+        return df_records.assign(datetime=parse_datetime_column(df_records['datetime']))
+
+    def parse_text_values(self, rows):
+        # Hire datetimes read from a file are ISO 8601 strings
+        datetime_index = self.columns.index('datetime')
+        return [
+            row[:datetime_index] + (parse_datetime_value(row[datetime_index]),) + row[datetime_index + 1:]
+            if isinstance(row[datetime_index], str) else row
+            for row in rows
+        ]
+
+    def after_insert_rows(self, rows):
+        # Keep the hiring summary of the reports in the same transaction
+        if self.update_summary:
+            Hiring_Summary_Db(self.conn).increment_data(pd.DataFrame(rows, columns=self.columns))
+
+    def iter_data_by_hire_year(self, batch_size=None):
+        """
+        Stream the employees ordered by hire year (UTC), department and id.
+
+        Args:
+            batch_size (int): Rows fetched on each round trip, `batch_size` of the class by default.
+
+        Yields:
+            Row: A row with the table columns and the `hire_year` (None without datetime).
+        """
+        hire_year, _ = Hiring_Summary_Db(self.conn).get_hire_period()
+        table = self.model.__table__
+        statement = (
+            select(table, hire_year.label('hire_year'))
+            .order_by(hire_year.is_(None), hire_year, table.c.department_id, table.c.id)
+        )
+        yield from self.conn.execute(statement, execution_options={'yield_per': batch_size or self.batch_size})
+
     def get_all_data(self):
         employees_data = self.conn.query(Employee).all()
         return employees_data
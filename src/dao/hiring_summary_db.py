@@ -0,0 +1,154 @@
+from model.employee import Employee
+from model.hiring_summary import HiringSummary
+from util.transversal import parse_datetime_column
+from dao.queries_db_reports import hired_in_year
+from sqlalchemy import select, delete, func, cast, extract, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+SUMMARY_KEYS = ['year', 'quarter', 'department_id', 'job_id']
+
+class Hiring_Summary_Db():
+    """
+    Maintains the hiring summary (hires by year, quarter, department and job) used by the reports.
+
+    The loads of employees increment it with `increment_data` in the same transaction
+    as the insert, `rebuild` recomputes it from the employees table and
+    `check_consistency` compares both.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @staticmethod
+    def get_summary_frame(df_employees):
+        """
+        Count the hires of a DataFrame of employees by year, quarter, department and job.
+
+        Args:
+            df_employees (pd.DataFrame): Employees with the model column names (datetime, department_id, job_id).
+
+        Returns:
+            pd.DataFrame: The summary keys and the `hired` count.
+        """
+        hire_time = parse_datetime_column(df_employees['datetime'])
+        df_keys = df_employees[['department_id', 'job_id']].assign(
+            year=hire_time.dt.year, quarter=hire_time.dt.quarter).dropna()
+        return (df_keys.astype(int)
+                .groupby(SUMMARY_KEYS).size()
+                .rename('hired').reset_index())
+
+    def get_dialect_name(self):
+        return self.conn.get_bind().dialect.name
+
+    def increment_data(self, df_employees):
+        """
+        Add the hires of new employees to the summary, without committing.
+
+        Args:
+            df_employees (pd.DataFrame): The inserted employees with the model column names.
+
+        Returns:
+            int: Number of summary rows inserted or updated.
+        """
+        records = self.get_summary_frame(df_employees).to_dict('records')
+        if not records:
+            return 0
+        # Upsert with ON CONFLICT, SQLite is only used by the tests
+        dialect_insert = sqlite.insert if self.get_dialect_name() == 'sqlite' else postgresql.insert
+        statement = dialect_insert(HiringSummary.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=SUMMARY_KEYS,
+            set_={'hired': HiringSummary.__table__.c.hired + statement.excluded.hired}
+        )
+        self.conn.execute(statement, records)
+        return len(records)
+
+    def get_hire_period(self):
+        """
+        Build the SQL expressions of the hire year and quarter (in UTC) of the employees.
+
+        Returns:
+            tuple: The year and the quarter expressions.
+        """
+        hire_time = Employee.datetime
+        if self.get_dialect_name() == 'postgresql':
+            # Years and quarters are always taken in UTC, whatever the session time zone
+            hire_time = func.timezone('UTC', Employee.datetime)
+        year = cast(extract('year', hire_time), Integer)
+        quarter = (cast(extract('month', hire_time), Integer) - 1) // 3 + 1
+        return year, quarter
+
+    def get_employees_summary_query(self, param_year=None):
+        """
+        Select the hiring summary computed from the employees table.
+
+        Args:
+            param_year (int): Only compute the hires of this year (all years by default).
+
+        Returns:
+            Select: year, quarter, department_id, job_id and hired of every group.
+        """
+        year, quarter = self.get_hire_period()
+        query = (
+            select(year.label('year'), quarter.label('quarter'),
+                   Employee.department_id, Employee.job_id, func.count().label('hired'))
+            .where(Employee.datetime.is_not(None),
+                   Employee.department_id.is_not(None),
+                   Employee.job_id.is_not(None))
+            .group_by(year, quarter, Employee.department_id, Employee.job_id)
+        )
+        if param_year is not None:
+            query = query.where(hired_in_year(param_year))
+        return query
+
+    def clear(self):
+        """Remove every row of the summary, without committing."""
+        self.conn.execute(delete(HiringSummary))
+
+    def rebuild(self):
+        """
+        Recompute the whole summary from the employees table and commit.
+
+        Returns:
+            int: Number of rows in the summary.
+        """
+        self.clear()
+        summary_query = self.get_employees_summary_query()
+        self.conn.execute(
+            HiringSummary.__table__.insert().from_select(SUMMARY_KEYS + ['hired'], summary_query))
+        self.conn.commit()
+        rows = self.conn.execute(select(func.count()).select_from(HiringSummary)).scalar()
+        logger.info(f"Hiring summary rebuilt with {rows} rows")
+        return rows
+
+    def check_consistency(self, param_year=None):
+        """
+        Compare the summary with the counts computed from the employees table.
+
+        Args:
+            param_year (int): Only compare this year (all years by default).
+
+        Returns:
+            list: The differences as dictionaries with the keys, the `expected`
+                  count (employees table) and the `stored` count (summary).
+        """
+        summary_query = select(HiringSummary.year, HiringSummary.quarter, HiringSummary.department_id,
+                               HiringSummary.job_id, HiringSummary.hired)
+        if param_year is not None:
+            summary_query = summary_query.where(HiringSummary.year == int(param_year))
+        expected = {tuple(row[:4]): row[4] for row in self.conn.execute(self.get_employees_summary_query(param_year))}
+        stored = {tuple(row[:4]): row[4] for row in self.conn.execute(summary_query)}
+        differences = []
+        for key in sorted(set(expected) | set(stored)):
+            if expected.get(key, 0) != stored.get(key, 0):
+                differences.append({**dict(zip(SUMMARY_KEYS, key)),
+                                    'expected': expected.get(key, 0), 'stored': stored.get(key, 0)})
+        return differences
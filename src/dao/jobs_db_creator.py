@@ -1,9 +1,10 @@
 from dao.creator import Creator
 from model.job import Job
 class Jobs_Db_Creator(Creator):
+    model = Job
+    columns = ['id', 'job']
 
     def __init__(self, conn):
-        print("Initialize the new instance for jobs")
         self.conn = conn
 
     def factory_orm_insert_data(self, df_data, headers=False):
@@ -1,63 +1,123 @@
 from model.employee import Employee
 from model.job import Job
 from model.deparment import Department
-from sqlalchemy import func, extract, DateTime
+from model.hiring_summary import HiringSummary
+from sqlalchemy import func, and_, or_, tuple_, cast, Integer
+from datetime import datetime, timezone
+
+def get_quarter_start(param_year, quarter):
+    """
+    Get the first instant (UTC) of a quarter, quarter 5 is the start of the next year.
+
+    Args:
+        param_year (int|str): The year.
+        quarter (int): The quarter number (1-5).
+
+    Returns:
+        datetime: Timezone aware datetime of the quarter start.
+    """
+    year = int(param_year) + (quarter - 1) // 4
+    month = 3 * ((quarter - 1) % 4) + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+def hired_between(start, end):
+    """Range predicate over the hire datetime, so the datetime index can be used."""
+    return and_(Employee.datetime >= start, Employee.datetime < end)
+
+def hired_in_year(param_year):
+    """Range predicate for the employees hired in a year."""
+    return hired_between(get_quarter_start(param_year, 1), get_quarter_start(param_year, 5))
+
+def hired_sum(*conditions):
+    """Sum of hires of the summary rows matching the conditions, as an integer (0 when none)."""
+    total = func.sum(HiringSummary.hired)
+    if conditions:
+        total = total.filter(*conditions)
+    return cast(func.coalesce(total, 0), Integer)
+
 class Queries_Db_Reports():
+    """
+    Report queries, answered from the hiring summary (hires by year, quarter,
+    department and job) that is maintained on every load of employees.
+    """
 
     def __init__(self, conn):
-        print("Initialize the new instance for miscelaneous queries")
         self.conn = conn
 
-    def get_employees_by_quarter(self, param_year):
+    def get_employees_by_quarter(self, param_year, after=None):
+        """
+        Hires of a year by department and job, divided by quarter.
+
+        Args:
+            param_year (int|str): The year.
+            after (tuple): Keyset of the last row already read (department, job),
+                           only the rows after it are selected.
+        """
         query = (
             self.conn.query(
                 Department.department.label('department'),
                 Job.job.label('job'),
-                func.count().filter(extract('quarter', Employee.datetime.cast(DateTime)) == 1).label('Q1'),
-                func.count().filter(extract('quarter', Employee.datetime.cast(DateTime)) == 2).label('Q2'),
-                func.count().filter(extract('quarter', Employee.datetime.cast(DateTime)) == 3).label('Q3'),
-                func.count().filter(extract('quarter', Employee.datetime.cast(DateTime)) == 4).label('Q4')
+                hired_sum(HiringSummary.quarter == 1).label('Q1'),
+                hired_sum(HiringSummary.quarter == 2).label('Q2'),
+                hired_sum(HiringSummary.quarter == 3).label('Q3'),
+                hired_sum(HiringSummary.quarter == 4).label('Q4')
             )
-            .join(Department, Employee.department_id == Department.id)
-            .join(Job, Employee.job_id == Job.id)
-            .filter(extract('year', Employee.datetime.cast(DateTime)) == param_year)
+            .select_from(HiringSummary)
+            .join(Department, HiringSummary.department_id == Department.id)
+            .join(Job, HiringSummary.job_id == Job.id)
+            .filter(HiringSummary.year == int(param_year))
             .group_by(Department.department, Job.job)
             .order_by(Department.department, Job.job)
             )
+        if after is not None:
+            query = query.filter(tuple_(Department.department, Job.job) > tuple_(*after))
         return query
     
-    def get_employee_count_by_department(self, param_year):
-        query = (
+    def get_departments_hired_above_mean(self, param_year, after=None):
+        """
+        Departments that hired more employees than the mean of a year, in a single statement.
+
+        The hires by department (CTE), their mean and the number of departments
+        above it (`total_items`, used by the pagination) are window functions over
+        the CTE, so the database answers the report in one round trip. The rows are
+        the same as the original two-step queries, kept as the reference of the
+        benchmark (see `benchmark/bench_reports.py`).
+
+        Args:
+            param_year (int|str): The year.
+            after (tuple): Keyset of the last row already read (hired, id),
+                           only the rows after it are selected.
+        """
+        department_hires = (
             self.conn.query(
-                Employee.department_id,
-                func.count(Employee.id).label('employee_count')
+                HiringSummary.department_id.label('department_id'),
+                hired_sum().label('hired')
             )
-            .filter(extract('year', Employee.datetime.cast(DateTime)) == param_year)  
-            .group_by(Employee.department_id)
-            .subquery()
+            .filter(HiringSummary.year == int(param_year))
+            .group_by(HiringSummary.department_id)
+            .cte('department_hires')
         )
-        return query
-
-    def get_employees_mean(self, param_year):
-        employee_counts_subquery = self.get_employee_count_by_department(param_year)
-        query = (
+        hires_with_mean = (
             self.conn.query(
-                func.avg(employee_counts_subquery.c.employee_count).label('mean_hired')
+                department_hires.c.department_id,
+                department_hires.c.hired,
+                func.avg(department_hires.c.hired).over().label('mean_hired')
             )
+            .subquery('hires_with_mean')
         )
-        return query
-    
-    def get_departments_above_mean(self, param_year, mean_hired):
         query = (
             self.conn.query(
                 Department.id,
                 Department.department,
-                func.count(Employee.id).label('hired')
+                hires_with_mean.c.hired,
+                func.count().over().label('total_items')
             )
-            .join(Employee, Department.id == Employee.department_id)
-            .filter(extract('year', Employee.datetime.cast(DateTime)) == param_year)
-            .group_by(Department.id, Department.department)
-            .having(func.count(Employee.id) > mean_hired)  # Step 3: Filter by mean
-            .order_by(func.count(Employee.id).desc())  # Step 4: Order by hired (descending)
+            .join(hires_with_mean, Department.id == hires_with_mean.c.department_id)
+            .filter(hires_with_mean.c.hired > hires_with_mean.c.mean_hired)
+            .order_by(hires_with_mean.c.hired.desc(), Department.id)
         )
-        return query
\ No newline at end of file
+        if after is not None:
+            last_hired, last_id = after
+            query = query.filter(or_(hires_with_mean.c.hired < last_hired,
+                                     and_(hires_with_mean.c.hired == last_hired, Department.id > last_id)))
+        return query
@@ -0,0 +1,47 @@
+"""
+Gunicorn settings of the API, read from the [server] section of src/config.ini.
+
+Run it from the repository root (the settings file path is relative to it):
+
+    gunicorn --config src/gunicorn.conf.py wsgi:app
+
+The app is created once in the master (preload_app) and every worker disposes
+the engines it inherited after the fork, so no connection is shared between
+processes. The state the workers share (report cache data version, upload job
+status) is kept in the database, see the [report_cache] and [upload] settings,
+and their metrics in the files of `multiprocess_dir` ([metrics] section), a
+directory of the temp dir when it is not set.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+
+# The API modules are imported as top level modules (config, service, dao...)
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, pythonpath)
+
+# Not named config, gunicorn reads every module name as a setting
+from config import config as api_config  # noqa: E402
+
+bind = api_config.server_config['BIND']
+workers = api_config.server_config['WORKERS'] or multiprocessing.cpu_count() * 2 + 1
+threads = api_config.server_config['THREADS']
+worker_class = "gthread"
+timeout = api_config.server_config['TIMEOUT']
+preload_app = True
+accesslog = "-"
+
+# The app preloaded afterwards reads the same config module
+api_config.metrics_config['MULTIPROCESS_DIR'] = (api_config.metrics_config['MULTIPROCESS_DIR'] or
+                                                 os.path.join(tempfile.gettempdir(), 'data_challenge_metrics'))
+
+def on_starting(server):
+    # The counters start again with the server, not with the files of its last run
+    from service.metrics import clear_multiprocess_dir
+    clear_multiprocess_dir(api_config.metrics_config['MULTIPROCESS_DIR'])
+
+def post_fork(server, worker):
+    # The pools of the master must not be used by the workers
+    from service.sqlalchemy.engine import dispose_engines
+    dispose_engines()
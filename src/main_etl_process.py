@@ -1,12 +1,20 @@
 from service.sqlalchemy.database import create_database_session, create_database_tables
+import io
+import os
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import pandas as pd
 from validation.data_validation import validate_data, jobs_schema, departments_schema, employees_schema
 from dao.jobs_db_creator import Jobs_Db_Creator
 from dao.departments_db_creator import Departments_Db_Creator
 from dao.employees_db_creator import Employees_Db_Creator
+from dao.hiring_summary_db import Hiring_Summary_Db
 import util.transversal as utilities
 from util.logger import save_error_log
-from util.aws_s3 import read_file
+from service.report_cache import get_report_cache
+from util.aws_s3 import get_line_ranges, read_byte_range, read_file
+from config import config
 import logging
 logging.basicConfig(
     format="{asctime} - {levelname} - {message}",
@@ -44,34 +52,313 @@ dao_map = {
     'employee': Employees_Db_Creator
 }
 
+# Stages of the ETL, in the order of the report
+# Positions of the text columns of every file (names and hire datetime)
+TEXT_COLUMNS = {
+    'job': [1],
+    'department': [1],
+    'employee': [1, 2]
+}
+
+STAGES = ['download', 'parse', 'cast', 'validate', 'load', 'summary', 'error_upload']
+
+# Threads that download the files, by byte ranges
+DOWNLOAD_THREADS = 8
+
+def timed(function, *args):
+    """Call a function and return its result and the seconds it took."""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def file_key(file_type):
+    """Key of the source file of a table in the bucket."""
+    return file_keys_map.get(file_type)
+
+def plan_file(file_type):
+    """
+    Split the source file of a table into shards, byte ranges aligned to its lines.
+
+    Args:
+        file_type (str): The type of file (job, department, employee).
+
+    Returns:
+        list: The (start, end) byte positions of the shards, one of about `shard_mb`
+              ([etl] section) each, the whole file when the setting is 0.
+    """
+    return get_line_ranges(bucket, file_key(file_type), config.etl_config['SHARD_MB'] * 1024 * 1024)
+
+def download_shard(file_type, start, end):
+    """Download a shard of the source file of a table with a ranged GET."""
+    return read_byte_range(bucket, file_key(file_type), start, end)
+
+def read_dtypes(file_type):
+    """
+    Column types of the text columns of a source file, given to the CSV parser.
+
+    Without them a shard parses a text column as numbers (e.g. no employee of the
+    shard has a name) and its values are cast to text otherwise than in the whole file.
+    """
+    return {index: str for index in TEXT_COLUMNS[file_type]}
+
+def prepare_file(file_type, content):
+    """
+    Parse, cast and validate a source file (or a shard of it), run on the process pool.
+
+    Args:
+        file_type (str): The type of file (job, department, employee).
+        content (bytes): The content of the file.
+
+    Returns:
+        tuple: The valid rows, the rows with errors, the seconds and rows of every stage
+               and the dtypes of the columns once parsed and cast.
+    """
+    start = time.perf_counter()
+    df_data = utilities.set_dynamic_column_names(
+        pd.read_csv(io.BytesIO(content), header=None, dtype=read_dtypes(file_type)))
+    return prepare_frame(file_type, df_data, time.perf_counter() - start)
+
+def prepare_frame(file_type, df_data, parse_seconds):
+    """
+    Cast and validate the parsed rows of a source file (or a shard of it).
+
+    Args:
+        file_type (str): The type of file (job, department, employee).
+        df_data (pd.DataFrame): The parsed rows, with dynamic column names.
+        parse_seconds (float): The seconds the rows took to parse.
+
+    Returns:
+        tuple: The same as `prepare_file`.
+    """
+    stages = {'parse': {'seconds': parse_seconds, 'rows': len(df_data.index)}}
+    if file_type == 'employee':
+        start = time.perf_counter()
+        df_data = utilities.cast_fields(df_data=df_data,
+                                        string_columns=['column2', 'column3'],
+                                        int_columns={'column4': -1, 'column5': -1})
+        stages['cast'] = {'seconds': time.perf_counter() - start, 'rows': len(df_data.index)}
+    # After the cast, the ids of the departments and jobs are int whether a shard has blanks or not
+    dtypes = tuple(str(dtype) for dtype in df_data.dtypes)
+    start = time.perf_counter()
+    df_input, df_errors = validate_data(df_data, schema_map[file_type])
+    stages['validate'] = {'seconds': time.perf_counter() - start, 'rows': len(df_data.index)}
+    return df_input, df_errors, stages, dtypes
+
+def combine_shards(results):
+    """
+    Number the rows of the shards of a file as in the whole file and join their errors.
+
+    Args:
+        results (list): The results of `prepare_file` for every shard, in the order of the file.
+
+    Returns:
+        tuple: The valid rows of every shard and the rows with errors of the file.
+    """
+    inputs, errors, offset = [], [], 0
+    for df_input, df_errors, stages, _ in results:
+        inputs.append(df_input.set_axis(df_input.index + offset))
+        errors.append(df_errors.set_axis(df_errors.index + offset))
+        offset += stages['parse']['rows']
+    return inputs, pd.concat(errors)
+
+def add_stages(stats, stages):
+    """Add the seconds and rows of the stages of a shard to the ones of its file."""
+    for stage, values in stages.items():
+        total = stats.setdefault(stage, {'seconds': 0.0, 'rows': 0})
+        total['seconds'] += values['seconds']
+        total['rows'] += values['rows']
+
+def load_file(file_type, df_input, update_summary=True):
+    """
+    Insert the valid rows of a file (or a shard of it) on a connection of its own.
+
+    Args:
+        file_type (str): The type of file (job, department, employee).
+        df_input (pd.DataFrame): The valid rows.
+        update_summary (bool): Add the employees to the hiring summary in the same transaction,
+                               otherwise `update_hiring_summary` adds them once all the shards are loaded.
+    """
+    with create_database_session() as db:
+        if file_type == 'employee':
+            Employees_Db_Creator(db, update_summary=update_summary).insert_data(df_input)
+        else:
+            dao_map[file_type](db).insert_data(df_input)
+
+def update_hiring_summary(frames):
+    """
+    Add the hires of the loaded employee shards to the hiring summary, in a single transaction.
+
+    The shards are loaded on concurrent transactions, if each one updated the summary
+    they would lock its rows in interleaved order and could deadlock. The summary can
+    not be updated in the transactions of the shards then: if the update fails, the
+    whole summary is rebuilt from the employees table, so it is not left behind it.
+
+    Args:
+        frames (list): The valid rows of the shards that were loaded.
+    """
+    try:
+        with create_database_session() as db:
+            df_records = Employees_Db_Creator(db).get_records_frame(pd.concat(frames), headers=False)
+            Hiring_Summary_Db(db).increment_data(df_records)
+            db.commit()
+    except Exception as e:
+        logger.error(f"Could not add the loaded employees to the hiring summary, rebuilding it: {e}")
+        try:
+            with create_database_session() as db:
+                Hiring_Summary_Db(db).rebuild()
+        except Exception:
+            logger.error("Could not rebuild the hiring summary, it is behind the employees table: "
+                         "run python src/main_hiring_summary.py --rebuild")
+            raise
+
+def run_etl(types=None, processes=None):
+    """
+    Load the source files into the database, overlapping the work of the files and of their shards.
+
+    Every file is split into shards aligned to its lines (see `plan_file`) that are
+    downloaded at the same time with ranged GETs, parsed, cast and validated on a
+    process pool and loaded each on its own connection, so a large file scales with
+    the cores. Once all the shards of a file are validated its rows are loaded and its
+    errors uploaded, while the other files are still validated.
+
+    The result is the same as processing the file at once: the validation works row
+    by row and the rows of the shards are numbered as in the whole file. Only the
+    column types could differ (e.g. a shard without any name has a float column), so
+    when the shards are parsed with other types the file is validated as a whole.
+
+    Args:
+        types (list): The file types to load, all of them by default.
+        processes (int): Processes of the pool, the [etl] validate_processes setting by default.
+
+    Returns:
+        dict: The seconds and rows of every stage by file type (the seconds of the shards
+              added up), and the wall seconds.
+    """
+    types = [file_type for file_type in (types or file_types) if dao_map.get(file_type) and schema_map.get(file_type)]
+    stats = {file_type: {} for file_type in types}
+    start = time.perf_counter()
+    create_database_tables()
+
+    contents = {file_type: {} for file_type in types}
+    shards = {}
+    download_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS, thread_name_prefix="download") as downloads:
+        plans = {downloads.submit(plan_file, file_type): file_type for file_type in types}
+        reads = {}
+        for future in as_completed(plans):
+            file_type = plans[future]
+            ranges = future.result()
+            shards[file_type] = len(ranges)
+            for index, (begin, end) in enumerate(ranges):
+                reads[downloads.submit(download_shard, file_type, begin, end)] = (file_type, index)
+        for future in as_completed(reads):
+            file_type, index = reads[future]
+            contents[file_type][index] = future.result()
+            if len(contents[file_type]) == shards[file_type]:
+                size = sum(len(content) for content in contents[file_type].values())
+                seconds = time.perf_counter() - download_start
+                stats[file_type]['download'] = {'seconds': seconds, 'rows': 0, 'shards': shards[file_type]}
+                logger.info(f"Downloaded {file_key(file_type)} ({size / 1024 / 1024:.1f} MB, "
+                            f"{shards[file_type]} shards) in {seconds:.2f} seconds")
+
+    writes = {}
+    try:
+        # The pool is started once the downloads are over, no thread is running when it forks
+        processes = processes or config.etl_config['VALIDATE_PROCESSES'] or \
+            min(sum(shards.values()), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=processes) as pool, \
+                ThreadPoolExecutor(max_workers=config.etl_config['LOAD_CONNECTIONS'], thread_name_prefix="load") as loaders, \
+                ThreadPoolExecutor(max_workers=len(types), thread_name_prefix="upload") as uploads:
+            prepared = {pool.submit(prepare_file, file_type, contents[file_type][index]): (file_type, index)
+                        for file_type in types for index in range(shards[file_type])}
+            results = {file_type: {} for file_type in types}
+            for future in as_completed(prepared):
+                file_type, index = prepared[future]
+                results[file_type][index] = future.result()
+                add_stages(stats[file_type], results[file_type][index][2])
+                if len(results[file_type]) < shards[file_type]:
+                    continue
+                file_results = [results[file_type].pop(index) for index in range(shards[file_type])]
+                del contents[file_type]
+                if len({dtypes for *_, dtypes in file_results}) > 1:
+                    logger.warning(f"The shards of {file_key(file_type)} were parsed with other column types, "
+                                   f"validating the file as a whole")
+                    # Streamed from S3 again, the shards are not joined into a copy of the whole file
+                    parse_start = time.perf_counter()
+                    df_data = read_file(bucket, file_key(file_type), dtype=read_dtypes(file_type))
+                    file_results = [prepare_frame(file_type, df_data, time.perf_counter() - parse_start)]
+                    add_stages(stats[file_type], file_results[0][2])
+                inputs, df_errors = combine_shards(file_results)
+                stats[file_type]['download']['rows'] = sum(result[2]['parse']['rows'] for result in file_results)
+                # The summary of the employees loaded by several shards is updated after their loads
+                deferred_summary = file_type == 'employee' and len(inputs) > 1
+                for df_input in inputs:
+                    future = loaders.submit(timed, load_file, file_type, df_input, not deferred_summary)
+                    writes[future] = (file_type, 'load', df_input, deferred_summary)
+                if df_errors.size > 0:
+                    future = uploads.submit(timed, save_error_log, df_errors, bucket, file_key(file_type))
+                    writes[future] = (file_type, 'error_upload', df_errors, False)
+            failures = []
+            loaded_shards = {}
+            for future in as_completed(writes):
+                file_type, stage, df_rows, deferred_summary = writes[future]
+                try:
+                    _, seconds = future.result()
+                except Exception as e:
+                    logger.error(f"The {stage} of {file_key(file_type)} failed: {e}")
+                    failures.append(e)
+                    continue
+                add_stages(stats[file_type], {stage: {'seconds': seconds, 'rows': len(df_rows.index)}})
+                if deferred_summary:
+                    loaded_shards.setdefault(file_type, []).append(df_rows)
+            # Also after a failed shard, the summary counts exactly the committed employees
+            for file_type, frames in loaded_shards.items():
+                _, seconds = timed(update_hiring_summary, frames)
+                add_stages(stats[file_type], {'summary': {'seconds': seconds,
+                                                          'rows': sum(len(frame.index) for frame in frames)}})
+            if failures:
+                raise failures[0]
+    finally:
+        # Every load, even of a failed run, makes the reports cached by the API workers stale
+        if writes:
+            get_report_cache().bump_data_version()
+
+    return {'files': stats, 'seconds': time.perf_counter() - start}
+
+def log_stage_report(report):
+    """
+    Log the seconds and rows/s of every stage of every file, and of the stage over all the files.
+
+    Args:
+        report (dict): The result of `run_etl`.
+    """
+    logger.info(f"ETL finished in {report['seconds']:.2f} seconds")
+    logger.info(f"{'file':<12}{'stage':<14}{'rows':>12}{'seconds':>10}{'rows/s':>14}")
+    totals = {}
+    for file_type, stages in report['files'].items():
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            rows, seconds = stages[stage]['rows'], stages[stage]['seconds']
+            total = totals.setdefault(stage, {'rows': 0, 'seconds': 0.0})
+            total['rows'] += rows
+            total['seconds'] += seconds
+            logger.info(f"{file_type:<12}{stage:<14}{rows:>12,}{seconds:>10.2f}{rows / seconds if seconds else 0:>14,.0f}")
+    # Time spent by the stage on all the files, they overlap so it is above the wall time
+    for stage in STAGES:
+        if stage in totals:
+            rows, seconds = totals[stage]['rows'], totals[stage]['seconds']
+            logger.info(f"{'total':<12}{stage:<14}{rows:>12,}{seconds:>10.2f}{rows / seconds if seconds else 0:>14,.0f}")
+
 if __name__ == '__main__':
     try:
         logger.debug('PROCESS STARTED')
-        # Connect to PostgreSQL Database
-        with create_database_session() as db:
-            create_database_tables()
-
-            for file_type in file_types:
-                file_name = file_keys_map.get(file_type)
-                df_data = read_file(bucket, file_name)
-                if file_type == 'employee':
-                    df_data = utilities.cast_fields(df_data=df_data, 
-                                            string_columns=['column2', 'column3'], 
-                                            int_columns={'column4': -1, 'column5': -1})
-                
-                dao_class = dao_map.get(file_type)
-                schema_definition = schema_map.get(file_type)
-                if dao_class and schema_definition:
-                    dao_db = dao_class(db)
-                    df_input, df_errors = validate_data(df_data, schema_definition)
-                    dao_db.factory_orm_insert_data(df_input)
-                    if df_errors.size > 0:
-                        save_error_log(df_errors, bucket, file_name)
-                else:
-                    logger.warning(f'No Schema or DAO class mapped for {file_type}!')
-     
+        missing = [file_type for file_type in file_types if not (dao_map.get(file_type) and schema_map.get(file_type))]
+        for file_type in missing:
+            logger.warning(f'No Schema or DAO class mapped for {file_type}!')
+        log_stage_report(run_etl())
     except Exception as e:
         logger.error("Something went wrong: " + str(e))
         logger.error(traceback.format_exc())
     finally:
-        logger.debug('PROCESS FINISHED')
\ No newline at end of file
+        logger.debug('PROCESS FINISHED')
@@ -0,0 +1,43 @@
+from service.sqlalchemy.database import create_database_session, create_database_tables
+from dao.hiring_summary_db import Hiring_Summary_Db
+import argparse
+import sys
+import traceback
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild or check the hiring summary used by the reports")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the summary from the employees table")
+    parser.add_argument("--check", action="store_true", help="compare the summary with the employees table")
+    parser.add_argument("--year", type=int, default=None, help="only check this year")
+    args = parser.parse_args()
+    if not (args.rebuild or args.check):
+        parser.error("use --rebuild and/or --check")
+
+    differences = []
+    try:
+        logger.debug('PROCESS STARTED')
+        with create_database_session() as db:
+            create_database_tables()
+            summary_db = Hiring_Summary_Db(db)
+            if args.rebuild:
+                summary_db.rebuild()
+            if args.check:
+                differences = summary_db.check_consistency(args.year)
+                for difference in differences:
+                    logger.warning(f'Hiring summary mismatch: {difference}')
+                logger.info(f'Hiring summary check found {len(differences)} differences')
+    except Exception as e:
+        logger.error("Something went wrong: " + str(e))
+        logger.error(traceback.format_exc())
+        sys.exit(2)
+    finally:
+        logger.debug('PROCESS FINISHED')
+    sys.exit(1 if differences else 0)
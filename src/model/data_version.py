@@ -0,0 +1,10 @@
+from sqlalchemy import BigInteger, Column, String
+
+from service.sqlalchemy.database import Base
+
+class DataVersion(Base):
+    """Version of the data of the tables, bumped after every load so every process drops its cached reports."""
+    __tablename__ = 'data_version'
+    __table_args__ = {'schema': 'data_challenge'}
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
@@ -1,13 +1,19 @@
 #from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, DateTime, Index
 
 from service.sqlalchemy.database import Base
 
 class Employee(Base):
     __tablename__ = 'employees'
-    __table_args__ = {'schema': 'data_challenge'}
+    __table_args__ = (
+        # Hire time ranges used by the reports, department and job read from the index
+        Index('ix_employees_datetime', 'datetime', postgresql_include=['department_id', 'job_id']),
+        Index('ix_employees_department_id', 'department_id'),
+        Index('ix_employees_job_id', 'job_id'),
+        {'schema': 'data_challenge'}
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(255))
-    datetime = Column(String(255))
+    datetime = Column(DateTime(timezone=True))
     department_id = Column(Integer)
-    job_id = Column(Integer)
\ No newline at end of file
+    job_id = Column(Integer)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer
+
+from service.sqlalchemy.database import Base
+
+class HiringSummary(Base):
+    """Number of employees hired by year, quarter, department and job, kept up to date on every load."""
+    __tablename__ = 'hiring_summary'
+    __table_args__ = {'schema': 'data_challenge'}
+    year = Column(Integer, primary_key=True)
+    quarter = Column(Integer, primary_key=True)
+    department_id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, primary_key=True)
+    hired = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Float, Integer, String, Text
+
+from service.sqlalchemy.database import Base
+
+class UploadJob(Base):
+    """Status of an async upload, shared by every API worker whichever one runs it."""
+    __tablename__ = 'upload_jobs'
+    __table_args__ = {'schema': 'data_challenge'}
+    job_id = Column(String(32), primary_key=True)
+    file_type = Column(String(20))
+    file_name = Column(String(255))
+    status = Column(String(10), nullable=False)
+    created_at = Column(String(40))
+    total_rows = Column(Integer, nullable=False, default=0)
+    valid_rows = Column(Integer, nullable=False, default=0)
+    invalid_rows = Column(Integer, nullable=False, default=0)
+    inserted_rows = Column(Integer, nullable=False, default=0)
+    s3_file_path = Column(String(1024))
+    error = Column(Text)
+    # Epoch seconds
+    started = Column(Float)
+    finished = Column(Float)
@@ -0,0 +1,35 @@
+/*********************************************************************************************************
+ Store the employee hire datetime as timestamptz and add the indexes used by the reports.
+
+ The values were stored as ISO 8601 text (e.g. 2021-11-07T02:48:42Z), values that do not cast to a
+ timestamptz (e.g. 2021-13-45 or 2021-01-01 junk) are set to NULL by the conversion. Run it once against the database:
+    psql -h <host> -U <user> -d <database> -f src/queries/migrations/001_employee_datetime_timestamptz.sql
+*********************************************************************************************************/
+BEGIN;
+
+-- Values without an explicit offset are taken as UTC, as the reports do
+SET LOCAL TIME ZONE 'UTC';
+
+-- Cast that returns NULL instead of failing, dropped with the session
+CREATE FUNCTION pg_temp.try_cast_timestamptz(value text) RETURNS timestamptz AS $$
+BEGIN
+    RETURN value::timestamptz;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+ALTER TABLE data_challenge.employees
+    ALTER COLUMN datetime TYPE timestamptz
+    USING pg_temp.try_cast_timestamptz(datetime);
+
+CREATE INDEX IF NOT EXISTS ix_employees_datetime
+    ON data_challenge.employees (datetime) INCLUDE (department_id, job_id);
+CREATE INDEX IF NOT EXISTS ix_employees_department_id
+    ON data_challenge.employees (department_id);
+CREATE INDEX IF NOT EXISTS ix_employees_job_id
+    ON data_challenge.employees (job_id);
+
+COMMIT;
+
+ANALYZE data_challenge.employees;
@@ -0,0 +1,39 @@
+/*********************************************************************************************************
+ Create the hiring summary used by the reports (hires by year, quarter, department and job) and fill it
+ from the employees table. After it the API and the ETL keep it up to date on every load; it can be
+ recomputed or checked at any time with:
+    python src/main_hiring_summary.py --rebuild --check
+ Run it once against the database, after 001:
+    psql -h <host> -U <user> -d <database> -f src/queries/migrations/002_hiring_summary.sql
+*********************************************************************************************************/
+BEGIN;
+
+-- Years and quarters are taken in UTC, as the reports do
+SET LOCAL TIME ZONE 'UTC';
+
+CREATE TABLE IF NOT EXISTS data_challenge.hiring_summary (
+    year          integer NOT NULL,
+    quarter       integer NOT NULL,
+    department_id integer NOT NULL,
+    job_id        integer NOT NULL,
+    hired         integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (year, quarter, department_id, job_id)
+);
+
+DELETE FROM data_challenge.hiring_summary;
+
+INSERT INTO data_challenge.hiring_summary (year, quarter, department_id, job_id, hired)
+SELECT EXTRACT(YEAR FROM datetime)::integer,
+       EXTRACT(QUARTER FROM datetime)::integer,
+       department_id,
+       job_id,
+       COUNT(*)
+FROM data_challenge.employees
+WHERE datetime IS NOT NULL
+  AND department_id IS NOT NULL
+  AND job_id IS NOT NULL
+GROUP BY 1, 2, 3, 4;
+
+COMMIT;
+
+ANALYZE data_challenge.hiring_summary;
@@ -0,0 +1,18 @@
+/*********************************************************************************************************
+ Create the data version of the report cache. Every upload, restore, truncate and ETL load bumps it, and
+ every API worker compares it with the version of its cached reports before serving them.
+ Run it once against the database, after 002:
+    psql -h <host> -U <user> -d <database> -f src/queries/migrations/003_data_version.sql
+*********************************************************************************************************/
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS data_challenge.data_version (
+    name    varchar(50) PRIMARY KEY,
+    version bigint      NOT NULL DEFAULT 0
+);
+
+INSERT INTO data_challenge.data_version (name, version)
+VALUES ('reports', 0)
+ON CONFLICT (name) DO NOTHING;
+
+COMMIT;
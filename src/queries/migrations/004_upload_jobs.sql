@@ -0,0 +1,24 @@
+/*********************************************************************************************************
+ Create the status table of the async uploads, so GET /upload/jobs/<job_id> answers from any API worker.
+ Run it once against the database, after 003:
+    psql -h <host> -U <user> -d <database> -f src/queries/migrations/004_upload_jobs.sql
+*********************************************************************************************************/
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS data_challenge.upload_jobs (
+    job_id        varchar(32)   PRIMARY KEY,
+    file_type     varchar(20),
+    file_name     varchar(255),
+    status        varchar(10)   NOT NULL,
+    created_at    varchar(40),
+    total_rows    integer       NOT NULL DEFAULT 0,
+    valid_rows    integer       NOT NULL DEFAULT 0,
+    invalid_rows  integer       NOT NULL DEFAULT 0,
+    inserted_rows integer       NOT NULL DEFAULT 0,
+    s3_file_path  varchar(1024),
+    error         text,
+    started       double precision,
+    finished      double precision
+);
+
+COMMIT;
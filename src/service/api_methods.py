@@ -1,23 +1,38 @@
-from flask import request, jsonify
+from flask import request, jsonify, current_app
 from service.flask_sqlalchemy.api_database import db
-from sqlalchemy.orm import Query
+from service.sqlalchemy.replicas import get_read_session, get_replica_router
+from sqlalchemy.orm import Query, Session
 from typing import Any, Dict, List, Tuple
 from sqlalchemy import text
 from dao.jobs_db_creator import Jobs_Db_Creator
 from dao.departments_db_creator import Departments_Db_Creator
 from dao.employees_db_creator import Employees_Db_Creator
 from dao.queries_db_reports import Queries_Db_Reports
-from validation.data_validation import validate_data
-from util.logger import save_error_log
-from util.aws_s3 import save_to_s3, get_from_s3
-from util.transversal import set_dynamic_column_names
-from validation.data_validation import jobs_schema, departments_schema, employees_schema
+from dao.hiring_summary_db import Hiring_Summary_Db
+from model.employee import Employee
+from util.logger import save_error_log, ErrorLogWriter
+from util.aws_s3 import get_from_s3, open_from_s3, read_json_from_s3, save_json_to_s3, S3MultipartWriter
+from util.transversal import set_dynamic_column_names, format_datetime_iso
+from service.upload_jobs import get_upload_job_manager, UploadQueueFullError
+from service.report_cache import get_report_cache
+from service.metrics import timed_phase
+from util.avro_stream import iter_row_batches as iter_avro_row_batches
+from util.lazy_import import lazy_import
 import logging
-import avro.schema
-import avro.datafile
-import avro.io
 import io
-import pandas as pd
+import base64
+import json
+import math
+import itertools
+import re
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from config import config
+
+# Loaded by the uploads and restores that use them, not when the API starts
+pd = lazy_import("pandas")
+data_validation = lazy_import("validation.data_validation")
 
 logging.basicConfig(
     format="{asctime} - {levelname} - {message}",
@@ -29,12 +44,25 @@ logger.setLevel(logging.DEBUG)
 
 bucket = 'globant-datachallenge'
 
-schema_map = {
-    'job': jobs_schema,
-    'department': departments_schema,
-    'employee': employees_schema
+# Names of the validation schemas in validation.data_validation
+schema_names = {
+    'job': 'jobs_schema',
+    'department': 'departments_schema',
+    'employee': 'employees_schema'
 }
 
+creator_map = {
+    'job': Jobs_Db_Creator,
+    'department': Departments_Db_Creator,
+    'employee': Employees_Db_Creator
+}
+
+class InvalidFileError(Exception):
+    """Raised when an uploaded file does not have the expected structure."""
+
+class InvalidCursorError(Exception):
+    """Raised when a pagination cursor can not be decoded."""
+
 # Simulating a user from a database
 fake_users_db = {
     "user1": {
@@ -43,37 +71,53 @@ fake_users_db = {
     }
 }
 
-def startup_event():
-    """Initialize database connections and creators.
+def get_schema(file_type):
+    """Get the validation schema of a file type, loading pandera on first use.
 
-    This function sets up the database connection and initializes the 
-    database creator instances for jobs, departments, and employees.
-    
-    Logs a message indicating that the database connection has started.
-    """
-    global DB_CREATORS
-    jobs_db_creator = Jobs_Db_Creator(db.session)
-    departments_db_creator = Departments_Db_Creator(db.session)
-    employees_db_creator = Employees_Db_Creator(db.session)
-    queries_db_report = Queries_Db_Reports(db.session)
-    # Strategy to selecct the data table
-    DB_CREATORS = {
-        "job": jobs_db_creator,
-        "department": departments_db_creator,
-        "employee": employees_db_creator,
-        "reports": queries_db_report
-    }
-    logger.info("DB Connections Startup")
+    Args:
+        file_type (str): The type of file (job/department/employee).
+
+    Returns:
+        pa.DataFrameSchema: The schema, None for an unknown type.
+    """
+    schema_name = schema_names.get(file_type)
+    return getattr(data_validation, schema_name) if schema_name else None
+
+def get_db_creator(name):
+    """Create the DB creator of a table, or of the reports, for the current request.
+
+    The creators are bound to the session of the current app context (db.session),
+    so every request and upload job, in any thread or worker process, uses its
+    own session. The reports only read, they use the session routed to the read
+    replicas when there are any.
 
-def upload_file(file_type):
+    Args:
+        name (str): The type of file (job/department/employee) or "reports".
+
+    Returns:
+        Creator: The DB creator, None for an unknown name.
+    """
+    if name == "reports":
+        return Queries_Db_Reports(get_read_session())
+    creator_class = creator_map.get(name)
+    return creator_class(db.session) if creator_class else None
+
+def upload_file(file_type, use_orm=False, chunk_size=None):
     """Upload a specified file type to the database.
 
     This function handles file uploads for jobs, departments, or employees,
-    validates the contents of the uploaded file, and inserts data into 
-    the database.
+    validates the contents of the uploaded file, and inserts the valid rows into 
+    the database using the bulk load (COPY) of the DB creator.
+
+    When a chunk size is given (argument, `chunk_size` form field or the
+    [upload] chunk_size setting) the file is streamed by chunks, see
+    `upload_file_by_chunks`. With the `async` form field set to true the file
+    is spooled and processed by the upload worker pool, see `submit_upload_job`.
 
     Args:
         file_type (str): The type of file being uploaded (e.g., job, department, employee).
+        use_orm (boolean): Option to insert the rows one by one with the ORM instead of the bulk load.
+        chunk_size (int): Number of rows processed on each chunk, 0 loads the whole file at once.
 
     Returns:
         jsonify: A response indicating success or failure of the upload process.
@@ -85,29 +129,177 @@ def upload_file(file_type):
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
+    if chunk_size is None:
+        chunk_size = request.form.get('chunk_size', config.upload_config['CHUNK_SIZE'], type=int)
+
+    if request.form.get('async', 'false').lower() in ('true', '1', 'yes'):
+        return submit_upload_job(file, file_type, chunk_size, use_orm=use_orm)
+
     try:
-        df_data = pd.read_csv(file)
+        if chunk_size and chunk_size > 0:
+            return upload_file_by_chunks(file, file_type, chunk_size, use_orm=use_orm)
+
+        with timed_phase('read_csv', file_type) as measure:
+            df_data = pd.read_csv(file)
+            measure.rows = len(df_data.index)
         required_columns = get_required_columns(file_type)
         
         if not all(col in df_data.columns for col in required_columns):
             return jsonify({'error': f'CSV must contain {", ".join(required_columns)} columns'}), 400
-        schema = schema_map.get(file_type)
-        df_data_val= set_dynamic_column_names(df_data)
-        df_valid, df_invalid = validate_data(df_data_val, schema)
+        schema = get_schema(file_type)
+        with timed_phase('set_dynamic_column_names', file_type) as measure:
+            df_data_val= set_dynamic_column_names(df_data)
+            measure.rows = len(df_data_val.index)
+        with timed_phase('validate_data', file_type) as measure:
+            df_valid, df_invalid = data_validation.validate_data(df_data_val, schema)
+            measure.rows = len(df_data_val.index)
         if not df_valid.empty:
             s3_key = file_type+"s/"+str(file.filename)
-            db_creator = DB_CREATORS.get(file_type)
-            db_creator.factory_orm_insert_data(df_data, headers=False)
+            db_creator = get_db_creator(file_type)
+            with timed_phase('insert', file_type) as measure:
+                db_creator.insert_data(df_valid, headers=False, use_orm=use_orm)
+                measure.rows = len(df_valid.index)
+            get_report_cache().bump_data_version()
         s3_file_path = ''
         if not df_invalid.empty:
             s3_key = file_type+"s/"+str(file.filename)
-            s3_file_path = save_error_log(df_invalid, bucket, s3_key)
+            with timed_phase('save_error_log', file_type) as measure:
+                s3_file_path = save_error_log(df_invalid, bucket, s3_key)
+                measure.rows = len(df_invalid.index)
 
         return process_validation_response(df_data, df_valid, df_invalid, s3_file_path)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def upload_file_by_chunks(file, file_type, chunk_size, use_orm=False):
+    """Stream an uploaded CSV file to the database chunk by chunk.
+
+    See `load_csv_by_chunks`, the memory used depends on the chunk size instead
+    of the file size.
+
+    Args:
+        file (FileStorage): The uploaded CSV file.
+        file_type (str): The type of file being uploaded (e.g., job, department, employee).
+        chunk_size (int): Number of rows read, validated and inserted at once.
+        use_orm (boolean): Option to insert the rows one by one with the ORM instead of the bulk load.
+
+    Returns:
+        jsonify: A response with the message and the totals of valid and invalid rows.
+    """
+    try:
+        result = load_csv_by_chunks(file, file_type, file.filename, chunk_size, use_orm=use_orm)
+    except InvalidFileError as e:
+        return jsonify({'error': str(e)}), 400
+    return process_validation_counts(result['total_rows'], result['valid_rows'], result['invalid_rows'],
+                                     result['s3_file_path'], report_totals=True)
+
+def load_csv_by_chunks(file, file_type, file_name, chunk_size, use_orm=False, progress=None):
+    """Validate and insert a CSV file chunk by chunk.
+
+    Each chunk of `chunk_size` rows is validated and its valid rows are inserted
+    and committed before the next one is read, while the invalid rows are appended
+    to a local error log that is saved to S3 at the end.
+
+    Args:
+        file (file): The CSV file object (uploaded or spooled).
+        file_type (str): The type of file being uploaded (e.g., job, department, employee).
+        file_name (str): Name of the file, used for the error log path.
+        chunk_size (int): Number of rows read, validated and inserted at once.
+        use_orm (boolean): Option to insert the rows one by one with the ORM instead of the bulk load.
+        progress (callable): Called after every chunk with the running totals as keyword arguments.
+
+    Returns:
+        dict: The totals of parsed, valid, invalid and inserted rows and the error log path.
+
+    Raises:
+        InvalidFileError: If the file does not have the required columns.
+    """
+    required_columns = get_required_columns(file_type)
+    schema = get_schema(file_type)
+    db_creator = get_db_creator(file_type)
+    s3_key = file_type+"s/"+str(file_name)
+    totals = {'total_rows': 0, 'valid_rows': 0, 'invalid_rows': 0, 'inserted_rows': 0}
+
+    with ErrorLogWriter(bucket, s3_key) as error_log:
+        chunks = pd.read_csv(file, chunksize=chunk_size)
+        while True:
+            # Every chunk is parsed when it is taken from the reader
+            with timed_phase('read_csv', file_type) as measure:
+                df_chunk = next(chunks, None)
+                measure.rows = 0 if df_chunk is None else len(df_chunk.index)
+            if df_chunk is None:
+                break
+            if not all(col in df_chunk.columns for col in required_columns):
+                raise InvalidFileError(f'CSV must contain {", ".join(required_columns)} columns')
+            with timed_phase('set_dynamic_column_names', file_type) as measure:
+                df_chunk = set_dynamic_column_names(df_chunk)
+                measure.rows = len(df_chunk.index)
+            totals['total_rows'] += len(df_chunk.index)
+            with timed_phase('validate_data', file_type) as measure:
+                df_valid, df_invalid = data_validation.validate_data(df_chunk, schema)
+                measure.rows = len(df_chunk.index)
+            totals['valid_rows'] += len(df_valid.index)
+            totals['invalid_rows'] += len(df_invalid.index)
+            if not df_valid.empty:
+                with timed_phase('insert', file_type) as measure:
+                    db_creator.insert_data(df_valid, headers=False, use_orm=use_orm)
+                    measure.rows = len(df_valid.index)
+                get_report_cache().bump_data_version()
+                totals['inserted_rows'] += len(df_valid.index)
+            if not df_invalid.empty:
+                error_log.append(df_invalid)
+            logger.info(f"Chunk processed for {file_name}: {totals['total_rows']} rows read")
+            if progress:
+                progress(**totals)
+        with timed_phase('save_error_log', file_type) as measure:
+            totals['s3_file_path'] = error_log.save()
+            measure.rows = totals['invalid_rows']
+
+    return totals
+
+def submit_upload_job(file, file_type, chunk_size, use_orm=False):
+    """Spool an uploaded file and process it in the background upload worker pool.
+
+    Args:
+        file (FileStorage): The uploaded CSV file.
+        file_type (str): The type of file being uploaded (e.g., job, department, employee).
+        chunk_size (int): Number of rows read, validated and inserted at once.
+        use_orm (boolean): Option to insert the rows one by one with the ORM instead of the bulk load.
+
+    Returns:
+        jsonify: A 202 response with the job id and the URL to check its progress,
+                 or 503 if the worker pool queue is full.
+    """
+    chunk_size = chunk_size or config.upload_config['JOB_CHUNK_SIZE']
+
+    def run(spool_path, progress):
+        with open(spool_path, 'rb') as spooled_file:
+            return load_csv_by_chunks(spooled_file, file_type, file.filename, chunk_size,
+                                      use_orm=use_orm, progress=progress)
+
+    try:
+        job = get_upload_job_manager().submit(file, file_type, run)
+    except UploadQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify({'job_id': job['job_id'], 'status': job['status'],
+                    'status_url': f"/upload/jobs/{job['job_id']}"}), 202
+
+def get_upload_job_status(job_id):
+    """Get the progress of a background upload job.
+
+    Args:
+        job_id (str): The id returned by the async upload.
+
+    Returns:
+        jsonify: The job status with rows parsed, valid, invalid, inserted and
+                 elapsed time, or 404 if the job does not exist.
+    """
+    job = get_upload_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': f'Upload job {job_id} not found'}), 404
+    return jsonify(job), 200
+
 def get_required_columns(file_type):
     """Get required columns based on file type.
 
@@ -142,25 +334,46 @@ def process_validation_response(df_data, df_valid, df_invalid, s3_file_path):
     Returns:
         dict: A dictionary containing the message and the status of the process.
     """
+    # Rows are compared, invalid rows carry an extra failure_reason column
+    total_rows = 0 if df_data.empty else len(df_data.index)
+    return process_validation_counts(total_rows, len(df_valid.index), len(df_invalid.index), s3_file_path)
+
+def process_validation_counts(total_rows, valid_rows, invalid_rows, s3_file_path, report_totals=False):
+    """
+    Generates the response message of an upload from the number of validated rows.
+
+    Args:
+        total_rows (int): Number of rows in the file.
+        valid_rows (int): Number of rows that passed validation.
+        invalid_rows (int): Number of rows that failed validation.
+        s3_file_path (str): name of the log file
+        report_totals (boolean): Add the row totals to the response.
+
+    Returns:
+        dict: A dictionary containing the message and the status of the process.
+    """
+    totals = {}
+    if report_totals:
+        totals = {"total_rows": total_rows, "valid_rows": valid_rows, "invalid_rows": invalid_rows}
 
     # Initial check if no data was provided
-    if df_data.empty:
-        return jsonify({"message": "No data provided"}), 400
+    if total_rows == 0:
+        return jsonify({"message": "No data provided", **totals}), 400
 
     # Check if all data is valid
-    if df_data.size == df_valid.size:
-        return jsonify({"message": "Data added successfully"}), 201
+    if total_rows == valid_rows:
+        return jsonify({"message": "Data added successfully", **totals}), 201
     
     # If there are both valid and invalid rows
-    if not df_valid.empty and not df_invalid.empty:
-        return jsonify({"message": f"Data added partially, please check the log {s3_file_path}"}), 201
+    if valid_rows > 0 and invalid_rows > 0:
+        return jsonify({"message": f"Data added partially, please check the log {s3_file_path}", **totals}), 201
 
     # If all data is invalid
-    if df_data.size == df_invalid.size:
-        return jsonify({"message": f"No data added, please check the log {s3_file_path}"}), 400
+    if total_rows == invalid_rows:
+        return jsonify({"message": f"No data added, please check the log {s3_file_path}", **totals}), 400
 
     # Default case (if none of the above conditions are met)
-    return jsonify({"message": "Unknown processing state"}), 400
+    return jsonify({"message": "Unknown processing state", **totals}), 400
 
 # Factory to get schemas AVRO
 def get_avro_schema(file_type: str):
@@ -173,10 +386,11 @@ def get_avro_schema(file_type: str):
     schemas = {
         "job": '{"type": "record", "name": "Job", "fields": [{"name": "id", "type": "int"}, {"name": "job", "type": "string"}]}',
         "department": '{"type": "record", "name": "Department", "fields": [{"name": "id", "type": "int"}, {"name": "department", "type": "string"}]}',
-        "employee": '{"type": "record", "name": "Employee", "fields": [{"name": "id", "type": "int"}, {"name": "name", "type": "string"}, {"name": "datetime", "type": "string"}, {"name": "department_id", "type": "int"}, {"name": "job_id", "type": "int"}]}'
+        "employee": '{"type": "record", "name": "Employee", "fields": [{"name": "id", "type": "int"}, {"name": "name", "type": "string"}, {"name": "datetime", "type": ["null", "string"]}, {"name": "department_id", "type": "int"}, {"name": "job_id", "type": "int"}]}'
     }
     if file_type not in schemas:
         raise ValueError(f"Invalid file type: {file_type}")
+    import avro.schema
     return avro.schema.parse(schemas[file_type])
 
 def serialize_row(row, file_type: str) -> dict:
@@ -194,76 +408,322 @@ def serialize_row(row, file_type: str) -> dict:
         return {
             "id": row.id,
             "name": row.name,
-            "datetime": row.datetime,
+            "datetime": format_datetime_iso(row.datetime),
             "department_id": row.department_id,
             "job_id": row.job_id
         }
     raise ValueError(f"Unsupported file type: {file_type}")
 
-def backup_table_to_avro(file_type):
+def get_manifest_key(file_type):
+    """Key of the manifest that lists the base backup of a table and its deltas."""
+    return f'backups/{file_type}_manifest.json'
+
+def backup_table_to_avro(file_type, db_creator=None, incremental=False):
     """
-    Backs up the Jobs table from PostgreSQL to an AVRO file.
+    Backs up a table from PostgreSQL to an AVRO file in S3.
+
+    The rows are streamed from the database (server-side cursor), written as
+    compressed Avro blocks and uploaded as the parts of a multipart upload while
+    they are read, so the memory used does not depend on the size of the table.
+
+    Every backup records the high-water mark (max id) of the table in a manifest.
+    An incremental backup only writes the rows above the mark of the manifest to a
+    new delta file, which is added to the manifest after the base file and the
+    previous deltas; without a manifest a full backup is made. Rows updated or
+    deleted after the base backup are only captured by a full backup.
 
     Args:
         file_type (str): The type of file being backed up (e.g., job, department, employee).
+        db_creator (Creator): DB creator used to read the table, the one of the API session by default.
+        incremental (boolean): Only back up the rows added since the last backup.
     """
     try:
-        # Execute a query to fetch all rows from the Jobs table
-        db_creator = DB_CREATORS.get(file_type)
-        rows = db_creator.get_all_data()
-        
-        # Getting AVRO schema definition
-        schema = get_avro_schema(file_type)
-              
-        # Creating buffer in memory
-        with io.BytesIO() as avro_buffer:
-            writer = avro.datafile.DataFileWriter(avro_buffer, avro.io.DatumWriter(), schema)
-            # Assuming `rows` has data
-            for row in rows:
-                writer.append(serialize_row(row, file_type))
-            writer.flush()
-            avro_buffer.seek(0)
-            # Upload to S3
+        db_creator = db_creator or get_db_creator(file_type)
+        manifest_key = get_manifest_key(file_type)
+        manifest = read_json_from_s3(bucket, manifest_key) if incremental else None
+        if manifest is None:
             s3_key = f'backups/{file_type}_backup.avro'
-            save_to_s3(avro_buffer, bucket, s3_key)
-                    
-        logger.info(f"Backup completed successfully. Data saved to {s3_key}")
+            after_id = None
+        else:
+            s3_key = f'backups/{file_type}_delta_{len(manifest["deltas"]) + 1:04d}.avro'
+            after_id = manifest['high_water_mark']
+
+        rows = db_creator.iter_all_data(config.backup_config['FETCH_SIZE'], after_id=after_id)
+        first_row = next(rows, None)
+        if manifest is not None and first_row is None:
+            # Nothing new since the last backup, no delta is written
+            logger.info(f"Incremental backup of {file_type}: no new rows after id {after_id}")
+            return f"Backup up to date for {file_type}, no new rows"
+        if first_row is not None:
+            rows = itertools.chain([first_row], rows)
+
+        with timed_phase('backup_avro', file_type) as measure:
+            rows_count, high_water_mark, s3_file = write_table_to_avro(file_type, rows, s3_key)
+            measure.rows = rows_count
+
+        entry = {
+            'key': s3_key,
+            'rows': rows_count,
+            'after_id': after_id,
+            'high_water_mark': high_water_mark if high_water_mark is not None else after_id,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }
+        if manifest is None:
+            manifest = {'file_type': file_type, 'base': entry, 'deltas': []}
+        else:
+            manifest['deltas'].append(entry)
+        manifest['high_water_mark'] = entry['high_water_mark']
+        save_json_to_s3(manifest, bucket, manifest_key)
+
+        logger.info(f"Backup completed successfully. {rows_count} rows saved to {s3_key} "
+                    f"({s3_file.bytes_written} bytes, {max(s3_file.parts_count, 1)} parts)")
         return f"Backup complete for {file_type} in {s3_key}"
     except Exception as e:
         logger.error(f"Message: {e}")
         return f"Error in backup for {file_type}: {e}"
 
-def restore_table_from_s3_avro(file_type, truncate_option=False):
+def write_table_to_avro(file_type, rows, s3_key):
+    """
+    Stream the rows of a table to an AVRO file in S3.
+
+    Args:
+        file_type (str): The type of file being backed up (e.g., job, department, employee).
+        rows (iterable): The rows of the table ordered by id.
+        s3_key (str): Key of the AVRO file.
+
+    Returns:
+        tuple: The number of rows, their max id (None without rows) and the S3 writer.
+    """
+    import avro.datafile
+    import avro.io
+    # Getting AVRO schema definition
+    schema = get_avro_schema(file_type)
+    part_size = config.backup_config['PART_SIZE_MB'] * 1024 * 1024
+    rows_count = 0
+    high_water_mark = None
+    with S3MultipartWriter(bucket, s3_key, part_size=part_size) as s3_file:
+        writer = avro.datafile.DataFileWriter(s3_file, avro.io.DatumWriter(), schema,
+                                              codec=config.backup_config['CODEC'])
+        for row in rows:
+            writer.append(serialize_row(row, file_type))
+            rows_count += 1
+            # Rows come ordered by id
+            high_water_mark = row.id
+        writer.flush()
+    return rows_count, high_water_mark, s3_file
+
+def backup_tables_to_avro(file_types, engine=None, incremental=False, backup_format='avro'):
+    """
+    Back up several tables at the same time, all of them from the same snapshot.
+
+    On PostgreSQL a REPEATABLE READ transaction exports its snapshot
+    (pg_export_snapshot) and every table is read on its own connection, in a
+    transaction that imports that snapshot, so the files hold the data of the
+    same instant and the wall time is close to the one of the largest table.
+
+    Args:
+        file_types (list): The tables to back up (e.g., job, department, employee).
+        engine (Engine): Engine used to open the connections, a healthy read replica
+                         (or the primary) of the replica router by default.
+        incremental (boolean): Only back up the rows added since the last backup, see `backup_table_to_avro`.
+        backup_format (str): Format of the files, avro or parquet (see `backup_table_to_s3_parquet`).
+
+    Returns:
+        dict: The joined messages, the total seconds and the message and seconds of every table.
+    """
+    engine = engine or get_replica_router().get_read_engine()
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        snapshot_id = None
+        if engine.dialect.name == 'postgresql':
+            # The snapshot can be imported while this transaction is open
+            connection.execution_options(isolation_level='REPEATABLE READ')
+            connection.begin()
+            snapshot_id = connection.execute(text("SELECT pg_export_snapshot()")).scalar()
+            logger.info(f"Backup snapshot {snapshot_id} exported")
+        with ThreadPoolExecutor(max_workers=len(file_types), thread_name_prefix="backup") as executor:
+            futures = {
+                file_type: executor.submit(backup_table_in_snapshot, engine, file_type, snapshot_id, incremental,
+                                          backup_format)
+                for file_type in file_types
+            }
+            tables = {file_type: future.result() for file_type, future in futures.items()}
+    return {
+        'message': " - ".join(table['message'] for table in tables.values()),
+        'seconds': round(time.perf_counter() - start, 3),
+        'tables': tables
+    }
+
+def backup_table_in_snapshot(engine, file_type, snapshot_id=None, incremental=False, backup_format='avro'):
+    """
+    Back up a table on its own connection, reading from an exported snapshot.
+
+    Args:
+        engine (Engine): Engine used to open the connection.
+        file_type (str): The type of file being backed up (e.g., job, department, employee).
+        snapshot_id (str): Snapshot returned by pg_export_snapshot, None to read the current data.
+        incremental (boolean): Only back up the rows added since the last backup.
+        backup_format (str): Format of the files, avro or parquet.
+
+    Returns:
+        dict: The message of the backup and its seconds.
+    """
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        if snapshot_id is not None:
+            if not re.fullmatch(r'[0-9A-Fa-f-]+', snapshot_id):
+                raise ValueError(f"Invalid snapshot id: {snapshot_id}")
+            connection.execution_options(isolation_level='REPEATABLE READ')
+            connection.begin()
+            connection.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'"))
+        with Session(bind=connection) as session:
+            db_creator = creator_map[file_type](session)
+            if backup_format == 'parquet':
+                message = backup_table_to_s3_parquet(file_type, db_creator)
+            else:
+                message = backup_table_to_avro(file_type, db_creator, incremental=incremental)
+    seconds = round(time.perf_counter() - start, 3)
+    logger.info(f"Backup of {file_type} took {seconds} seconds")
+    return {'message': message, 'seconds': seconds}
+
+def backup_table_to_s3_parquet(file_type, db_creator=None):
+    """
+    Backs up a table from PostgreSQL to Parquet files in S3.
+
+    The employees are partitioned by hire year and sorted by department inside
+    each file, so a restore can read only some years and departments
+    (see `restore_table_from_s3_parquet`).
+
+    Args:
+        file_type (str): The type of file being backed up (e.g., job, department, employee).
+        db_creator (Creator): DB creator used to read the table, the one of the API session by default.
+    """
+    # pyarrow is only loaded by the Parquet backups
+    from service.parquet_backup import backup_table_to_parquet, get_parquet_prefix
+    try:
+        with timed_phase('backup_parquet', file_type) as measure:
+            rows_count, s3_keys = backup_table_to_parquet(file_type, db_creator or get_db_creator(file_type), bucket)
+            measure.rows = rows_count
+        return f"Backup complete for {file_type} in {get_parquet_prefix(file_type)} ({len(s3_keys)} files)"
+    except Exception as e:
+        logger.error(f"Message: {e}")
+        return f"Error in backup for {file_type}: {e}"
+
+def restore_table_from_s3_parquet(file_type, truncate_option=False, years=None, department_ids=None):
+    """
+    Restores data from the Parquet backup of a table in an S3 bucket to a PostgreSQL database.
+
+    The filters only apply to the employees: the year filter reads only the
+    partitions of those hire years and the department filter skips the row
+    groups whose statistics can not contain those departments.
+
+    Args:
+        file_type (str): The type of file being backed up (e.g., job, department, employee).
+        truncate_option (boolean): Option to truncate the table before try restoring data
+        years (list): Hire years of the employees to restore, all by default.
+        department_ids (list): Departments of the employees to restore, all by default.
+    """
+    from service.parquet_backup import restore_table_from_parquet, get_parquet_prefix
+    try:
+        if truncate_option:
+            truncate_table(f'data_challenge.{file_type}s')
+        with timed_phase('restore_parquet', file_type) as measure:
+            restored, s3_keys = restore_table_from_parquet(file_type, get_db_creator(file_type), bucket,
+                                                           years=years, department_ids=department_ids)
+            measure.rows = restored
+        seconds = measure.seconds
+        logger.info(f"Successfully restored {restored} rows from {len(s3_keys)} Parquet files to the database "
+                    f"in {seconds:.2f} seconds ({restored / seconds if seconds else 0:,.0f} rows/s).")
+        get_report_cache().bump_data_version()
+        return f"Restore complete for {file_type} in {get_parquet_prefix(file_type)} ({restored} rows)"
+    except Exception as e:
+        logger.error(f"Message: {e}")
+        return f"Error in restore for {file_type}: {e}"
+
+def get_backup_keys(file_type):
+    """
+    Get the AVRO files to restore a table, in the order they must be loaded.
+
+    Args:
+        file_type (str): The type of file (job/department/employee).
+
+    Returns:
+        list: The base backup followed by its deltas when there is a manifest,
+              otherwise the single backup file.
+    """
+    manifest = read_json_from_s3(bucket, get_manifest_key(file_type))
+    if manifest is None:
+        return [f'backups/{file_type}_backup.avro']
+    return [manifest['base']['key']] + [delta['key'] for delta in manifest['deltas']]
+
+def restore_table_from_s3_avro(file_type, truncate_option=False, use_orm=False, processes=None):
     """
     Restores data from an AVRO file in an S3 bucket to a PostgreSQL database.
 
+    The file is decoded block by block while it is downloaded and the rows of
+    each block go straight to the bulk load (COPY), without building a list or a
+    DataFrame of the whole file. The blocks can be decoded by a pool of processes.
+    When the table has incremental backups, the base file is restored and then
+    every delta of the manifest, in order.
+
     Args:
         file_type (str): The type of file being backed up (e.g., job, department, employee).
         truncate_option (boolean): Option to truncate the table before try restoring data
+        use_orm (boolean): Option to insert the rows one by one with the ORM instead of the bulk load.
+        processes (int): Processes that decode the Avro blocks, the [backup] restore_processes setting by default.
 
     """
     try:
-        s3_key = f'backups/{file_type}_backup.avro'
-        # Download the AVRO file into memory
-        avro_buffer = io.BytesIO()
-        get_from_s3(bucket, s3_key, avro_buffer)
-        # Move back to the start of the BytesIO buffer
-        avro_buffer.seek(0)
-        # Read data from the AVRO file using avro.datafile.DataFileReader
-        reader = avro.datafile.DataFileReader(avro_buffer, avro.io.DatumReader())
-        # Load records in memory
-        records = [r for r in reader]
-        # Populate pandas.DataFrame with records
-        df_data = pd.DataFrame.from_records(records)
+        s3_keys = get_backup_keys(file_type)
         if truncate_option:
             truncate_table(f'data_challenge.{file_type}s')
-        db_creator = DB_CREATORS.get(file_type)
-        db_creator.factory_orm_insert_data(df_data, headers=True)
-        logger.info(f"Successfully restored data from s3://{bucket}/{s3_key} to the database.")
-        return f"Restore complete for {file_type} in {s3_key}"
+        db_creator = get_db_creator(file_type)
+        if processes is None:
+            processes = config.backup_config['RESTORE_PROCESSES']
+        for s3_key in s3_keys:
+            with timed_phase('restore_avro', file_type) as measure:
+                if use_orm:
+                    restored = restore_avro_with_orm(db_creator, s3_key)
+                else:
+                    row_batches = iter_avro_row_batches(open_from_s3(bucket, s3_key), db_creator.columns, processes)
+                    restored = db_creator.load_rows(row_batches)
+                measure.rows = restored
+            seconds = measure.seconds
+            logger.info(f"Successfully restored {restored} rows from s3://{bucket}/{s3_key} to the database "
+                        f"in {seconds:.2f} seconds ({restored / seconds if seconds else 0:,.0f} rows/s).")
+        get_report_cache().bump_data_version()
+        return f"Restore complete for {file_type} in {', '.join(s3_keys)}"
     except Exception as e:
         logger.error(f"Message: {e}")
         return f"Error in restore for {file_type}: {e}"
+
+def restore_avro_with_orm(db_creator, s3_key):
+    """
+    Restore an AVRO file inserting its rows one by one with the ORM.
+
+    Args:
+        db_creator (Creator): DB creator of the table.
+        s3_key (str): Key of the AVRO file.
+
+    Returns:
+        int: The number of restored rows.
+    """
+    import avro.datafile
+    import avro.io
+    # Download the AVRO file into memory
+    avro_buffer = io.BytesIO()
+    get_from_s3(bucket, s3_key, avro_buffer)
+    # Move back to the start of the BytesIO buffer
+    avro_buffer.seek(0)
+    # Read data from the AVRO file using avro.datafile.DataFileReader
+    reader = avro.datafile.DataFileReader(avro_buffer, avro.io.DatumReader())
+    # Load records in memory
+    records = [r for r in reader]
+    if records:
+        # Populate pandas.DataFrame with records
+        df_data = pd.DataFrame.from_records(records)
+        db_creator.insert_data(df_data, headers=True, use_orm=True)
+    return len(records)
     
 def truncate_table(table_name) -> None:
     """
@@ -282,7 +742,11 @@ def truncate_table(table_name) -> None:
         truncate_table('data_challenge.employees')
     """
     db.session.execute(text(f"TRUNCATE TABLE {table_name} RESTART IDENTITY CASCADE"))
+    if table_name == Employee.__table__.fullname:
+        # The hiring summary only counts the employees of the table
+        Hiring_Summary_Db(db.session).clear()
     db.session.commit()
+    get_report_cache().bump_data_version()
     
 def execute_query(function_name, *args, **kwargs):
     """
@@ -305,16 +769,66 @@ def execute_query(function_name, *args, **kwargs):
     Example:
         result = execute_query("get_employees_by_quarter", 2021)
     """
-    db_report = DB_CREATORS.get("reports")
-    # getattr to call methon name dinamically
-    query_method = getattr(db_report, function_name, None)
+    with timed_phase('execute_query', function_name):
+        db_report = get_db_creator("reports")
+        # getattr to call methon name dinamically
+        query_method = getattr(db_report, function_name, None)
 
-    if query_method is None:
-        raise AttributeError(f"Method '{function_name}' not found in {db_report}")
+        if query_method is None:
+            raise AttributeError(f"Method '{function_name}' not found in {db_report}")
 
-    query_data = query_method(*args, **kwargs)
+        query_data = query_method(*args, **kwargs)
     return(query_data)
 
+def get_cached_report(endpoint, build_report, *args):
+    """
+    Answer a report from the report cache, building it only on a miss.
+
+    The key is made of the endpoint, its arguments and the data version of the
+    cache, bumped by every upload, restore and truncate. A report built on a read
+    replica that has not replayed that version yet is answered but not cached.
+    With the [report_cache] cache_json setting the serialized JSON is cached, so
+    the hits skip jsonify.
+
+    Args:
+        endpoint (str): Name of the report endpoint.
+        build_report (callable): Called as build_report(*args), returns the response dictionary.
+        *args: Report arguments (year, page, per_page, ...).
+
+    Returns:
+        Response: The JSON response of the report.
+
+    Example:
+        response = get_cached_report('employees_by_quarter', build_report, '2021', 1, 10)
+    """
+    cache = get_report_cache()
+    key = cache.make_key(endpoint, *args)
+    cached = cache.get(key)
+    if cached is None:
+        # Checked first, it picks the replica the report then runs on
+        current = cache.is_current(key, get_read_session())
+        # The statements of the report run here (pagination), on a cache miss
+        with timed_phase('build_report', endpoint) as measure:
+            report = build_report(*args)
+            measure.rows = len(report.get('data', []))
+        response = jsonify(report)
+        if current:
+            cached = response.get_data() if config.report_cache_config['CACHE_JSON'] else response.get_json()
+            cache.set(key, cached)
+        return response
+    if isinstance(cached, bytes):
+        return current_app.response_class(cached, mimetype='application/json')
+    return jsonify(cached)
+
+def get_report_cache_stats():
+    """
+    Get the hit/miss counters of the report cache.
+
+    Returns:
+        jsonify: The counters of the cache.
+    """
+    return jsonify(get_report_cache().stats()), 200
+
 def paginate_query(query: Query, page: int, per_page: int) -> Tuple[List[Any], Dict[str, Any]]:
     """
     Apply pagination to a SQLAlchemy query and return the results with metadata.
@@ -342,4 +856,116 @@ def paginate_query(query: Query, page: int, per_page: int) -> Tuple[List[Any], D
         'total_pages': paginated_result.pages,
         'total_items': paginated_result.total
     }
-    return paginated_result.items, metadata
\ No newline at end of file
+    return paginated_result.items, metadata
+
+def paginate_windowed_query(query: Query, page: int, per_page: int,
+                            total_field: str = 'total_items') -> Tuple[List[Any], Dict[str, Any]]:
+    """
+    Apply pagination to a query that returns its own total as a window column (count(*) over ()).
+
+    It gives the same items and metadata as `paginate_query` without its extra
+    COUNT query; the count only runs when the page is past the last one.
+
+    Args:
+        query (Query): The SQLAlchemy query, with the `total_field` column.
+        page (int): The page number to retrieve.
+        per_page (int): The number of items per page.
+        total_field (str): Column with the total number of rows of the query.
+
+    Returns:
+        Tuple[List[Any], Dict[str, Any]]:
+            A tuple containing the items in the requested page and the
+            pagination metadata (page number, items per page, total pages, and total items).
+
+    Example:
+        items, metadata = paginate_windowed_query(query, page=1, per_page=50)
+    """
+    # Same defaults as Flask-SQLAlchemy with error_out=False
+    page = page if page >= 1 else 1
+    per_page = per_page if per_page >= 1 else 20
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    if items:
+        total = getattr(items[0], total_field)
+    elif page == 1:
+        total = 0
+    else:
+        total = query.order_by(None).count()
+    metadata = {
+        'page': page,
+        'per_page': per_page,
+        'total_pages': math.ceil(total / per_page) if total else 0,
+        'total_items': total
+    }
+    return items, metadata
+
+def encode_cursor(values) -> str:
+    """
+    Build the opaque cursor of a keyset (the sort values of the last row of a page).
+
+    Args:
+        values (tuple): The sort values of the row.
+
+    Returns:
+        str: URL safe cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+def decode_cursor(cursor: str, types: Tuple[type, ...] = None):
+    """
+    Get the keyset of a cursor built with `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor, empty or None for the first page.
+        types (tuple): The type of every sort value of the keyset of the report
+                       (e.g. (int, int)), not checked when it is None.
+
+    Returns:
+        tuple: The sort values of the last row read, None for the first page.
+
+    Raises:
+        InvalidCursorError: If the cursor was not built by `encode_cursor` or does
+                            not hold one value of the expected type by sort field.
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+    if types is not None and (len(values) != len(types) or not all(
+            # bool is an int for isinstance, but never a sort value
+            isinstance(value, value_type) and not isinstance(value, bool)
+            for value, value_type in zip(values, types))):
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+    return tuple(values)
+
+def paginate_query_by_cursor(query: Query, per_page: int, cursor_fields: List[str]) -> Tuple[List[Any], Dict[str, Any]]:
+    """
+    Read one page of a query already filtered after the cursor keyset (keyset pagination).
+
+    Unlike `paginate_query` there is no count and no offset, every page costs the
+    same whatever its depth. The query must be ordered by `cursor_fields`.
+
+    Args:
+        query (Query): The SQLAlchemy query, filtered with the keyset of the cursor.
+        per_page (int): The number of items per page.
+        cursor_fields (List[str]): Row attributes that make the keyset of the cursor.
+
+    Returns:
+        Tuple[List[Any], Dict[str, Any]]:
+            A tuple containing the items of the page and the pagination metadata
+            (items per page and `next_cursor`, None on the last page).
+
+    Example:
+        items, metadata = paginate_query_by_cursor(query, per_page=10, cursor_fields=['department', 'job'])
+    """
+    per_page = max(per_page, 1)
+    # One more row tells if there is a next page
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(getattr(items[-1], field) for field in cursor_fields)
+    return items, {'per_page': per_page, 'next_cursor': next_cursor}
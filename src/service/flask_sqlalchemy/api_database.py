@@ -1,3 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
+from service.sqlalchemy.engine import get_engine
 
-db = SQLAlchemy()
\ No newline at end of file
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy extension that uses the engine of `service.sqlalchemy.engine`.
+
+    The default bind reuses the shared engine of its URI (with the [database] pool
+    settings) instead of creating a second engine and pool; binds with their own
+    engine options (e.g. the in-memory SQLite of the tests) are created as usual.
+    """
+
+    def _make_engine(self, bind_key, options, app):
+        # Flask-SQLAlchemy always sets echo and echo_pool (SQLALCHEMY_ECHO)
+        own_options = {key: value for key, value in options.items()
+                       if key != 'url' and not (key in ('echo', 'echo_pool') and not value)}
+        if bind_key is None and not own_options:
+            return get_engine(options['url'])
+        return super()._make_engine(bind_key, options, app)
+
+db = SharedEngineSQLAlchemy()
@@ -0,0 +1,382 @@
+"""
+Metrics of the API in the Prometheus text format.
+
+The counters and histograms live in the registry of the process and are
+rendered by GET /metrics:
+
+- http_request_duration_seconds{route, method, status}: latency of every request.
+- phase_duration_seconds{phase, target}: latency of every phase of the uploads
+  (read_csv, set_dynamic_column_names, validate_data, insert, save_error_log),
+  the backups and restores and the report queries.
+- phase_rows_total{phase, target}: rows processed by every phase.
+- phase_errors_total{phase, target}: phases that raised an exception.
+
+The phases of a request are also sent back in its Server-Timing header, one
+entry by phase with the seconds of all its runs added up.
+
+With several gunicorn workers set `multiprocess_dir` ([metrics] section): every
+process writes its samples to a file of its own there (at most every
+`flush_seconds`) and /metrics adds up the files of every process, also of the
+workers that exited, so a scrape sees the same counters whatever the worker.
+"""
+from contextlib import contextmanager
+import glob
+import json
+import os
+import threading
+import time
+from flask import g, has_request_context, request
+from config import config
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Upper bounds (seconds) of the latency histograms
+DEFAULT_BUCKETS = tuple(config.metrics_config['BUCKETS'])
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Monotonic counter by label values.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): HELP text of the metric.
+        labelnames (tuple): Names of the labels, every call gives a value for each one.
+    """
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        """Add `amount` to the counter of the label values."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """Current value of the counter of the label values."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def values(self):
+        """Copy of the values by label values."""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(values, other):
+        """Add the values of another process to `values`."""
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def samples(self, values=None):
+        values = self.values() if values is None else values
+        return [(self.name, key, value) for key, value in sorted(values.items())]
+
+class Histogram:
+    """
+    Histogram of observations (e.g. seconds) by label values, with cumulative buckets.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): HELP text of the metric.
+        labelnames (tuple): Names of the labels.
+        buckets (tuple): Upper bounds of the buckets, +Inf is added.
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets)) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        """Count one observation in its bucket."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def get(self, **labels):
+        """Number and sum of the observations of the label values."""
+        with self._lock:
+            counts, total = self._values.get(self._key(labels), ([0] * len(self.buckets), 0.0))
+            return sum(counts), total
+
+    def values(self):
+        """Copy of the bucket counts and sum by label values."""
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def merge(values, other):
+        """Add the bucket counts and sums of another process to `values`."""
+        for key, (counts, total) in other.items():
+            if key in values:
+                merged_counts, merged_total = values[key]
+                counts = [merged + count for merged, count in zip(merged_counts, counts)]
+                total += merged_total
+            values[key] = (list(counts), total)
+
+    def samples(self, values=None):
+        values = self.values() if values is None else values
+        samples = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', key + (('le', _format_value(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, cumulative))
+        return samples
+
+class MetricsRegistry:
+    """
+    Metrics of the process, rendered together in the Prometheus text format.
+
+    Args:
+        multiprocess_dir (str): Directory shared by the processes, None reads the
+                                `multiprocess_dir` setting on every use (empty keeps
+                                the metrics in the process).
+    """
+
+    def __init__(self, multiprocess_dir=None):
+        self.multiprocess_dir = multiprocess_dir
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flushed = None
+        self._flusher_pid = None
+        self._flush_lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create (or get) a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create (or get) a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get_multiprocess_dir(self):
+        return self.multiprocess_dir or config.metrics_config['MULTIPROCESS_DIR'] or None
+
+    def flush(self):
+        """
+        Write the samples of the process to its file of the multiprocess directory, if they changed.
+
+        Returns:
+            bool: True if the file was written.
+        """
+        directory = self.get_multiprocess_dir()
+        if directory is None:
+            return False
+        with self._flush_lock:
+            return self._write(directory)
+
+    def _write(self, directory):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {metric.name: [[list(map(list, key)), value] for key, value in sorted(metric.values().items())]
+                    for metric in metrics}
+        if snapshot == self._flushed:
+            return False
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'metrics_{os.getpid()}.json')
+        # Written aside and renamed, a scrape never reads half a file
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(f'{path}.tmp', path)
+        self._flushed = snapshot
+        return True
+
+    def start_flusher(self):
+        """Flush the samples every `flush_seconds` from a thread of the process, started once by process."""
+        if self._flusher_pid == os.getpid() or self.get_multiprocess_dir() is None:
+            return
+        with self._lock:
+            # A forked worker does not inherit the thread of its parent
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._flushed = None
+        threading.Thread(target=self._flush_every, args=(config.metrics_config['FLUSH_SECONDS'],),
+                         name="metrics-flush", daemon=True).start()
+
+    def _flush_every(self, seconds):
+        while True:
+            time.sleep(seconds)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning(f"Could not write the metrics of the process: {e}")
+
+    def collect(self):
+        """
+        Get the values of every metric, added up over the processes of the multiprocess directory.
+
+        Returns:
+            list: The (metric, values) pairs.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        directory = self.get_multiprocess_dir()
+        if directory is None:
+            return [(metric, metric.values()) for metric in metrics]
+        self.flush()
+        merged = {metric.name: {} for metric in metrics}
+        for path in sorted(glob.glob(os.path.join(directory, 'metrics_*.json'))):
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read the metrics of {path}: {e}")
+                continue
+            for metric in metrics:
+                values = {tuple(map(tuple, key)): value for key, value in snapshot.get(metric.name, [])}
+                metric.merge(merged[metric.name], values)
+        return [(metric, merged[metric.name]) for metric in metrics]
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format (version 0.0.4).
+
+        Returns:
+            str: The metrics, one sample by line.
+        """
+        lines = []
+        for metric, values in self.collect():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples(values):
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+def clear_multiprocess_dir(directory):
+    """Remove the files of the processes of a previous run, call it before the workers start."""
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json*')):
+        os.remove(path)
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Latency of the HTTP requests by route.', ('route', 'method', 'status'))
+PHASE_SECONDS = registry.histogram(
+    'phase_duration_seconds', 'Latency of the phases of the uploads, backups, restores and reports.',
+    ('phase', 'target'))
+PHASE_ROWS = registry.counter(
+    'phase_rows_total', 'Rows processed by every phase.', ('phase', 'target'))
+PHASE_ERRORS = registry.counter(
+    'phase_errors_total', 'Phases that raised an exception.', ('phase', 'target'))
+
+class PhaseMeasure:
+    """Handle of a running phase, set `rows` with the rows it processed; `seconds` is set when it ends."""
+
+    def __init__(self, phase, target):
+        self.phase = phase
+        self.target = target
+        self.rows = 0
+        self.seconds = None
+
+@contextmanager
+def timed_phase(phase, target=''):
+    """
+    Measure a phase: its latency, its rows and whether it failed.
+
+    Example:
+        with timed_phase('read_csv', file_type) as measure:
+            df_data = pd.read_csv(file)
+            measure.rows = len(df_data.index)
+
+    Args:
+        phase (str): Name of the phase (e.g. validate_data).
+        target (str): What the phase works on (file type, report...).
+
+    Yields:
+        PhaseMeasure: The measure of the phase.
+    """
+    measure = PhaseMeasure(phase, target)
+    enabled = config.metrics_config['ENABLED']
+    start = time.perf_counter()
+    try:
+        yield measure
+    except Exception:
+        if enabled:
+            PHASE_ERRORS.inc(phase=phase, target=target)
+        raise
+    finally:
+        measure.seconds = time.perf_counter() - start
+        # No return here, it would swallow the exception of the phase
+        if enabled:
+            PHASE_SECONDS.observe(measure.seconds, phase=phase, target=target)
+            if measure.rows:
+                PHASE_ROWS.inc(measure.rows, phase=phase, target=target)
+            registry.start_flusher()
+            if has_request_context():
+                # Added up by phase, a chunked upload runs the same phases once by chunk
+                timings = g.setdefault('phase_timings', {})
+                timings[phase] = timings.get(phase, 0.0) + measure.seconds
+
+def start_request_timer():
+    """Flask before_request hook, start measuring the request."""
+    g.request_start = time.perf_counter()
+
+def observe_request(response):
+    """
+    Flask after_request hook: record the latency of the request by route and add
+    its phases to the Server-Timing header.
+    """
+    start = g.pop('request_start', None)
+    if start is None or not config.metrics_config['ENABLED']:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method,
+                            status=str(response.status_code))
+    registry.start_flusher()
+    timings = g.pop('phase_timings', {})
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(
+            f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in timings.items())
+    return response
+
+def render_metrics():
+    """The metrics of the API (of every process with `multiprocess_dir`) in the Prometheus text format."""
+    return registry.render()
@@ -0,0 +1,225 @@
+"""
+Parquet backups of the tables.
+
+Every table is saved under backups/parquet/<type>/ and the employees are
+partitioned by hire year (UTC): backups/parquet/employee/year=<year>/part-0.parquet.
+Inside each file the rows are sorted by department, so the row group statistics
+(min/max) let a restore filtered by department skip the row groups it does not need.
+"""
+import itertools
+import re
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from config import config
+from util.aws_s3 import S3MultipartWriter, S3RangeReader, list_s3_keys, delete_s3_keys
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Partition of the employees without hire datetime
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+PARQUET_SCHEMAS = {
+    'job': pa.schema([('id', pa.int32()), ('job', pa.string())]),
+    'department': pa.schema([('id', pa.int32()), ('department', pa.string())]),
+    'employee': pa.schema([
+        ('id', pa.int32()),
+        ('name', pa.string()),
+        ('datetime', pa.timestamp('us', tz='UTC')),
+        ('department_id', pa.int32()),
+        ('job_id', pa.int32()),
+    ]),
+}
+
+def get_parquet_prefix(file_type):
+    """Prefix of the Parquet files of a table."""
+    return f'backups/parquet/{file_type}/'
+
+def get_parquet_key(file_type, year=None):
+    """Key of the Parquet file of a table, or of one hire year for the employees."""
+    if file_type == 'employee':
+        partition = NULL_PARTITION if year is None else year
+        return f'{get_parquet_prefix(file_type)}year={partition}/part-0.parquet'
+    return f'{get_parquet_prefix(file_type)}part-0.parquet'
+
+def get_partition_year(s3_key):
+    """Hire year of an employees partition key, None for the partition without datetime."""
+    match = re.search(r'/year=([^/]+)/', s3_key)
+    if match is None or match.group(1) == NULL_PARTITION:
+        return None
+    return int(match.group(1))
+
+def iter_partitions(file_type, db_creator, batch_size):
+    """
+    Stream the rows of a table grouped by the Parquet file they belong to.
+
+    Yields:
+        tuple: The key of the file and an iterator of its rows.
+    """
+    if file_type == 'employee':
+        rows = db_creator.iter_data_by_hire_year(batch_size)
+        for year, partition_rows in itertools.groupby(rows, key=lambda row: row.hire_year):
+            yield get_parquet_key(file_type, year), partition_rows
+    else:
+        yield get_parquet_key(file_type), db_creator.iter_all_data(batch_size)
+
+def write_parquet_file(rows, schema, bucket, s3_key, row_group_size):
+    """
+    Write rows to a Parquet file in S3, one row group every `row_group_size` rows.
+
+    Args:
+        rows (iterable): Rows with the schema fields as attributes.
+        schema (pa.Schema): Arrow schema of the file.
+        bucket (str): Name of the bucket.
+        s3_key (str): Key of the file.
+        row_group_size (int): Rows of each row group, only one row group is kept in memory.
+
+    Returns:
+        int: The number of rows written.
+    """
+    rows = iter(rows)
+    rows_count = 0
+    part_size = config.backup_config['PART_SIZE_MB'] * 1024 * 1024
+    with S3MultipartWriter(bucket, s3_key, part_size=part_size) as s3_file:
+        writer = pq.ParquetWriter(s3_file, schema, compression='snappy', write_statistics=True)
+        try:
+            while True:
+                batch = list(itertools.islice(rows, row_group_size))
+                if not batch:
+                    break
+                columns = [pa.array([getattr(row, field.name) for row in batch], type=field.type)
+                           for field in schema]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema), row_group_size=row_group_size)
+                rows_count += len(batch)
+        finally:
+            writer.close()
+    return rows_count
+
+def backup_table_to_parquet(file_type, db_creator, bucket):
+    """
+    Back up a table to Parquet files in S3, the employees partitioned by hire year.
+
+    Files of a previous backup that are not written again (e.g. a year without
+    employees anymore) are deleted at the end.
+
+    Args:
+        file_type (str): The type of file being backed up (e.g., job, department, employee).
+        db_creator (Creator): DB creator used to read the table.
+        bucket (str): Name of the bucket.
+
+    Returns:
+        tuple: The number of rows and the keys of the written files.
+    """
+    previous_keys = set(list_s3_keys(bucket, get_parquet_prefix(file_type)))
+    written_keys = []
+    rows_count = 0
+    for s3_key, rows in iter_partitions(file_type, db_creator, config.backup_config['FETCH_SIZE']):
+        rows_count += write_parquet_file(rows, PARQUET_SCHEMAS[file_type], bucket, s3_key,
+                                         config.backup_config['ROW_GROUP_SIZE'])
+        written_keys.append(s3_key)
+    if not written_keys:
+        # An empty table still gets a file, so the restore finds it
+        s3_key = get_parquet_key(file_type)
+        write_parquet_file(iter(()), PARQUET_SCHEMAS[file_type], bucket, s3_key,
+                           config.backup_config['ROW_GROUP_SIZE'])
+        written_keys.append(s3_key)
+    stale_keys = previous_keys - set(written_keys)
+    if stale_keys:
+        delete_s3_keys(bucket, stale_keys)
+    logger.info(f"Parquet backup of {file_type}: {rows_count} rows in {len(written_keys)} files")
+    return rows_count, written_keys
+
+def select_row_groups(metadata, column_name, values):
+    """
+    Select the row groups whose statistics (min/max) of a column may contain any of the values.
+
+    Args:
+        metadata (pq.FileMetaData): Metadata of the Parquet file.
+        column_name (str): The filtered column.
+        values (list): The accepted values.
+
+    Returns:
+        list: The indexes of the row groups to read.
+    """
+    column_index = metadata.schema.names.index(column_name)
+    selected = []
+    for index in range(metadata.num_row_groups):
+        statistics = metadata.row_group(index).column(column_index).statistics
+        if statistics is None or not statistics.has_min_max:
+            # Without statistics the row group has to be read
+            selected.append(index)
+        elif any(statistics.min <= value <= statistics.max for value in values):
+            selected.append(index)
+    return selected
+
+def iter_row_group_batches(parquet_file, row_groups, columns, department_ids=None):
+    """
+    Read row groups of a Parquet file as batches of row tuples.
+
+    Args:
+        parquet_file (pq.ParquetFile): The open file.
+        row_groups (list): Indexes of the row groups to read.
+        columns (list): Columns of the tuples, in order.
+        department_ids (list): Only keep the rows of these departments.
+
+    Yields:
+        list: The rows of each row group as tuples following `columns`.
+    """
+    for index in row_groups:
+        table = parquet_file.read_row_group(index, columns=columns)
+        if department_ids:
+            table = table.filter(pc.is_in(table['department_id'], value_set=pa.array(department_ids, pa.int32())))
+        yield list(zip(*(table.column(column).to_pylist() for column in columns)))
+
+def restore_table_from_parquet(file_type, db_creator, bucket, years=None, department_ids=None):
+    """
+    Restore a table from its Parquet backup, reading only the data that matches the filters.
+
+    The year filter picks the partitions of the employees and the department
+    filter skips the row groups whose statistics can not contain the departments;
+    only the byte ranges of the selected row groups are downloaded.
+
+    Args:
+        file_type (str): The type of file (job/department/employee).
+        db_creator (Creator): DB creator used to load the rows.
+        bucket (str): Name of the bucket.
+        years (list): Hire years of the employees to restore, all by default.
+        department_ids (list): Departments of the employees to restore, all by default.
+
+    Returns:
+        tuple: The number of restored rows and the keys of the files read.
+    """
+    s3_keys = [key for key in list_s3_keys(bucket, get_parquet_prefix(file_type)) if key.endswith('.parquet')]
+    if not s3_keys:
+        raise FileNotFoundError(f"No Parquet backup for {file_type} in s3://{bucket}/{get_parquet_prefix(file_type)}")
+    if file_type != 'employee':
+        # The filters are over the employees
+        years = department_ids = None
+    if years:
+        s3_keys = [key for key in s3_keys if get_partition_year(key) in years]
+
+    restored = 0
+    read_row_groups = 0
+    total_row_groups = 0
+    bytes_read = 0
+    for s3_key in s3_keys:
+        reader = S3RangeReader(bucket, s3_key)
+        parquet_file = pq.ParquetFile(reader)
+        total_row_groups += parquet_file.metadata.num_row_groups
+        row_groups = list(range(parquet_file.metadata.num_row_groups))
+        if department_ids:
+            row_groups = select_row_groups(parquet_file.metadata, 'department_id', department_ids)
+        read_row_groups += len(row_groups)
+        restored += db_creator.load_rows(
+            iter_row_group_batches(parquet_file, row_groups, db_creator.columns, department_ids))
+        bytes_read += reader.bytes_read
+    logger.info(f"Parquet restore of {file_type}: {restored} rows from {len(s3_keys)} files, "
+                f"{read_row_groups} of {total_row_groups} row groups, {bytes_read} bytes read")
+    return restored, s3_keys
+
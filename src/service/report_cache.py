@@ -0,0 +1,284 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from model.data_version import DataVersion
+from service.sqlalchemy.engine import get_engine
+from config import config
+import threading
+import time
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+class DataVersionStore(ABC):
+    """
+    The DataVersionStore class declares where the data version of the report cache is kept.
+    `InMemoryDataVersionStore` keeps it in the process memory, `DatabaseDataVersionStore`
+    in the database, where every API worker and the ETL share it.
+    """
+
+    @abstractmethod
+    def get(self):
+        """
+        Method definition to get the current data version
+        """
+        pass
+
+    @abstractmethod
+    def bump(self):
+        """
+        Method definition to increment the data version and return the new one
+        """
+        pass
+
+    def is_replicated(self, session, version):
+        """
+        Whether the database a session reads from (e.g. a replica) has the data of a version.
+
+        A version kept out of the database can not be checked, every session is taken as current.
+        """
+        return True
+
+class InMemoryDataVersionStore(DataVersionStore):
+    """Data version kept in the current process, only its own loads invalidate its reports."""
+
+    def __init__(self):
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            return self._version
+
+    def bump(self):
+        with self._lock:
+            self._version += 1
+            return self._version
+
+class DatabaseDataVersionStore(DataVersionStore):
+    """
+    Data version kept in a row of data_challenge.data_version (migration 003), read
+    on the primary database so a bump is seen at once by every process.
+
+    Args:
+        engine (Engine): Engine of the database, the shared primary engine by default.
+        name (str): Name of the version row.
+    """
+
+    def __init__(self, engine=None, name='reports'):
+        self._engine = engine
+        self.name = name
+
+    @property
+    def engine(self):
+        return self._engine or get_engine()
+
+    def get(self):
+        with self.engine.connect() as connection:
+            version = connection.execute(
+                select(DataVersion.version).where(DataVersion.name == self.name)).scalar()
+        return version or 0
+
+    def bump(self):
+        # Upsert with ON CONFLICT, SQLite is only used by the tests
+        dialect_insert = sqlite.insert if self.engine.dialect.name == 'sqlite' else postgresql.insert
+        table = DataVersion.__table__
+        statement = dialect_insert(table).values(name=self.name, version=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=['name'], set_={'version': table.c.version + 1}
+        ).returning(table.c.version)
+        with self.engine.begin() as connection:
+            return connection.execute(statement).scalar()
+
+    def is_replicated(self, session, version):
+        # The row is bumped after the load commits, a replica that replayed it has the data of the load
+        replayed = session.execute(select(DataVersion.version).where(DataVersion.name == self.name)).scalar()
+        return (replayed or 0) >= version
+
+class ReportCache:
+    """
+    LRU cache of report results keyed on the report arguments and a data version.
+
+    Every change of the tables (upload, restore, truncate, ETL) bumps the data
+    version with `bump_data_version`, so the results computed before it are never
+    served again and age out of the cache. The version is kept in a
+    `DataVersionStore`; with a shared one the loads of any process invalidate the
+    reports of every process. Entries also expire after `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=300, enabled=True, version_store=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.version_store = version_store or InMemoryDataVersionStore()
+        # Last version read from the store
+        self.data_version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_key(self, endpoint, *args):
+        """
+        Build the cache key of a report for the current data version.
+
+        Args:
+            endpoint (str): Name of the report (e.g. the Flask endpoint).
+            *args: Report arguments (year, page, per_page, ...).
+
+        Returns:
+            tuple: The key of the report, with a None version if it could not be read.
+        """
+        return (endpoint, *args, self.current_version())
+
+    def current_version(self):
+        """
+        Read the data version of the store, dropping the entries of the older versions.
+
+        Returns:
+            int: The data version, None if the store could not be read (nothing is served
+                 from the cache then).
+        """
+        if not self.enabled:
+            return self.data_version
+        try:
+            version = self.version_store.get()
+        except Exception as e:
+            logger.warning(f"Could not read the report cache data version: {e}")
+            return None
+        with self._lock:
+            if version != self.data_version:
+                self.data_version = version
+                self._entries.clear()
+        return version
+
+    def is_current(self, key, session):
+        """
+        Check that the session a report runs on reads the data of the version of its key.
+
+        Call it before the report statements: a replica lagging behind the primary builds
+        the report from older data, which must not be cached under the new version.
+
+        Args:
+            key (tuple): Key built with `make_key`.
+            session (Session): The session of the report statements.
+
+        Returns:
+            bool: False if the version is not there yet or could not be read.
+        """
+        if not self.enabled or key[-1] is None:
+            return False
+        try:
+            return self.version_store.is_replicated(session, key[-1])
+        except Exception as e:
+            logger.warning(f"Could not read the report cache data version of the report database: {e}")
+            return False
+
+    def get(self, key):
+        """
+        Get a cached value, counting the hit or the miss.
+
+        Args:
+            key (tuple): Key built with `make_key`.
+
+        Returns:
+            Any: The cached value, None if it is not cached or it expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key) if self.enabled and key[-1] is not None else None
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """
+        Cache a value, evicting the least recently used entries above `max_entries`.
+
+        Args:
+            key (tuple): Key built with `make_key`.
+            value (Any): The value to cache.
+        """
+        if not self.enabled or self.max_entries <= 0 or key[-1] is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def bump_data_version(self):
+        """
+        Invalidate every cached report after a change of the data.
+
+        Returns:
+            int: The new data version, None if the store could not be updated.
+        """
+        try:
+            version = self.version_store.bump()
+        except Exception as e:
+            logger.error(f"Could not bump the report cache data version: {e}")
+            return None
+        with self._lock:
+            self.data_version = version
+            # Entries of older versions can not be hit anymore
+            self._entries.clear()
+            logger.debug(f"Report cache data version {self.data_version}")
+            return self.data_version
+
+    def stats(self):
+        """
+        Get the counters of the cache.
+
+        Returns:
+            dict: Size, limits, data version, hits, misses, evictions and hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'data_version': self.data_version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+# Process wide cache, created on first use
+_report_cache = None
+_cache_lock = threading.Lock()
+
+def get_report_cache():
+    """
+    Get the report cache of the process, creating it from the [report_cache] settings.
+
+    Returns:
+        ReportCache: The shared cache.
+    """
+    global _report_cache
+    with _cache_lock:
+        if _report_cache is None:
+            _report_cache = ReportCache(
+                max_entries=config.report_cache_config['MAX_ENTRIES'],
+                ttl_seconds=config.report_cache_config['TTL_SECONDS'],
+                enabled=config.report_cache_config['ENABLED'],
+                version_store=DatabaseDataVersionStore()
+                if config.report_cache_config['VERSION_STORE'] == 'database' else None,
+            )
+        return _report_cache
@@ -3,26 +3,28 @@ SQLAlchemy Database
 """
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
-from config import config
+from service.sqlalchemy.engine import get_database_uri, get_engine
 
 # Declarative base.
 Base = declarative_base()
-database_uri = (
-    f"{config.database_config['DATABASE_DIALECT']}://{config.database_config['DATABASE_USER']}:{config.database_config['DATABASE_PASSWORD']}"
-    f"@{config.database_config['DATABASE_HOST']}:{config.database_config['DATABASE_PORT']}/{config.database_config['DATABASE_NAME']}"
-)
+database_uri = get_database_uri()
 
-# Session local
-engine = create_engine(database_uri)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+# Session local, bound on first use to the engine shared with the API
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+def __getattr__(name):
+    # The models import Base from here, the engine is only created when it is used
+    if name == 'engine':
+        return get_engine(database_uri)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 @contextmanager
 def create_database_session():
     """Get database local session."""
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine(database_uri))
     try:
         yield db
     finally:
@@ -30,4 +32,4 @@ def create_database_session():
 
 def create_database_tables() -> None:
     """Creates a database from the models."""
-    Base.metadata.create_all(engine)
\ No newline at end of file
+    Base.metadata.create_all(get_engine(database_uri))
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""
+SQLAlchemy engine factory shared by the API (Flask-SQLAlchemy) and the scripts.
+
+The pool (size, overflow, timeout, pre-ping, recycle) and the statement timeout
+come from the [database] settings. The pool measures how long every checkout
+waits for a free connection, apart from the time to open new connections, so
+the requests queueing for the pool can be told apart from the ones waiting for
+PostgreSQL.
+"""
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from service.sqlalchemy.profiling import get_query_profiler
+from config import config
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+class PoolMetrics:
+    """
+    Counters of the waits for a connection of a pool.
+
+    A checkout is counted as waiting when it takes more than `slow_checkout_ms`,
+    i.e. every connection of the pool was in use. The connections the pool opens
+    (connect and TLS handshake) are counted apart, not as waits.
+    """
+
+    def __init__(self, slow_checkout_ms=100):
+        self.slow_checkout_ms = slow_checkout_ms
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.connects = 0
+        self.connect_errors = 0
+        self.connect_seconds_total = 0.0
+        self.connect_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait_seconds, timed_out=False):
+        """
+        Count one checkout of the pool.
+
+        Args:
+            wait_seconds (float): Time spent waiting for the connection.
+            timed_out (bool): The pool raised a timeout instead of returning a connection.
+        """
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+            if wait_seconds * 1000 >= self.slow_checkout_ms:
+                self.slow_checkouts += 1
+        if timed_out or wait_seconds * 1000 >= self.slow_checkout_ms:
+            logger.warning(f"Waited {wait_seconds * 1000:.1f} ms for a database connection"
+                           f"{' and timed out' if timed_out else ''}")
+
+    def record_connect(self, seconds, failed=False):
+        """
+        Count one new connection opened by the pool.
+
+        Args:
+            seconds (float): Time spent opening the connection.
+            failed (bool): The connection could not be opened.
+        """
+        with self._lock:
+            if failed:
+                self.connect_errors += 1
+            else:
+                self.connects += 1
+            self.connect_seconds_total += seconds
+            self.connect_seconds_max = max(self.connect_seconds_max, seconds)
+
+    def stats(self):
+        """
+        Get the counters of the pool.
+
+        Returns:
+            dict: Checkouts, slow checkouts, timeouts and the total, mean and max wait in ms,
+                  and the connections opened, failed and the total, mean and max connect time in ms.
+        """
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            connect_attempts = self.connects + self.connect_errors
+            return {
+                'checkouts': self.checkouts,
+                'slow_checkouts': self.slow_checkouts,
+                'slow_checkout_ms': self.slow_checkout_ms,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_seconds_total * 1000, 3),
+                'wait_ms_mean': round(self.wait_seconds_total * 1000 / attempts, 3) if attempts else 0.0,
+                'wait_ms_max': round(self.wait_seconds_max * 1000, 3),
+                'connects': self.connects,
+                'connect_errors': self.connect_errors,
+                'connect_ms_total': round(self.connect_seconds_total * 1000, 3),
+                'connect_ms_mean': round(self.connect_seconds_total * 1000 / connect_attempts, 3)
+                if connect_attempts else 0.0,
+                'connect_ms_max': round(self.connect_seconds_max * 1000, 3),
+            }
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records in `metrics` the time every checkout waits for a free
+    connection and, apart, the time it takes to open the new ones.
+    """
+
+    def __init__(self, creator, metrics=None, **kwargs):
+        super().__init__(creator, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+        # Seconds the current checkout of every thread spent opening connections
+        self._connecting = threading.local()
+
+    def _do_get(self):
+        self._connecting.seconds = 0.0
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_checkout(time.perf_counter() - start - self._connecting.seconds, timed_out=True)
+            raise
+        # Below the pool size the checkout opens a connection, that is not a wait
+        self.metrics.record_checkout(time.perf_counter() - start - self._connecting.seconds)
+        return connection
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        failed = True
+        try:
+            connection = super()._create_connection()
+            failed = False
+            return connection
+        finally:
+            seconds = time.perf_counter() - start
+            self._connecting.seconds = getattr(self._connecting, 'seconds', 0.0) + seconds
+            self.metrics.record_connect(seconds, failed=failed)
+
+    def recreate(self):
+        # dispose() recreates the pool, the counters are kept
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+# SQLAlchemy logs the pool events on a child of this module logger, keep them at its default level
+logging.getLogger(f"{__name__}.{InstrumentedQueuePool.__name__}").setLevel(logging.WARNING)
+
+def get_database_uri():
+    """
+    Build the database URI from the [database] settings.
+
+    Returns:
+        str: The SQLAlchemy URI of the database.
+    """
+    return (
+        f"{config.database_config['DATABASE_DIALECT']}://{config.database_config['DATABASE_USER']}:{config.database_config['DATABASE_PASSWORD']}"
+        f"@{config.database_config['DATABASE_HOST']}:{config.database_config['DATABASE_PORT']}/{config.database_config['DATABASE_NAME']}"
+    )
+
+def get_engine_options(url):
+    """
+    Get the create_engine arguments of the [database] pool settings for a database.
+
+    SQLite keeps the pool of its dialect; the statement and connect timeouts only apply to PostgreSQL.
+
+    Args:
+        url (str|URL): URI of the database.
+
+    Returns:
+        dict: The keyword arguments of create_engine.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config.database_config['POOL_SIZE'],
+        'max_overflow': config.database_config['MAX_OVERFLOW'],
+        'pool_timeout': config.database_config['POOL_TIMEOUT'],
+        'pool_pre_ping': config.database_config['POOL_PRE_PING'],
+        'pool_recycle': config.database_config['POOL_RECYCLE'],
+        'metrics': PoolMetrics(config.database_config['SLOW_CHECKOUT_MS']),
+    }
+    connect_args = {}
+    statement_timeout = config.database_config['STATEMENT_TIMEOUT_MS']
+    if url.get_backend_name() == 'postgresql' and statement_timeout > 0:
+        connect_args['options'] = f"-c statement_timeout={statement_timeout}"
+    # An unreachable host (e.g. a replica checked in a request) fails after it, not after the TCP timeout
+    connect_timeout = config.database_config['CONNECT_TIMEOUT']
+    if url.get_backend_name() == 'postgresql' and connect_timeout > 0:
+        connect_args['connect_timeout'] = connect_timeout
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+def create_db_engine(url=None):
+    """
+    Create an engine with the [database] pool settings, profiled when [profiling] is enabled.
+
+    Args:
+        url (str|URL): URI of the database, the one of the [database] settings by default.
+
+    Returns:
+        Engine: The new engine.
+    """
+    url = url or get_database_uri()
+    engine = create_engine(url, **get_engine_options(url))
+    # Opt-in statement profiling, see the [profiling] settings
+    profiler = get_query_profiler()
+    if profiler is not None:
+        profiler.attach(engine)
+    return engine
+
+# Engines of the process by URI, shared by the API and the scripts
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(url=None):
+    """
+    Get the engine of a database, creating it on first use.
+
+    Args:
+        url (str|URL): URI of the database, the one of the [database] settings by default.
+
+    Returns:
+        Engine: The shared engine.
+    """
+    url = make_url(url or get_database_uri())
+    key = url.render_as_string(hide_password=False)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_db_engine(url)
+        return _engines[key]
+
+def dispose_engines():
+    """
+    Drop the connections inherited from the parent process, e.g. after a gunicorn fork.
+
+    The pools are replaced without closing the inherited connections, which are
+    still used by the parent; every engine opens new connections on first use.
+    """
+    with _engines_lock:
+        engines = list(_engines.values())
+    for engine in engines:
+        engine.dispose(close=False)
+    logger.info(f"Disposed {len(engines)} engines after fork")
+
+def get_pool_stats():
+    """
+    Get the state and the checkout wait counters of the pools of the shared engines.
+
+    Returns:
+        dict: One entry by database (password hidden) with the pool status and its metrics.
+    """
+    with _engines_lock:
+        engines = list(_engines.values())
+    stats = {}
+    for engine in engines:
+        pool = engine.pool
+        entry = {'pool': type(pool).__name__, 'status': pool.status()}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+            })
+        if isinstance(pool, InstrumentedQueuePool):
+            entry['metrics'] = pool.metrics.stats()
+        stats[engine.url.render_as_string(hide_password=True)] = entry
+    return stats
@@ -0,0 +1,248 @@
+"""
+Profiling of the SQL statements run by the shared engines (reports, DAO creators, scripts).
+
+Opt-in with the `enabled` setting of the [profiling] section: the cursor events
+of every engine created by `create_db_engine` record the latency and the rows
+of each statement, grouped by statement text (the parameters are bound, so the
+calls of a query with other values share an entry). Statements slower than
+`slow_query_ms` are logged, and with `explain_slow` the plan of a slow SELECT
+(EXPLAIN (ANALYZE, BUFFERS) on PostgreSQL) is captured once per statement.
+The COPY loads of the DAO creators run on the driver cursor, without cursor
+events, and are recorded by the creators themselves with `observe`.
+GET /admin/queries returns the summary.
+
+Profiling is passive: a failure of the profiler never fails the statement.
+"""
+import re
+import threading
+import time
+from sqlalchemy import event
+from config import config
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Entry of the statements received once the profiler holds `max_statements`
+OTHER_STATEMENTS = '(other statements)'
+
+# Prefix of the plans by dialect, the other dialects are not explained
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (ANALYZE, BUFFERS) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+def normalize_statement(statement):
+    """Statement text with its whitespace collapsed, the key of its entry."""
+    return re.sub(r'\s+', ' ', statement).strip()
+
+class QueryProfiler:
+    """
+    Latency and row counters of the statements of the engines it is attached to.
+
+    Args:
+        slow_query_ms (int): Statements that take longer are logged (and explained).
+        explain_slow (bool): Capture the plan of the slow SELECT statements.
+        max_statements (int): Distinct statements kept, the next ones are added up in one entry.
+    """
+
+    def __init__(self, slow_query_ms=500, explain_slow=False, max_statements=200):
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow = explain_slow
+        self.max_statements = max_statements
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        """
+        Listen to the cursor events of an engine.
+
+        Args:
+            engine (Engine): The engine to profile.
+        """
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.listen(engine, 'handle_error', self.handle_error)
+
+    def detach(self, engine):
+        """Stop listening to the cursor events of an engine."""
+        event.remove(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self.after_cursor_execute)
+        event.remove(engine, 'handle_error', self.handle_error)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        # -1 when the driver does not know it (e.g. SELECT on SQLite)
+        rows = max(cursor.rowcount, 0) if cursor.rowcount is not None else 0
+        entry, slow = self.observe(statement, elapsed_ms, rows)
+        if slow and self.explain_slow and entry is not None and entry['plan'] is None \
+                and self.is_explainable(statement, context):
+            entry['plan'] = self.explain(conn, statement, parameters)
+
+    def handle_error(self, exception_context):
+        # A failed statement has no after_cursor_execute, its start is not left on the pooled connection
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+    def observe(self, statement, elapsed_ms, rows):
+        """
+        Record one execution of a statement and log it when it is slow.
+
+        Args:
+            statement (str): The SQL statement.
+            elapsed_ms (float): Time of the execution.
+            rows (int): Rows returned or changed.
+
+        Returns:
+            tuple: The entry of the statement (None for the other statements) and whether it was slow.
+        """
+        slow = elapsed_ms >= self.slow_query_ms
+        entry = self.record(statement, elapsed_ms, rows, slow)
+        if slow:
+            logger.warning(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows): {normalize_statement(statement)[:500]}")
+        return entry, slow
+
+    def record(self, statement, elapsed_ms, rows, slow=False):
+        """
+        Add one execution to the entry of its statement.
+
+        Args:
+            statement (str): The SQL statement.
+            elapsed_ms (float): Time of the execution.
+            rows (int): Rows returned or changed.
+            slow (bool): The execution was above `slow_query_ms`.
+
+        Returns:
+            dict: The entry of the statement.
+        """
+        key = normalize_statement(statement)
+        with self._lock:
+            if key not in self._statements and len(self._statements) >= self.max_statements:
+                key = OTHER_STATEMENTS
+            entry = self._statements.setdefault(key, {
+                'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'slow_calls': 0, 'plan': None})
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['rows'] += rows
+            entry['slow_calls'] += int(slow)
+        return entry if key != OTHER_STATEMENTS else None
+
+    @staticmethod
+    def is_explainable(statement, context):
+        """Only the SELECT statements (reports) are explained, never the streamed ones (backups)."""
+        if context is not None and context.execution_options.get('stream_results'):
+            return False
+        return normalize_statement(statement).upper().startswith(('SELECT', 'WITH'))
+
+    def explain(self, conn, statement, parameters):
+        """
+        Get the plan of a statement on the connection that ran it.
+
+        On PostgreSQL EXPLAIN ANALYZE runs the statement again, inside a savepoint
+        so a failure does not abort the transaction of the request.
+
+        Args:
+            conn (Connection): The connection of the statement.
+            statement (str): The SQL statement.
+            parameters: Its DBAPI parameters.
+
+        Returns:
+            str: The plan, one line by step, or None if it could not be captured.
+        """
+        prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None:
+            return None
+        dbapi_connection = conn.connection.dbapi_connection
+        use_savepoint = conn.dialect.name == 'postgresql' and not getattr(dbapi_connection, 'autocommit', False)
+        cursor = dbapi_connection.cursor()
+        try:
+            if use_savepoint:
+                cursor.execute("SAVEPOINT query_profiler_explain")
+            cursor.execute(prefix + statement, parameters)
+            plan = '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+            if use_savepoint:
+                cursor.execute("RELEASE SAVEPOINT query_profiler_explain")
+            return plan
+        except Exception as e:
+            logger.warning(f"Could not explain the slow query: {e}")
+            if use_savepoint:
+                try:
+                    cursor.execute("ROLLBACK TO SAVEPOINT query_profiler_explain")
+                except Exception as rollback_error:
+                    # The statement of the request already succeeded, its transaction reports the error if any
+                    logger.error(f"Could not roll back the plan of the slow query: {rollback_error}")
+            return None
+        finally:
+            cursor.close()
+
+    def summary(self, limit=20):
+        """
+        Get the statements that took the most time.
+
+        Args:
+            limit (int): Statements returned.
+
+        Returns:
+            dict: The settings and, by total time, the calls, total, mean and max ms,
+                  rows, slow calls and captured plan of every statement.
+        """
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+            return {
+                'slow_query_ms': self.slow_query_ms,
+                'explain_slow': self.explain_slow,
+                'distinct_statements': len(self._statements),
+                'statements': [
+                    {
+                        'statement': statement,
+                        'calls': entry['calls'],
+                        'total_ms': round(entry['total_ms'], 3),
+                        'mean_ms': round(entry['total_ms'] / entry['calls'], 3),
+                        'max_ms': round(entry['max_ms'], 3),
+                        'rows': entry['rows'],
+                        'slow_calls': entry['slow_calls'],
+                        'plan': entry['plan'],
+                    }
+                    for statement, entry in statements[:limit]
+                ],
+            }
+
+    def reset(self):
+        """Drop the counters and the plans."""
+        with self._lock:
+            self._statements.clear()
+
+# Profiler of the process, created on first use
+_query_profiler = None
+_profiler_lock = threading.Lock()
+
+def get_query_profiler():
+    """
+    Get the query profiler of the process, created from the [profiling] settings.
+
+    Returns:
+        QueryProfiler: The shared profiler, None when profiling is disabled.
+    """
+    global _query_profiler
+    if not config.profiling_config['ENABLED']:
+        return None
+    with _profiler_lock:
+        if _query_profiler is None:
+            _query_profiler = QueryProfiler(
+                slow_query_ms=config.profiling_config['SLOW_QUERY_MS'],
+                explain_slow=config.profiling_config['EXPLAIN_SLOW'],
+                max_statements=config.profiling_config['MAX_STATEMENTS'],
+            )
+        return _query_profiler
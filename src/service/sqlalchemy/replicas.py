@@ -0,0 +1,200 @@
+"""
+Routing of the read-only queries (reports, backups) to read replicas.
+
+The replicas are listed in the `replica_urls` setting of the [database] section.
+Every replica is checked (SELECT 1, and the replication lag on PostgreSQL) at
+most once every `replica_check_seconds`; the reads go round robin to the healthy
+ones and to the primary when none is healthy. Writes always go to the primary.
+The check connects with the `connect_timeout` of the engines, an unreachable
+replica holds a request for that long at most.
+"""
+import itertools
+import threading
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from flask_sqlalchemy.query import Query
+from service.sqlalchemy.engine import get_database_uri, get_engine
+from config import config
+import logging
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+class ReplicaRouter:
+    """
+    Pick the engine of the read-only queries among the replicas and the primary.
+
+    Args:
+        primary_url (str): URI of the primary database.
+        replica_urls (list): URIs of the replicas, without replicas every read goes to the primary.
+        check_seconds (int): Seconds a health check result is trusted.
+        max_lag_seconds (int): Replicas further behind the primary are taken as unhealthy, 0 disables it.
+    """
+
+    def __init__(self, primary_url, replica_urls=(), check_seconds=30, max_lag_seconds=30):
+        self.primary_url = primary_url
+        self.replica_urls = list(replica_urls)
+        self.check_seconds = check_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.primary_reads = 0
+        self._replicas = {url: {'healthy': None, 'checked_at': None, 'reads': 0, 'error': None}
+                          for url in self.replica_urls}
+        self._next_replica = itertools.cycle(self.replica_urls) if self.replica_urls else None
+        self._lock = threading.Lock()
+
+    @property
+    def primary_engine(self):
+        return get_engine(self.primary_url)
+
+    def check_replica(self, url):
+        """
+        Run the health check of a replica and keep its result.
+
+        Args:
+            url (str): URI of the replica.
+
+        Returns:
+            bool: True if the replica answers and is not lagging behind.
+        """
+        error = None
+        try:
+            with get_engine(url).connect() as connection:
+                connection.execute(text("SELECT 1"))
+                if self.max_lag_seconds and connection.dialect.name == 'postgresql':
+                    lag = connection.execute(text(
+                        "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)")).scalar()
+                    if lag > self.max_lag_seconds:
+                        error = f"replication lag of {lag:.0f} seconds"
+        except Exception as e:
+            error = str(e).splitlines()[0]
+        with self._lock:
+            state = self._replicas[url]
+            if error is not None and state['healthy'] is not False:
+                logger.warning(f"Replica {get_engine(url).url} is unhealthy: {error}")
+            state.update({'healthy': error is None, 'checked_at': time.monotonic(), 'error': error})
+        return error is None
+
+    def is_healthy(self, url):
+        """Health of a replica, checked again when the last result is older than `check_seconds`."""
+        with self._lock:
+            state = self._replicas[url]
+            checked_at = state['checked_at']
+            if checked_at is not None and time.monotonic() - checked_at < self.check_seconds:
+                return state['healthy']
+        return self.check_replica(url)
+
+    def get_read_engine(self):
+        """
+        Get the engine of the read-only queries of the next session.
+
+        Returns:
+            Engine: A healthy replica (round robin), the primary when there is none.
+        """
+        for _ in range(len(self.replica_urls)):
+            with self._lock:
+                url = next(self._next_replica)
+            if self.is_healthy(url):
+                with self._lock:
+                    self._replicas[url]['reads'] += 1
+                return get_engine(url)
+        with self._lock:
+            self.primary_reads += 1
+        return self.primary_engine
+
+    def stats(self):
+        """
+        Get the state of the replicas.
+
+        Returns:
+            dict: The reads sent to the primary and, by replica (password hidden), its health,
+                  last error, seconds since the last check and reads.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'primary_reads': self.primary_reads,
+                'replicas': {
+                    get_engine(url).url.render_as_string(hide_password=True): {
+                        'healthy': state['healthy'],
+                        'error': state['error'],
+                        'seconds_since_check': round(now - state['checked_at'], 1) if state['checked_at'] else None,
+                        'reads': state['reads'],
+                    }
+                    for url, state in self._replicas.items()
+                },
+            }
+
+class RoutingSession(Session):
+    """
+    Session that sends its SELECT statements to `router.get_read_engine()`.
+
+    The read engine is picked on the first SELECT and kept until the session is
+    closed (`close()`, or `remove()` of the scoped session), so the statements of a
+    request (e.g. the items and the count of `paginate()`) see the same replica and
+    hold one connection. Flushes and any other statement (INSERT, UPDATE, DELETE,
+    DDL, text) use the primary. Its queries have the `paginate()` of
+    Flask-SQLAlchemy, as the ones of db.session.
+    """
+
+    def __init__(self, router, **kwargs):
+        kwargs.setdefault('query_cls', Query)
+        super().__init__(**kwargs)
+        self.router = router
+        self._read_engine = None
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if not self._flushing and getattr(clause, 'is_select', False):
+            if self._read_engine is None:
+                self._read_engine = self.router.get_read_engine()
+            return self._read_engine
+        return self.router.primary_engine
+
+    def close(self):
+        super().close()
+        # The next request picks a replica again
+        self._read_engine = None
+
+# Router and read session of the process, created on first use
+_replica_router = None
+_read_session = None
+_router_lock = threading.Lock()
+
+def get_replica_router():
+    """
+    Get the replica router of the process, created from the [database] settings.
+
+    Returns:
+        ReplicaRouter: The shared router.
+    """
+    global _replica_router
+    with _router_lock:
+        if _replica_router is None:
+            _replica_router = ReplicaRouter(
+                get_database_uri(),
+                replica_urls=config.database_config['REPLICA_URLS'],
+                check_seconds=config.database_config['REPLICA_CHECK_SECONDS'],
+                max_lag_seconds=config.database_config['REPLICA_MAX_LAG_SECONDS'],
+            )
+        return _replica_router
+
+def get_read_session():
+    """
+    Get the thread-local session of the read-only queries, routed by the replica router.
+
+    Call `remove()` on it at the end of every request to give its connections back.
+
+    Returns:
+        scoped_session: The shared read session.
+    """
+    global _read_session
+    router = get_replica_router()
+    with _router_lock:
+        if _read_session is None:
+            _read_session = scoped_session(sessionmaker(class_=RoutingSession, router=router,
+                                                        autoflush=False))
+        return _read_session
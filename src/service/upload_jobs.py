@@ -0,0 +1,235 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import insert, select, update
+from model.upload_job import UploadJob
+from service.sqlalchemy.engine import get_engine
+from config import config
+import datetime
+import logging
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+logging.basicConfig(
+    format="{asctime} - {levelname} - {message}",
+    style="{",
+    datefmt="%Y-%m-%d %H:%M",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+class UploadQueueFullError(Exception):
+    """Raised when the upload worker pool can not accept more jobs."""
+
+class UploadJobRegistry(ABC):
+    """
+    The UploadJobRegistry class declares where the status of the upload jobs is kept.
+    Subclasses can store it in any shared storage; `InMemoryUploadJobRegistry`
+    keeps it in the process memory and `DatabaseUploadJobRegistry` in the database.
+    """
+
+    @abstractmethod
+    def create(self, job):
+        """
+        Method definition to store a new job (dictionary with a `job_id` key)
+        """
+        pass
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        """
+        Method definition to update the fields of a job
+        """
+        pass
+
+    @abstractmethod
+    def get(self, job_id):
+        """
+        Method definition to get a copy of a job, None if it does not exist
+        """
+        pass
+
+class InMemoryUploadJobRegistry(UploadJobRegistry):
+    """Upload job registry kept in a dictionary of the current process."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job['job_id']] = dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+class DatabaseUploadJobRegistry(UploadJobRegistry):
+    """
+    Upload job registry kept in data_challenge.upload_jobs (migration 004), on the
+    primary database. The job runs in the worker that accepted the upload, any
+    worker answers its status.
+
+    Args:
+        engine (Engine): Engine of the database, the shared primary engine by default.
+    """
+
+    def __init__(self, engine=None):
+        self._engine = engine
+
+    @property
+    def engine(self):
+        return self._engine or get_engine()
+
+    def create(self, job):
+        with self.engine.begin() as connection:
+            connection.execute(insert(UploadJob.__table__).values(**job))
+
+    def update(self, job_id, **fields):
+        with self.engine.begin() as connection:
+            connection.execute(update(UploadJob.__table__).where(UploadJob.job_id == job_id).values(**fields))
+
+    def get(self, job_id):
+        with self.engine.connect() as connection:
+            row = connection.execute(select(UploadJob.__table__).where(UploadJob.job_id == job_id)).mappings().first()
+        return dict(row) if row else None
+
+class UploadJobManager:
+    """
+    Run upload jobs on a bounded pool of background threads.
+
+    The uploaded file is spooled to a local file, the job is registered as
+    `queued` and a worker runs it inside the Flask application context, updating
+    the registry with the progress reported by the job.
+    """
+
+    def __init__(self, registry=None, max_workers=2, max_pending=10, spool_dir=None):
+        self.registry = registry or InMemoryUploadJobRegistry()
+        self.spool_dir = spool_dir or None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload-job")
+        # Running plus queued jobs
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, file, file_type, run):
+        """
+        Spool a file and queue the job that processes it.
+
+        Args:
+            file (FileStorage): The uploaded file.
+            file_type (str): The type of file being uploaded (e.g., job, department, employee).
+            run (callable): Called as run(spool_path, progress) by the worker, returns the final totals.
+
+        Returns:
+            dict: The registered job.
+
+        Raises:
+            UploadQueueFullError: If all the workers are busy and the queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise UploadQueueFullError("Too many upload jobs in progress, try again later")
+        try:
+            spool_fd, spool_path = tempfile.mkstemp(suffix=".csv", prefix="upload_", dir=self.spool_dir)
+            with os.fdopen(spool_fd, "wb") as spool_file:
+                file.save(spool_file)
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'file_type': file_type,
+                'file_name': file.filename,
+                'status': 'queued',
+                'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'total_rows': 0,
+                'valid_rows': 0,
+                'invalid_rows': 0,
+                'inserted_rows': 0,
+                's3_file_path': '',
+                'error': None,
+                'started': None,
+                'finished': None,
+            }
+            self.registry.create(job)
+            app = current_app._get_current_object()
+            self._executor.submit(self._run, app, job['job_id'], spool_path, run)
+        except Exception:
+            self._slots.release()
+            raise
+        logger.info(f"Upload job {job['job_id']} queued for {file.filename}")
+        return job
+
+    def _run(self, app, job_id, spool_path, run):
+        try:
+            self.registry.update(job_id, status='running', started=time.time())
+            with app.app_context():
+                result = run(spool_path, lambda **totals: self.registry.update(job_id, **totals))
+            self.registry.update(job_id, status='finished', finished=time.time(), **result)
+            logger.info(f"Upload job {job_id} finished")
+        except Exception as e:
+            self.registry.update(job_id, status='failed', finished=time.time(), error=str(e))
+            logger.error(f"Upload job {job_id} failed: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            os.remove(spool_path)
+            self._slots.release()
+
+    def get(self, job_id):
+        """
+        Get the status of a job with its elapsed time.
+
+        Args:
+            job_id (str): The id returned when the job was submitted.
+
+        Returns:
+            dict: The job status, None if the job does not exist.
+        """
+        job = self.registry.get(job_id)
+        if job is None:
+            return None
+        started, finished = job.pop('started'), job.pop('finished')
+        elapsed = 0.0
+        if started:
+            elapsed = (finished or time.time()) - started
+        job['elapsed_seconds'] = round(elapsed, 3)
+        return job
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool, waiting for the running jobs by default."""
+        self._executor.shutdown(wait=wait)
+
+# Process wide manager, created on first use
+_upload_job_manager = None
+_manager_lock = threading.Lock()
+
+def get_upload_job_manager():
+    """
+    Get the upload job manager of the process, creating it from the [upload] settings.
+
+    Returns:
+        UploadJobManager: The shared manager.
+    """
+    global _upload_job_manager
+    with _manager_lock:
+        if _upload_job_manager is None:
+            _upload_job_manager = UploadJobManager(
+                registry=DatabaseUploadJobRegistry() if config.upload_config['JOB_REGISTRY'] == 'database' else None,
+                max_workers=config.upload_config['JOB_WORKERS'],
+                max_pending=config.upload_config['JOB_MAX_PENDING'],
+                spool_dir=config.upload_config['SPOOL_DIR'],
+            )
+        return _upload_job_manager
+
+def set_upload_job_registry(registry):
+    """
+    Replace the registry used to keep the upload job status (e.g. a shared store or a test stand-in).
+
+    Args:
+        registry (UploadJobRegistry): The registry to use.
+    """
+    get_upload_job_manager().registry = registry
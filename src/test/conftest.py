@@ -7,6 +7,18 @@ def create_app():
     app = Flask(__name__)
     return app
 
+@pytest.fixture(autouse=True)
+def in_memory_shared_state(monkeypatch):
+    """Keep the report cache data version, the upload jobs and the metrics in memory, away from the configured database."""
+    from config import config
+    import service.report_cache as report_cache
+    import service.upload_jobs as upload_jobs
+    monkeypatch.setitem(config.report_cache_config, 'VERSION_STORE', 'memory')
+    monkeypatch.setattr(report_cache, '_report_cache', None)
+    monkeypatch.setitem(config.upload_config, 'JOB_REGISTRY', 'memory')
+    monkeypatch.setattr(upload_jobs, '_upload_job_manager', None)
+    monkeypatch.setitem(config.metrics_config, 'MULTIPROCESS_DIR', '')
+
 @pytest.fixture
 def client():
     app = create_app()
@@ -15,10 +27,29 @@ def client():
 
 @pytest.fixture
 def mock_db_creators():
-    """Mock the DB_CREATORS for testing."""
+    """Mock the DB creators for testing."""
     return {
         "job": MagicMock(),
         "department": MagicMock(),
         "employee": MagicMock(),
         "reports": MagicMock()
-    }
\ No newline at end of file
+    }
+
+@pytest.fixture
+def sqlite_session():
+    """SQLAlchemy session over an in-memory SQLite with the data_challenge schema attached."""
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import Session
+    from service.sqlalchemy.database import Base
+    import model.job, model.deparment, model.employee, model.hiring_summary, model.data_version, model.upload_job  # noqa: F401 register the tables
+
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def attach_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS data_challenge")
+
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
@@ -0,0 +1,82 @@
+import pandas as pd
+from unittest.mock import MagicMock, patch
+from model.job import Job
+from model.employee import Employee
+from dao.jobs_db_creator import Jobs_Db_Creator
+from dao.employees_db_creator import Employees_Db_Creator
+from service.sqlalchemy.profiling import QueryProfiler
+
+def mock_postgres_session():
+    """Mock a session whose connection is a psycopg2 PostgreSQL connection."""
+    mock_conn = MagicMock()
+    connection = mock_conn.connection.return_value
+    connection.dialect.name = "postgresql"
+    connection.dialect.driver = "psycopg2"
+    connection.dialect.identifier_preparer.quote.side_effect = lambda name: name
+    connection.dialect.identifier_preparer.format_table.side_effect = lambda table: table.fullname
+    copied = []
+    cursor = connection.connection.driver_connection.cursor.return_value
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.append((sql, buffer.read()))
+    return mock_conn, copied
+
+def test_bulk_insert_data_uses_copy_on_postgres():
+    mock_conn, copied = mock_postgres_session()
+    df_data = pd.DataFrame({'column1': [1, 2, 3], 'column2': ['Software Engineer', None, '']})
+
+    creator = Jobs_Db_Creator(mock_conn)
+    creator.batch_size = 2
+    inserted = creator.bulk_insert_data(df_data, headers=False)
+
+    assert inserted == 3
+    assert mock_conn.commit.call_count == 1
+    assert mock_conn.add.call_count == 0
+    # One COPY per batch, NULL and empty strings are kept apart
+    assert [sql for sql, _ in copied] == [
+        "COPY data_challenge.jobs (id, job) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    ] * 2
+    assert [data for _, data in copied] == ["1,Software Engineer\n2,\\N\n", "3,\n"]
+
+def test_copy_batches_are_profiled():
+    mock_conn, copied = mock_postgres_session()
+    profiler = QueryProfiler(slow_query_ms=10000)
+    creator = Jobs_Db_Creator(mock_conn)
+    creator.batch_size = 2
+
+    with patch('dao.creator.get_query_profiler', return_value=profiler):
+        creator.bulk_insert_data(pd.DataFrame({'column1': [1, 2, 3], 'column2': ['a', 'b', 'c']}), headers=False)
+
+    entry = profiler.summary()['statements'][0]
+    assert entry['statement'].startswith('COPY data_challenge.jobs (id, job) FROM STDIN')
+    assert (entry['calls'], entry['rows']) == (2, 3)
+
+def test_bulk_insert_data_executemany_fallback(sqlite_session):
+    df_data = pd.DataFrame([
+        {'id': 1, 'name': 'Alice', 'datetime': '2021-01-01T00:00:00Z', 'department_id': 1, 'job_id': 2},
+        {'id': 2, 'name': 'Bob', 'datetime': '2021-04-01T00:00:00Z', 'department_id': 3, 'job_id': 4}
+    ])
+
+    inserted = Employees_Db_Creator(sqlite_session).bulk_insert_data(df_data, headers=True)
+
+    assert inserted == 2
+    rows = sqlite_session.query(Employee).order_by(Employee.id).all()
+    assert [(row.id, row.name, row.department_id, row.job_id) for row in rows] == [
+        (1, 'Alice', 1, 2), (2, 'Bob', 3, 4)
+    ]
+
+def test_insert_data_orm_flag():
+    mock_conn = MagicMock()
+    df_data = pd.DataFrame({'id': [1], 'job': ['Developer']})
+
+    Jobs_Db_Creator(mock_conn).insert_data(df_data, headers=True, use_orm=True)
+
+    assert mock_conn.add.call_count == 1
+    assert isinstance(mock_conn.add.call_args[0][0], Job)
+    assert not mock_conn.connection.called
+
+def test_iter_all_data_streams_rows_in_primary_key_order(sqlite_session):
+    creator = Jobs_Db_Creator(sqlite_session)
+    creator.insert_data(pd.DataFrame({'id': [3, 1, 2], 'job': ['C', 'A', 'B']}), headers=True)
+
+    rows = list(creator.iter_all_data(batch_size=2))
+
+    assert [(row.id, row.job) for row in rows] == [(1, 'A'), (2, 'B'), (3, 'C')]
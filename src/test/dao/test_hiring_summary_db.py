@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+from sqlalchemy import select, update
+from dao.employees_db_creator import Employees_Db_Creator
+from dao.hiring_summary_db import Hiring_Summary_Db
+from model.hiring_summary import HiringSummary
+
+EMPLOYEES = pd.DataFrame([
+    {'id': 1, 'name': 'Alice', 'datetime': '2021-01-15T10:00:00Z', 'department_id': 1, 'job_id': 1},
+    {'id': 2, 'name': 'Bob', 'datetime': '2021-03-31T23:59:59Z', 'department_id': 1, 'job_id': 1},
+    {'id': 3, 'name': 'Carol', 'datetime': '2021-04-01T00:00:00Z', 'department_id': 1, 'job_id': 2},
+    {'id': 4, 'name': 'Dave', 'datetime': '2022-01-01T00:00:00Z', 'department_id': 3, 'job_id': 1},
+])
+
+def get_summary(session):
+    return session.execute(select(
+        HiringSummary.year, HiringSummary.quarter, HiringSummary.department_id,
+        HiringSummary.job_id, HiringSummary.hired).order_by(*HiringSummary.__table__.primary_key)).all()
+
+@pytest.mark.parametrize("use_orm", [False, True])
+def test_insert_employees_updates_the_summary(sqlite_session, use_orm):
+    creator = Employees_Db_Creator(sqlite_session)
+    creator.insert_data(EMPLOYEES.iloc[:2], headers=True, use_orm=use_orm)
+    creator.insert_data(EMPLOYEES.iloc[2:], headers=True, use_orm=use_orm)
+
+    assert get_summary(sqlite_session) == [
+        (2021, 1, 1, 1, 2),
+        (2021, 2, 1, 2, 1),
+        (2022, 1, 3, 1, 1),
+    ]
+    assert Hiring_Summary_Db(sqlite_session).check_consistency() == []
+
+def test_rebuild_and_check_consistency(sqlite_session):
+    Employees_Db_Creator(sqlite_session).insert_data(EMPLOYEES, headers=True)
+    summary_db = Hiring_Summary_Db(sqlite_session)
+    sqlite_session.execute(update(HiringSummary).where(HiringSummary.year == 2021, HiringSummary.quarter == 1)
+                           .values(hired=5))
+
+    assert summary_db.check_consistency(2022) == []
+    assert summary_db.check_consistency() == [
+        {'year': 2021, 'quarter': 1, 'department_id': 1, 'job_id': 1, 'expected': 2, 'stored': 5}
+    ]
+    assert summary_db.rebuild() == 3
+    assert summary_db.check_consistency() == []
+    assert get_summary(sqlite_session)[0] == (2021, 1, 1, 1, 2)
+
+def test_get_summary_frame_skips_incomplete_rows():
+    df_summary = Hiring_Summary_Db.get_summary_frame(pd.DataFrame({
+        'datetime': ['2021-05-01T00:00:00Z', None, '2021-05-02T00:00:00Z'],
+        'department_id': [1, 1, None],
+        'job_id': [2, 2, 2],
+    }))
+
+    assert df_summary.to_dict('records') == [
+        {'year': 2021, 'quarter': 2, 'department_id': 1, 'job_id': 2, 'hired': 1}
+    ]
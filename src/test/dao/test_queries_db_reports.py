@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+from sqlalchemy.dialects import postgresql
+from dao.jobs_db_creator import Jobs_Db_Creator
+from dao.departments_db_creator import Departments_Db_Creator
+from dao.employees_db_creator import Employees_Db_Creator
+from dao.queries_db_reports import Queries_Db_Reports, get_quarter_start
+from benchmark.bench_reports import get_employees_mean, get_departments_above_mean
+
+@pytest.fixture
+def reports(sqlite_session):
+    """Reports over a small data set loaded with the DB creators."""
+    Jobs_Db_Creator(sqlite_session).insert_data(
+        pd.DataFrame({'id': [1, 2], 'job': ['Developer', 'Manager']}), headers=True)
+    Departments_Db_Creator(sqlite_session).insert_data(
+        pd.DataFrame({'id': [1, 2, 3], 'department': ['Sales', 'Support', 'Legal']}), headers=True)
+    Employees_Db_Creator(sqlite_session).insert_data(pd.DataFrame([
+        {'id': 1, 'name': 'Alice', 'datetime': '2021-01-15T10:00:00Z', 'department_id': 1, 'job_id': 1},
+        {'id': 2, 'name': 'Bob', 'datetime': '2021-03-31T23:59:59Z', 'department_id': 1, 'job_id': 1},
+        {'id': 3, 'name': 'Carol', 'datetime': '2021-04-01T00:00:00Z', 'department_id': 1, 'job_id': 2},
+        {'id': 4, 'name': 'Dave', 'datetime': '2021-12-31T23:00:00Z', 'department_id': 2, 'job_id': 1},
+        {'id': 5, 'name': 'Eve', 'datetime': '2022-01-01T00:00:00Z', 'department_id': 3, 'job_id': 1},
+        {'id': 6, 'name': 'Frank', 'datetime': '2021-07-01T12:00:00Z', 'department_id': 1, 'job_id': 2},
+    ]), headers=True)
+    return Queries_Db_Reports(sqlite_session)
+
+def test_get_quarter_start():
+    assert get_quarter_start('2021', 1).isoformat() == '2021-01-01T00:00:00+00:00'
+    assert get_quarter_start(2021, 4).isoformat() == '2021-10-01T00:00:00+00:00'
+    assert get_quarter_start(2021, 5).isoformat() == '2022-01-01T00:00:00+00:00'
+
+def test_get_employees_by_quarter(reports):
+    rows = reports.get_employees_by_quarter('2021').all()
+
+    assert [tuple(row) for row in rows] == [
+        ('Sales', 'Developer', 2, 0, 0, 0),
+        ('Sales', 'Manager', 0, 1, 1, 0),
+        ('Support', 'Developer', 0, 0, 0, 1),
+    ]
+
+def test_get_departments_above_mean(reports):
+    mean_hired = get_employees_mean(reports.conn, 2021).scalar()
+    rows = get_departments_above_mean(reports.conn, 2021, mean_hired).all()
+
+    assert mean_hired == 2.5
+    assert [tuple(row) for row in rows] == [(1, 'Sales', 4)]
+
+def test_get_employees_by_quarter_after_keyset(reports):
+    rows = reports.get_employees_by_quarter(2021, after=('Sales', 'Developer')).all()
+
+    assert [(row.department, row.job) for row in rows] == [('Sales', 'Manager'), ('Support', 'Developer')]
+
+def test_get_departments_above_mean_after_keyset(reports):
+    all_rows = get_departments_above_mean(reports.conn, 2021, 0).all()
+    rows = get_departments_above_mean(reports.conn, 2021, 0, after=(all_rows[0].hired, all_rows[0].id)).all()
+
+    assert [tuple(row) for row in all_rows] == [(1, 'Sales', 4), (2, 'Support', 1)]
+    assert [tuple(row) for row in rows] == [(2, 'Support', 1)]
+
+@pytest.mark.parametrize("param_year", [2021, 2022, 2020])
+def test_get_departments_hired_above_mean_matches_two_step_query(reports, param_year):
+    mean_hired = get_employees_mean(reports.conn, param_year).scalar() or 0
+    expected = [tuple(row) for row in get_departments_above_mean(reports.conn, param_year, mean_hired).all()]
+    rows = reports.get_departments_hired_above_mean(param_year).all()
+
+    assert [(row.id, row.department, row.hired) for row in rows] == expected
+    assert all(row.total_items == len(expected) for row in rows)
+
+def test_get_departments_hired_above_mean_after_keyset(reports):
+    rows = reports.get_departments_hired_above_mean(2021, after=(4, 1)).all()
+
+    assert rows == []
+
+def test_reports_read_the_hiring_summary(reports):
+    sql = str(reports.get_employees_by_quarter(2021).statement.compile(dialect=postgresql.dialect()))
+
+    assert 'FROM data_challenge.hiring_summary' in sql
+    assert 'data_challenge.employees' not in sql
@@ -1,16 +1,28 @@
 import pytest
 from sqlalchemy import text
-from app import app
+from app import create_app
 import io
 import pandas as pd
 from unittest.mock import patch, MagicMock
 import jwt
 from datetime import datetime, timedelta, timezone
-from service.api_methods import (startup_event, upload_file, get_required_columns,
+from service.upload_jobs import UploadJobManager
+from moto import mock_aws
+import boto3
+import avro.datafile
+import avro.io
+from dao.employees_db_creator import Employees_Db_Creator
+from dao.jobs_db_creator import Jobs_Db_Creator
+import json
+from util.transversal import format_datetime_iso
+from service.api_methods import (get_db_creator, upload_file, get_required_columns,
                          process_validation_response, backup_table_to_avro,
+                         backup_tables_to_avro, backup_table_in_snapshot, get_backup_keys,
                          restore_table_from_s3_avro, truncate_table,
-                         execute_query, paginate_query)
+                         execute_query, paginate_query, paginate_query_by_cursor, paginate_windowed_query,
+                         encode_cursor, decode_cursor, InvalidCursorError)
 
+app = create_app()
 SECRET_KEY = app.config['JWT_SECRET_KEY']
 
 @pytest.fixture
@@ -26,10 +38,17 @@ def generate_token():
         SECRET_KEY
     )
 
-def test_startup_event(mock_db_creators):
-    with patch('service.api_methods.DB_CREATORS', new=mock_db_creators):
-        startup_event()
-        assert mock_db_creators["job"].session is not None
+def test_get_db_creator():
+    from dao.queries_db_reports import Queries_Db_Reports
+    from service.flask_sqlalchemy.api_database import db
+    with app.app_context():
+        job_creator = get_db_creator('job')
+        assert isinstance(job_creator, Jobs_Db_Creator)
+        assert job_creator.conn is db.session
+        assert isinstance(get_db_creator('reports'), Queries_Db_Reports)
+        assert get_db_creator('unknown') is None
+    # A new creator for every request
+    assert get_db_creator('job') is not get_db_creator('job')
 
 def test_upload_file_no_file(client):
     token = generate_token()
@@ -51,10 +70,10 @@ def test_upload_file_no_selected_file(client):
     assert response.json == {'error': 'No selected file'}
 
 @patch('service.api_methods.pd.read_csv')
-@patch('service.api_methods.DB_CREATORS')
-def test_upload_file_invalid_columns(mock_db_creators, mock_read_csv, client):
+@patch('service.api_methods.get_db_creator')
+def test_upload_file_invalid_columns(mock_get_db_creator, mock_read_csv, client):
     mock_read_csv.return_value = pd.DataFrame(columns=['wrong_column'])
-    mock_db_creators.get.return_value = MagicMock()
+    mock_get_db_creator.return_value = MagicMock()
     token = generate_token()
     response = client.post(
         '/upload', 
@@ -66,9 +85,9 @@ def test_upload_file_invalid_columns(mock_db_creators, mock_read_csv, client):
 
 @patch('util.logger.save_error_log')
 @patch('service.api_methods.pd.read_csv')
-@patch('service.api_methods.validate_data')
-@patch('service.api_methods.DB_CREATORS')
-def test_upload_file_valid(mock_db_creators, mock_validate_data, mock_read_csv, mock_log_error, client):
+@patch('service.api_methods.data_validation.validate_data')
+@patch('service.api_methods.get_db_creator')
+def test_upload_file_valid(mock_get_db_creator, mock_validate_data, mock_read_csv, mock_log_error, client):
     mock_read_csv.return_value = pd.DataFrame({'id': [1], 'job': ['Developer']})
     mock_validate_data.return_value = (pd.DataFrame({'id': [1], 'job': ['Developer']}), pd.DataFrame())
     mock_log_error.return_value = 'bucket_name/object_key/log.csv'
@@ -120,10 +139,19 @@ def test_truncate_table(client):
         expected_query = "TRUNCATE TABLE data_challenge.jobs RESTART IDENTITY CASCADE"
         assert actual_query == expected_query
 
-@patch('service.api_methods.DB_CREATORS')
-def test_execute_query(mock_db_creators):
+def test_truncate_employees_clears_hiring_summary(client):
+    with client.application.app_context():
+        with patch('service.api_methods.db.session.execute') as mock_execute, \
+             patch('service.api_methods.Hiring_Summary_Db') as mock_summary_db:
+            truncate_table('data_challenge.employees')
+
+        assert mock_execute.call_count == 1
+        mock_summary_db.return_value.clear.assert_called_once()
+
+@patch('service.api_methods.get_db_creator')
+def test_execute_query(mock_get_db_creator):
     mock_query_method = MagicMock(return_value='test_data')
-    mock_db_creators.get.return_value.get_employees_by_quarter = mock_query_method
+    mock_get_db_creator.return_value.get_employees_by_quarter = mock_query_method
 
     result = execute_query('get_employees_by_quarter', 2021)
     assert result == 'test_data'
@@ -138,4 +166,292 @@ def test_paginate_query(mock_db_creators):
     assert metadata['page'] == 1
     assert metadata['per_page'] == 10
     assert metadata['total_pages'] == 5
-    assert metadata['total_items'] == 50
\ No newline at end of file
+    assert metadata['total_items'] == 50
+
+def test_paginate_windowed_query():
+    mock_query = MagicMock()
+    mock_query.limit.return_value.offset.return_value.all.return_value = [MagicMock(total_items=60)] * 50
+
+    items, metadata = paginate_windowed_query(mock_query, page=1, per_page=50)
+
+    mock_query.limit.return_value.offset.assert_called_once_with(0)
+    mock_query.order_by.assert_not_called()
+    assert len(items) == 50
+    assert metadata == {'page': 1, 'per_page': 50, 'total_pages': 2, 'total_items': 60}
+
+def test_paginate_windowed_query_past_last_page():
+    mock_query = MagicMock()
+    mock_query.limit.return_value.offset.return_value.all.return_value = []
+    mock_query.order_by.return_value.count.return_value = 60
+
+    items, metadata = paginate_windowed_query(mock_query, page=3, per_page=50)
+
+    mock_query.limit.return_value.offset.assert_called_once_with(100)
+    assert items == []
+    assert metadata == {'page': 3, 'per_page': 50, 'total_pages': 2, 'total_items': 60}
+
+def test_paginate_query_by_cursor():
+    rows = [MagicMock(department=f'D{i}', job='J') for i in range(3)]
+    mock_query = MagicMock()
+    mock_query.limit.return_value.all.return_value = rows
+
+    items, metadata = paginate_query_by_cursor(mock_query, per_page=2, cursor_fields=['department', 'job'])
+
+    mock_query.limit.assert_called_once_with(3)
+    mock_query.count.assert_not_called()
+    assert items == rows[:2]
+    assert metadata == {'per_page': 2, 'next_cursor': encode_cursor(('D1', 'J'))}
+    assert decode_cursor(metadata['next_cursor']) == ('D1', 'J')
+
+def test_paginate_query_by_cursor_last_page():
+    mock_query = MagicMock()
+    mock_query.limit.return_value.all.return_value = [MagicMock(hired=4, id=1)]
+
+    items, metadata = paginate_query_by_cursor(mock_query, per_page=2, cursor_fields=['hired', 'id'])
+
+    assert len(items) == 1
+    assert metadata['next_cursor'] is None
+
+@pytest.mark.parametrize("cursor", ['not-a-cursor', 'eyJhIjogMX0=', '%%%'])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+@pytest.mark.parametrize("values, types", [
+    ([1], (int, int)),
+    ([1, 2, 3], (int, int)),
+    (['Sales', 2], (int, int)),
+    ([True, 2], (int, int)),
+    ([1, 'Engineer'], (str, str)),
+    ([None, 'Engineer'], (str, str)),
+])
+def test_decode_cursor_of_other_keyset(values, types):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor(values), types)
+
+def test_decode_cursor_with_types():
+    assert decode_cursor(encode_cursor([4, 1]), (int, int)) == (4, 1)
+    assert decode_cursor(encode_cursor(['Sales', 'Engineer']), (str, str)) == ('Sales', 'Engineer')
+
+def test_decode_empty_cursor():
+    assert decode_cursor('') is None
+    assert decode_cursor(None) is None
+
+
+@patch('util.aws_s3.save_to_s3')
+@patch('service.api_methods.get_db_creator')
+def test_upload_file_by_chunks(mock_get_db_creator, mock_save_to_s3, client):
+    db_creator = MagicMock()
+    mock_get_db_creator.return_value = db_creator
+    saved_logs = []
+    mock_save_to_s3.side_effect = lambda output_file, **kwargs: saved_logs.append(output_file.read().decode('utf-8'))
+    csv_data = b'id,job\n1,Developer\n2,\n3,Manager\n-4,Tester\n5,Analyst\n'
+    token = generate_token()
+    response = client.post(
+        '/upload',
+        data={'file_type': 'job', 'chunk_size': '2', 'file': (io.BytesIO(csv_data), 'test.csv')},
+        headers={'Authorization': f'Bearer {token}'},
+        content_type='multipart/form-data')
+
+    assert response.status_code == 201
+    assert response.json['message'].startswith('Data added partially, please check the log jobs/error_log/test_')
+    assert (response.json['total_rows'], response.json['valid_rows'], response.json['invalid_rows']) == (5, 3, 2)
+    # One insert (and commit) per chunk with valid rows
+    inserted = [call.args[0]['column1'].tolist() for call in db_creator.insert_data.call_args_list]
+    assert inserted == [[1], [3], [5]]
+    # The invalid rows of every chunk end up in a single error log
+    mock_save_to_s3.assert_called_once()
+    assert saved_logs[0].splitlines() == [
+        'column1,column2,failure_reason',
+        '2,,column2: null',
+        '-4,Tester,column1: greater_than_or_equal_to(0)',
+    ]
+
+@patch('service.api_methods.get_db_creator')
+def test_upload_file_async(mock_get_db_creator, client):
+    manager = UploadJobManager(max_workers=1)
+    db_creator = MagicMock()
+    mock_get_db_creator.return_value = db_creator
+    token = generate_token()
+    with patch('service.api_methods.get_upload_job_manager', return_value=manager):
+        response = client.post(
+            '/jobs/upload',
+            data={'async': 'true', 'file': (io.BytesIO(b'id,job\n1,Developer\n2,Manager\n'), 'test.csv')},
+            headers={'Authorization': f'Bearer {token}'},
+            content_type='multipart/form-data')
+        manager.shutdown(wait=True)
+
+        assert response.status_code == 202
+        job_id = response.json['job_id']
+        assert response.json['status_url'] == f'/upload/jobs/{job_id}'
+
+        status = client.get(f'/upload/jobs/{job_id}', headers={'Authorization': f'Bearer {token}'})
+        assert status.status_code == 200
+        assert status.json['status'] == 'finished'
+        assert (status.json['total_rows'], status.json['valid_rows'], status.json['inserted_rows']) == (2, 2, 2)
+
+        missing = client.get('/upload/jobs/unknown', headers={'Authorization': f'Bearer {token}'})
+        assert missing.status_code == 404
+
+@mock_aws
+def test_backup_table_to_avro_streams_compressed_blocks(sqlite_session):
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket='globant-datachallenge')
+    creator = Employees_Db_Creator(sqlite_session)
+    creator.insert_data(pd.DataFrame({
+        'id': [2, 1], 'name': ['Bob', 'Alice'],
+        'datetime': ['2021-02-01T10:00:00Z', '2021-01-01T00:00:00Z'],
+        'department_id': [1, 2], 'job_id': [3, 4]}), headers=True)
+
+    with patch('util.aws_s3.s3', client), \
+         patch('service.api_methods.get_db_creator', {'employee': creator}.get):
+        message = backup_table_to_avro('employee')
+
+    body = io.BytesIO(client.get_object(Bucket='globant-datachallenge', Key='backups/employee_backup.avro')['Body'].read())
+    reader = avro.datafile.DataFileReader(body, avro.io.DatumReader())
+    assert message == "Backup complete for employee in backups/employee_backup.avro"
+    assert reader.GetMeta('avro.codec') == b'deflate'
+    assert list(reader) == [
+        {'id': 1, 'name': 'Alice', 'datetime': '2021-01-01T00:00:00Z', 'department_id': 2, 'job_id': 4},
+        {'id': 2, 'name': 'Bob', 'datetime': '2021-02-01T10:00:00Z', 'department_id': 1, 'job_id': 3},
+    ]
+
+
+@mock_aws
+def test_backup_tables_to_avro_in_parallel(tmp_path):
+    from sqlalchemy import create_engine, event
+    from service.sqlalchemy.database import Base
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket='globant-datachallenge')
+    # A file database, so every connection sees the same data
+    engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    schema_file = tmp_path / 'data_challenge.db'
+
+    @event.listens_for(engine, "connect")
+    def attach_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{schema_file}' AS data_challenge")
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO data_challenge.jobs (id, job) VALUES (1, 'Developer')"))
+        connection.execute(text("INSERT INTO data_challenge.departments (id, department) VALUES (1, 'Sales')"))
+
+    with patch('util.aws_s3.s3', client):
+        result = backup_tables_to_avro(['job', 'department'], engine=engine)
+
+    assert result['message'] == ("Backup complete for job in backups/job_backup.avro - "
+                                 "Backup complete for department in backups/department_backup.avro")
+    assert set(result['tables']) == {'job', 'department'}
+    assert all(table['seconds'] >= 0 for table in result['tables'].values())
+    body = io.BytesIO(client.get_object(Bucket='globant-datachallenge', Key='backups/department_backup.avro')['Body'].read())
+    assert list(avro.datafile.DataFileReader(body, avro.io.DatumReader())) == [{'id': 1, 'department': 'Sales'}]
+    engine.dispose()
+
+def test_backup_table_in_snapshot_imports_the_snapshot():
+    engine = MagicMock()
+    connection = engine.connect.return_value.__enter__.return_value
+
+    with patch('service.api_methods.Session'), \
+         patch('service.api_methods.backup_table_to_avro', return_value="Backup complete") as mock_backup:
+        result = backup_table_in_snapshot(engine, 'job', '00000003-0000001B-1')
+
+    connection.execution_options.assert_called_once_with(isolation_level='REPEATABLE READ')
+    connection.begin.assert_called_once()
+    assert str(connection.execute.call_args[0][0]) == "SET TRANSACTION SNAPSHOT '00000003-0000001B-1'"
+    assert result['message'] == "Backup complete"
+    mock_backup.assert_called_once()
+
+def test_backup_table_in_snapshot_rejects_invalid_snapshot():
+    with pytest.raises(ValueError):
+        backup_table_in_snapshot(MagicMock(), 'job', "1'; DROP TABLE data_challenge.jobs; --")
+
+@mock_aws
+def test_incremental_backup_and_restore_replay(sqlite_session):
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket='globant-datachallenge')
+    creator = Jobs_Db_Creator(sqlite_session)
+
+    with patch('util.aws_s3.s3', client), patch('service.api_methods.get_report_cache'):
+        creator.insert_data(pd.DataFrame({'id': [1, 2], 'job': ['Developer', 'Manager']}), headers=True)
+        assert backup_table_to_avro('job', creator, incremental=True) == \
+            "Backup complete for job in backups/job_backup.avro"
+        creator.insert_data(pd.DataFrame({'id': [3], 'job': ['Tester']}), headers=True)
+        assert backup_table_to_avro('job', creator, incremental=True) == \
+            "Backup complete for job in backups/job_delta_0001.avro"
+        assert backup_table_to_avro('job', creator, incremental=True) == \
+            "Backup up to date for job, no new rows"
+        manifest = json.loads(client.get_object(Bucket='globant-datachallenge',
+                                                Key='backups/job_manifest.json')['Body'].read())
+
+        sqlite_session.execute(text("DELETE FROM data_challenge.jobs"))
+        with patch('service.api_methods.get_db_creator', {'job': creator}.get):
+            message = restore_table_from_s3_avro('job')
+
+    assert manifest['high_water_mark'] == 3
+    assert (manifest['base']['rows'], manifest['base']['high_water_mark']) == (2, 2)
+    assert [(delta['after_id'], delta['rows']) for delta in manifest['deltas']] == [(2, 1)]
+    assert message == "Restore complete for job in backups/job_backup.avro, backups/job_delta_0001.avro"
+    restored = sqlite_session.execute(text("SELECT id, job FROM data_challenge.jobs ORDER BY id")).all()
+    assert [tuple(row) for row in restored] == [(1, 'Developer'), (2, 'Manager'), (3, 'Tester')]
+
+@mock_aws
+def test_full_backup_resets_the_manifest(sqlite_session):
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket='globant-datachallenge')
+    creator = Jobs_Db_Creator(sqlite_session)
+    creator.insert_data(pd.DataFrame({'id': [1], 'job': ['Developer']}), headers=True)
+
+    with patch('util.aws_s3.s3', client):
+        backup_table_to_avro('job', creator, incremental=True)
+        creator.insert_data(pd.DataFrame({'id': [2], 'job': ['Manager']}), headers=True)
+        backup_table_to_avro('job', creator, incremental=True)
+        backup_table_to_avro('job', creator)
+        keys = get_backup_keys('job')
+
+    assert keys == ['backups/job_backup.avro']
+
+@mock_aws
+@pytest.mark.parametrize("use_orm", [False, True])
+def test_restore_employees_from_backup(sqlite_session, use_orm):
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket='globant-datachallenge')
+    creator = Employees_Db_Creator(sqlite_session)
+    employees = pd.DataFrame({
+        'id': [1, 2], 'name': ['Alice', 'Bob'],
+        'datetime': ['2021-01-01T00:00:00Z', '2021-02-01T10:00:00Z'],
+        'department_id': [2, 1], 'job_id': [4, 3]})
+    creator.insert_data(employees, headers=True)
+
+    with patch('util.aws_s3.s3', client), patch('service.api_methods.get_report_cache'), \
+         patch('service.api_methods.get_db_creator', {'employee': creator}.get):
+        backup_table_to_avro('employee', creator)
+        sqlite_session.execute(text("DELETE FROM data_challenge.employees"))
+        sqlite_session.execute(text("DELETE FROM data_challenge.hiring_summary"))
+        message = restore_table_from_s3_avro('employee', use_orm=use_orm)
+
+    restored = [(row.id, row.name, format_datetime_iso(row.datetime)) for row in creator.iter_all_data()]
+    assert message == "Restore complete for employee in backups/employee_backup.avro"
+    assert restored == [(1, 'Alice', '2021-01-01T00:00:00Z'), (2, 'Bob', '2021-02-01T10:00:00Z')]
+
+@mock_aws
+@pytest.mark.parametrize("use_orm", [False, True])
+def test_backup_and_restore_employee_without_datetime(sqlite_session, use_orm):
+    """Migration 001 sets to NULL the datetimes that did not cast, they are backed up as null."""
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket='globant-datachallenge')
+    creator = Employees_Db_Creator(sqlite_session)
+    sqlite_session.execute(text("INSERT INTO data_challenge.employees (id, name, datetime, department_id, job_id) "
+                                "VALUES (1, 'Alice', NULL, 2, 4)"))
+    sqlite_session.commit()
+
+    with patch('util.aws_s3.s3', client), patch('service.api_methods.get_report_cache'), \
+         patch('service.api_methods.get_db_creator', {'employee': creator}.get):
+        backup_table_to_avro('employee', creator)
+        body = io.BytesIO(client.get_object(Bucket='globant-datachallenge', Key='backups/employee_backup.avro')['Body'].read())
+        backed_up = list(avro.datafile.DataFileReader(body, avro.io.DatumReader()))
+        sqlite_session.execute(text("DELETE FROM data_challenge.employees"))
+        restore_table_from_s3_avro('employee', use_orm=use_orm)
+
+    assert backed_up == [{'id': 1, 'name': 'Alice', 'datetime': None, 'department_id': 2, 'job_id': 4}]
+    assert [(row.id, row.datetime) for row in creator.iter_all_data()] == [(1, None)]
+
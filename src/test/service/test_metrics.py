@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch
+from flask import Flask
+from service.metrics import MetricsRegistry, clear_multiprocess_dir, Counter, Histogram, timed_phase, observe_request, start_request_timer, \
+    PHASE_SECONDS, PHASE_ROWS, PHASE_ERRORS
+
+def test_histogram_cumulative_buckets():
+    histogram = Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value, route='/a')
+
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+
+    assert samples[('latency_seconds_bucket', (('route', '/a'), ('le', '0.1')))] == 1
+    assert samples[('latency_seconds_bucket', (('route', '/a'), ('le', '1.0')))] == 3
+    assert samples[('latency_seconds_bucket', (('route', '/a'), ('le', '+Inf')))] == 4
+    assert samples[('latency_seconds_count', (('route', '/a'),))] == 4
+    assert samples[('latency_seconds_sum', (('route', '/a'),))] == pytest.approx(4.25)
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter('rows_total', 'Rows.', ('phase',))
+    counter.inc(3, phase='read "csv"')
+    registry.histogram('latency_seconds', 'Latency.', buckets=(1,)).observe(0.5)
+
+    text = registry.render()
+
+    assert '# HELP rows_total Rows.\n# TYPE rows_total counter\nrows_total{phase="read \\"csv\\""} 3\n' in text
+    assert '# TYPE latency_seconds histogram\n' in text
+    assert 'latency_seconds_bucket{le="1.0"} 1\n' in text
+    assert 'latency_seconds_count 1\n' in text
+    # The same name gives back the registered metric
+    assert registry.counter('rows_total', 'Rows.', ('phase',)) is counter
+
+def test_timed_phase_records_latency_rows_and_errors():
+    count, _ = PHASE_SECONDS.get(phase='test_phase', target='job')
+    rows = PHASE_ROWS.get(phase='test_phase', target='job')
+
+    with timed_phase('test_phase', 'job') as measure:
+        measure.rows = 10
+    with pytest.raises(ValueError):
+        with timed_phase('test_phase', 'job'):
+            raise ValueError("failed")
+
+    assert measure.seconds >= 0
+    assert PHASE_SECONDS.get(phase='test_phase', target='job')[0] == count + 2
+    assert PHASE_ROWS.get(phase='test_phase', target='job') == rows + 10
+    assert PHASE_ERRORS.get(phase='test_phase', target='job') == 1
+
+def test_timed_phase_disabled():
+    with patch.dict('service.metrics.config.metrics_config', {'ENABLED': False}):
+        with timed_phase('disabled_phase') as measure:
+            measure.rows = 5
+
+    assert measure.seconds is not None
+    assert PHASE_SECONDS.get(phase='disabled_phase') == (0, 0.0)
+    assert PHASE_ROWS.get(phase='disabled_phase') == 0
+
+def test_timed_phase_disabled_raises_the_phase_error():
+    with patch.dict('service.metrics.config.metrics_config', {'ENABLED': False}):
+        with pytest.raises(RuntimeError):
+            with timed_phase('insert', 'job'):
+                raise RuntimeError("insert failed")
+
+    assert PHASE_ERRORS.get(phase='insert', target='job') == 0
+
+def test_server_timing_adds_up_the_runs_of_a_phase():
+    app = Flask(__name__)
+    with app.test_request_context('/upload'):
+        start_request_timer()
+        for _ in range(1000):
+            with timed_phase('insert', 'employee'):
+                pass
+        with timed_phase('save_error_log', 'employee'):
+            pass
+        response = observe_request(app.response_class())
+
+    entries = response.headers['Server-Timing'].split(', ')
+    assert [entry.split(';')[0] for entry in entries] == ['insert', 'save_error_log']
+
+def test_processes_share_the_metrics_directory(tmp_path):
+    """Every process writes its own file, each of them renders the sum of all."""
+    worker1, worker2 = MetricsRegistry(str(tmp_path)), MetricsRegistry(str(tmp_path))
+    counter1 = worker1.counter('rows_total', 'Rows.', ('phase',))
+    counter2 = worker2.counter('rows_total', 'Rows.', ('phase',))
+    histogram1 = worker1.histogram('latency_seconds', 'Latency.', buckets=(1,))
+    histogram2 = worker2.histogram('latency_seconds', 'Latency.', buckets=(1,))
+    counter1.inc(3, phase='insert')
+    histogram1.observe(0.5)
+    with patch('service.metrics.os.getpid', return_value=1):
+        worker1.flush()
+    counter2.inc(4, phase='insert')
+    histogram2.observe(2)
+
+    with patch('service.metrics.os.getpid', return_value=2):
+        text = worker2.render()
+
+    assert 'rows_total{phase="insert"} 7\n' in text
+    assert 'latency_seconds_bucket{le="1.0"} 1\n' in text
+    assert 'latency_seconds_count 2\n' in text
+    assert 'latency_seconds_sum 2.5\n' in text
+    # Nothing changed, the file is not written again
+    with patch('service.metrics.os.getpid', return_value=2):
+        assert worker2.flush() is False
+
+    clear_multiprocess_dir(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,112 @@
+import pytest
+from unittest.mock import patch
+from moto import mock_aws
+import boto3
+import pandas as pd
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from dao.employees_db_creator import Employees_Db_Creator
+from dao.jobs_db_creator import Jobs_Db_Creator
+from util.aws_s3 import S3RangeReader
+from util.transversal import format_datetime_iso
+from service.parquet_backup import (backup_table_to_parquet, restore_table_from_parquet, get_parquet_key,
+                                    get_partition_year, select_row_groups, iter_row_group_batches,
+                                    NULL_PARTITION)
+
+BUCKET = 'globant-datachallenge'
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        with patch('util.aws_s3.s3', client):
+            yield client
+
+def insert_employees(creator):
+    creator.insert_data(pd.DataFrame({
+        'id': [1, 2, 3, 4, 5, 6],
+        'name': ['Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank'],
+        'datetime': ['2021-01-01T00:00:00Z', '2021-05-01T10:00:00Z', '2020-03-01T00:00:00Z',
+                     '2021-07-01T00:00:00Z', '2021-12-31T23:59:59Z', None],
+        'department_id': [3, 1, 2, 2, 1, 1], 'job_id': [1, 2, 3, 4, 5, 6]}), headers=True)
+
+def test_get_partition_year():
+    assert get_partition_year(get_parquet_key('employee', 2021)) == 2021
+    assert get_partition_year(get_parquet_key('employee')) is None
+    assert NULL_PARTITION in get_parquet_key('employee')
+
+def test_backup_employees_partitioned_by_year(sqlite_session, s3_client):
+    creator = Employees_Db_Creator(sqlite_session)
+    insert_employees(creator)
+
+    with patch.dict('service.parquet_backup.config.backup_config', {'ROW_GROUP_SIZE': 1}):
+        rows_count, keys = backup_table_to_parquet('employee', creator, BUCKET)
+
+    assert rows_count == 6
+    assert sorted(keys) == sorted([get_parquet_key('employee', 2020), get_parquet_key('employee', 2021),
+                                   get_parquet_key('employee')])
+    parquet_file = pq.ParquetFile(S3RangeReader(BUCKET, get_parquet_key('employee', 2021)))
+    # One row group per row, sorted by department
+    assert parquet_file.metadata.num_row_groups == 4
+    assert parquet_file.read().column('department_id').to_pylist() == [1, 1, 2, 3]
+    statistics = parquet_file.metadata.row_group(3).column(3).statistics
+    assert (statistics.min, statistics.max) == (3, 3)
+
+def test_backup_deletes_stale_partitions(sqlite_session, s3_client):
+    creator = Employees_Db_Creator(sqlite_session)
+    insert_employees(creator)
+    backup_table_to_parquet('employee', creator, BUCKET)
+    sqlite_session.execute(text("DELETE FROM data_challenge.employees WHERE id = 3"))
+
+    _, keys = backup_table_to_parquet('employee', creator, BUCKET)
+
+    listed = [item['Key'] for item in s3_client.list_objects_v2(Bucket=BUCKET)['Contents']]
+    assert sorted(listed) == sorted(keys)
+    assert get_parquet_key('employee', 2020) not in listed
+
+def test_restore_employees_filtered_by_year_and_department(sqlite_session, s3_client):
+    creator = Employees_Db_Creator(sqlite_session)
+    insert_employees(creator)
+    with patch.dict('service.parquet_backup.config.backup_config', {'ROW_GROUP_SIZE': 1}):
+        backup_table_to_parquet('employee', creator, BUCKET)
+    sqlite_session.execute(text("DELETE FROM data_challenge.employees"))
+    sqlite_session.execute(text("DELETE FROM data_challenge.hiring_summary"))
+
+    with patch('service.parquet_backup.iter_row_group_batches', wraps=iter_row_group_batches) as mock_read:
+        restored, keys = restore_table_from_parquet('employee', creator, BUCKET, years=[2021], department_ids=[1])
+
+    assert restored == 2
+    assert keys == [get_parquet_key('employee', 2021)]
+    # Only the two row groups of department 1 out of the four of 2021 are read
+    assert mock_read.call_args.args[1] == [0, 1]
+    assert [(row.id, row.name, format_datetime_iso(row.datetime)) for row in creator.iter_all_data()] == [
+        (2, 'Bob', '2021-05-01T10:00:00Z'), (5, 'Eve', '2021-12-31T23:59:59Z')]
+
+def test_select_row_groups_skips_by_statistics(sqlite_session, s3_client):
+    creator = Employees_Db_Creator(sqlite_session)
+    insert_employees(creator)
+    with patch.dict('service.parquet_backup.config.backup_config', {'ROW_GROUP_SIZE': 2}):
+        backup_table_to_parquet('employee', creator, BUCKET)
+
+    metadata = pq.ParquetFile(S3RangeReader(BUCKET, get_parquet_key('employee', 2021))).metadata
+
+    # Row groups [1, 1] and [2, 3]
+    assert select_row_groups(metadata, 'department_id', [1]) == [0]
+    assert select_row_groups(metadata, 'department_id', [3]) == [1]
+    assert select_row_groups(metadata, 'department_id', [4]) == []
+
+def test_restore_table_without_filters(sqlite_session, s3_client):
+    creator = Jobs_Db_Creator(sqlite_session)
+    creator.insert_data(pd.DataFrame({'id': [1, 2], 'job': ['Developer', 'Manager']}), headers=True)
+    backup_table_to_parquet('job', creator, BUCKET)
+    sqlite_session.execute(text("DELETE FROM data_challenge.jobs"))
+
+    restored, keys = restore_table_from_parquet('job', creator, BUCKET, years=[2021], department_ids=[1])
+
+    assert (restored, keys) == (2, [get_parquet_key('job')])
+    assert [(row.id, row.job) for row in creator.iter_all_data()] == [(1, 'Developer'), (2, 'Manager')]
+
+def test_restore_without_backup(s3_client):
+    with pytest.raises(FileNotFoundError):
+        restore_table_from_parquet('job', None, BUCKET)
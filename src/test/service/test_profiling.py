@@ -0,0 +1,105 @@
+import logging
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from service.sqlalchemy.profiling import QueryProfiler, OTHER_STATEMENTS, normalize_statement
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE jobs (id INTEGER PRIMARY KEY, job TEXT)"))
+    yield engine
+    engine.dispose()
+
+def test_records_latency_and_rows_by_statement(engine):
+    profiler = QueryProfiler(slow_query_ms=10000)
+    profiler.attach(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO jobs (id, job) VALUES (:id, :job)"),
+                           [{'id': 1, 'job': 'Developer'}, {'id': 2, 'job': 'Manager'}])
+        for job_id in (1, 2):
+            connection.execute(text("SELECT job\n  FROM jobs WHERE id = :id"), {'id': job_id}).all()
+
+    statements = {entry['statement']: entry for entry in profiler.summary()['statements']}
+
+    assert statements['INSERT INTO jobs (id, job) VALUES (?, ?)']['rows'] == 2
+    select = statements['SELECT job FROM jobs WHERE id = ?']
+    assert (select['calls'], select['slow_calls'], select['plan']) == (2, 0, None)
+    assert select['max_ms'] <= select['total_ms']
+
+def test_slow_query_is_logged_and_explained(engine, caplog):
+    profiler = QueryProfiler(slow_query_ms=0, explain_slow=True)
+    profiler.attach(engine)
+    with caplog.at_level(logging.WARNING, logger='service.sqlalchemy.profiling'):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT id FROM jobs WHERE id = :id"), {'id': 1}).all()
+            connection.execute(text("SELECT id FROM jobs WHERE id = :id"), {'id': 2}).all()
+
+    entry = profiler.summary()['statements'][0]
+    assert entry['slow_calls'] == 2
+    # SQLite plan (EXPLAIN QUERY PLAN), captured once per statement
+    assert 'SEARCH' in entry['plan']
+    assert 'Slow query' in caplog.text
+
+def test_streamed_and_write_statements_are_not_explained(engine):
+    profiler = QueryProfiler(slow_query_ms=0, explain_slow=True)
+    profiler.attach(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO jobs (id, job) VALUES (1, 'Developer')"))
+        connection.execution_options(stream_results=True).execute(text("SELECT * FROM jobs")).all()
+
+    assert [entry['plan'] for entry in profiler.summary()['statements']] == [None, None]
+
+def test_statements_above_the_limit_are_added_up():
+    profiler = QueryProfiler(max_statements=1)
+    profiler.record("SELECT 1", 5.0, 1)
+    profiler.record("SELECT 2", 3.0, 1)
+    profiler.record("SELECT 3", 2.0, 1)
+
+    summary = profiler.summary()
+
+    assert [(entry['statement'], entry['calls']) for entry in summary['statements']] == [
+        ('SELECT 1', 1), (OTHER_STATEMENTS, 2)]
+    profiler.reset()
+    assert profiler.summary()['statements'] == []
+
+def test_detach_stops_profiling(engine):
+    profiler = QueryProfiler()
+    profiler.attach(engine)
+    profiler.detach(engine)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert profiler.summary()['distinct_statements'] == 0
+
+def test_normalize_statement():
+    assert normalize_statement("SELECT id\n\t FROM jobs  ") == "SELECT id FROM jobs"
+
+def test_failed_statement_does_not_leave_its_start(engine):
+    profiler = QueryProfiler(slow_query_ms=10000)
+    profiler.attach(engine)
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing_table"))
+        assert connection.info['query_start'] == []
+
+def test_failed_rollback_of_the_plan_does_not_fail_the_statement(caplog):
+    conn = MagicMock()
+    conn.dialect.name = 'postgresql'
+    conn.connection.dbapi_connection.autocommit = False
+    cursor = conn.connection.dbapi_connection.cursor.return_value
+
+    def execute(statement, *args):
+        # The plan and the rollback fail, as on a lost connection
+        if not statement.startswith('SAVEPOINT'):
+            raise RuntimeError("connection lost")
+
+    cursor.execute.side_effect = execute
+
+    with caplog.at_level(logging.ERROR, logger='service.sqlalchemy.profiling'):
+        assert QueryProfiler().explain(conn, "SELECT 1", {}) is None
+
+    assert 'Could not roll back the plan' in caplog.text
+    cursor.close.assert_called_once()
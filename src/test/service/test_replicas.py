@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select, text
+from service.sqlalchemy.engine import get_engine
+from service.sqlalchemy.replicas import ReplicaRouter, RoutingSession
+
+metadata = MetaData()
+names = Table('names', metadata, Column('id', Integer, primary_key=True), Column('name', String))
+
+@pytest.fixture
+def databases(tmp_path):
+    """A primary and two replicas, each one with its own row to tell them apart."""
+    urls = {name: f"sqlite:///{tmp_path / f'{name}.db'}" for name in ('primary', 'replica1', 'replica2')}
+    for name, url in urls.items():
+        engine = get_engine(url)
+        metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(insert(names), {'id': 1, 'name': name})
+    yield urls
+    for url in urls.values():
+        get_engine(url).dispose()
+
+def read_name(session):
+    return session.execute(select(names.c.name)).scalar()
+
+def test_reads_go_round_robin_to_the_replicas(databases):
+    router = ReplicaRouter(databases['primary'], [databases['replica1'], databases['replica2']])
+    names_read = []
+    for _ in range(3):
+        with RoutingSession(router) as session:
+            names_read.append(read_name(session))
+    assert names_read == ['replica1', 'replica2', 'replica1']
+
+    stats = router.stats()
+    assert stats['primary_reads'] == 0
+    assert [replica['reads'] for replica in stats['replicas'].values()] == [2, 1]
+
+def test_session_keeps_its_replica_until_closed(databases):
+    router = ReplicaRouter(databases['primary'], [databases['replica1'], databases['replica2']])
+    session = RoutingSession(router)
+    assert [read_name(session), read_name(session)] == ['replica1', 'replica1']
+    session.close()
+    assert [read_name(session), read_name(session)] == ['replica2', 'replica2']
+    session.close()
+
+    assert [replica['reads'] for replica in router.stats()['replicas'].values()] == [1, 1]
+
+def test_report_queries_can_be_paginated(databases):
+    router = ReplicaRouter(databases['primary'], [databases['replica1']])
+    with RoutingSession(router) as session:
+        page = session.query(names.c.name).paginate(page=1, per_page=10, error_out=False)
+        assert ([row.name for row in page.items], page.total) == (['replica1'], 1)
+
+def test_writes_go_to_the_primary(databases):
+    router = ReplicaRouter(databases['primary'], [databases['replica1']])
+    with RoutingSession(router) as session:
+        session.execute(insert(names), {'id': 2, 'name': 'new'})
+        session.commit()
+
+    with get_engine(databases['primary']).connect() as connection:
+        assert connection.execute(text("SELECT name FROM names WHERE id = 2")).scalar() == 'new'
+    with get_engine(databases['replica1']).connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM names")).scalar() == 1
+
+def test_unhealthy_replica_falls_back_to_the_primary(databases, tmp_path):
+    broken_url = f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"
+    router = ReplicaRouter(databases['primary'], [broken_url], check_seconds=60)
+    with RoutingSession(router) as session:
+        assert read_name(session) == 'primary'
+
+    replica = next(iter(router.stats()['replicas'].values()))
+    assert replica['healthy'] is False
+    assert replica['error']
+    assert router.stats()['primary_reads'] == 1
+    get_engine(broken_url).dispose()
+
+def test_health_check_is_cached(databases, mocker):
+    router = ReplicaRouter(databases['primary'], [databases['replica1']], check_seconds=60)
+    check = mocker.spy(router, 'check_replica')
+    for _ in range(3):
+        router.get_read_engine()
+
+    assert check.call_count == 1
+
+def test_without_replicas_reads_use_the_primary(databases):
+    router = ReplicaRouter(databases['primary'])
+    with RoutingSession(router) as session:
+        assert read_name(session) == 'primary'
@@ -0,0 +1,106 @@
+from unittest.mock import patch, MagicMock
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from service.report_cache import ReportCache, DatabaseDataVersionStore
+
+def test_get_counts_hits_and_misses():
+    cache = ReportCache(max_entries=2)
+    key = cache.make_key('employees_by_quarter', '2021', 1, 10)
+
+    assert cache.get(key) is None
+    cache.set(key, b'{"data": []}')
+    assert cache.get(key) == b'{"data": []}'
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+
+def test_lru_eviction():
+    cache = ReportCache(max_entries=2)
+    first, second, third = (cache.make_key('report', page) for page in (1, 2, 3))
+    cache.set(first, 1)
+    cache.set(second, 2)
+    cache.get(first)
+    cache.set(third, 3)
+
+    assert cache.get(second) is None
+    assert cache.get(first) == 1
+    assert cache.get(third) == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_entries_expire_after_ttl():
+    cache = ReportCache(ttl_seconds=10)
+    key = cache.make_key('report', 1)
+    with patch('service.report_cache.time.monotonic', return_value=100.0):
+        cache.set(key, 'value')
+    with patch('service.report_cache.time.monotonic', return_value=105.0):
+        assert cache.get(key) == 'value'
+    with patch('service.report_cache.time.monotonic', return_value=111.0):
+        assert cache.get(key) is None
+
+def test_bump_data_version_invalidates_reports():
+    cache = ReportCache()
+    old_key = cache.make_key('report', '2021')
+    cache.set(old_key, 'old')
+
+    assert cache.bump_data_version() == 1
+    assert cache.make_key('report', '2021') != old_key
+    assert cache.get(cache.make_key('report', '2021')) is None
+    assert cache.stats()['entries'] == 0
+
+def test_disabled_cache_never_hits():
+    cache = ReportCache(enabled=False)
+    key = cache.make_key('report', 1)
+    cache.set(key, 'value')
+
+    assert cache.get(key) is None
+
+def test_database_version_is_shared_by_every_cache(sqlite_session):
+    store = DatabaseDataVersionStore(engine=sqlite_session.get_bind())
+    worker, other_worker = ReportCache(version_store=store), ReportCache(version_store=store)
+    key = worker.make_key('report', '2021')
+    worker.set(key, 'old')
+    assert worker.get(worker.make_key('report', '2021')) == 'old'
+
+    # A load of another process (or worker) invalidates the reports of this one
+    assert other_worker.bump_data_version() == 1
+    assert store.bump() == 2
+    assert worker.make_key('report', '2021') == ('report', '2021', 2)
+    assert worker.get(worker.make_key('report', '2021')) is None
+    assert worker.stats()['entries'] == 0
+
+def test_unreadable_version_is_never_served():
+    store = MagicMock()
+    cache = ReportCache(version_store=store)
+    store.get.return_value = 0
+    cache.set(cache.make_key('report', 1), 'value')
+
+    store.get.side_effect = RuntimeError('database unavailable')
+    key = cache.make_key('report', 1)
+    cache.set(key, 'other value')
+    assert key == ('report', 1, None)
+    assert cache.get(key) is None
+    store.bump.side_effect = RuntimeError('database unavailable')
+    assert cache.bump_data_version() is None
+
+def test_report_of_a_lagging_replica_is_not_current(sqlite_session):
+    from service.sqlalchemy.database import Base
+    store = DatabaseDataVersionStore(engine=sqlite_session.get_bind())
+    cache = ReportCache(version_store=store)
+    replica = create_engine("sqlite://")
+
+    @event.listens_for(replica, "connect")
+    def attach_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS data_challenge")
+
+    Base.metadata.create_all(replica)
+    store.bump()
+    key = cache.make_key('report', '2021')
+    with Session(replica) as replica_session:
+        # The bump of the load was not replayed yet
+        assert cache.is_current(key, replica_session) is False
+        DatabaseDataVersionStore(engine=replica).bump()
+        assert cache.is_current(key, replica_session) is True
+    # The primary is always current, an unreadable version never is
+    assert cache.is_current(key, sqlite_session) is True
+    assert cache.is_current(('report', '2021', None), sqlite_session) is False
+    replica.dispose()
@@ -0,0 +1,108 @@
+import io
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+from sqlalchemy import create_engine, event
+from service.upload_jobs import (UploadJobManager, InMemoryUploadJobRegistry, DatabaseUploadJobRegistry,
+                                 UploadQueueFullError)
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+def make_file(content=b'id,job\n1,Developer\n'):
+    return FileStorage(stream=io.BytesIO(content), filename='jobs.csv')
+
+def test_submit_runs_job_and_reports_progress(app):
+    registry = InMemoryUploadJobRegistry()
+    manager = UploadJobManager(registry=registry, max_workers=1)
+    spooled = []
+
+    def run(spool_path, progress):
+        with open(spool_path, 'rb') as spool_file:
+            spooled.append(spool_file.read())
+        progress(total_rows=1, valid_rows=1, invalid_rows=0, inserted_rows=0)
+        return {'total_rows': 1, 'valid_rows': 1, 'invalid_rows': 0, 'inserted_rows': 1, 's3_file_path': ''}
+
+    with app.app_context():
+        job = manager.submit(make_file(), 'job', run)
+    manager.shutdown(wait=True)
+
+    status = manager.get(job['job_id'])
+    assert spooled == [b'id,job\n1,Developer\n']
+    assert status['status'] == 'finished'
+    assert (status['total_rows'], status['valid_rows'], status['inserted_rows']) == (1, 1, 1)
+    assert status['elapsed_seconds'] >= 0
+    assert manager.get('unknown') is None
+
+def test_failed_job_keeps_the_error(app):
+    manager = UploadJobManager(max_workers=1)
+
+    def run(spool_path, progress):
+        raise ValueError('broken file')
+
+    with app.app_context():
+        job = manager.submit(make_file(), 'job', run)
+    manager.shutdown(wait=True)
+
+    status = manager.get(job['job_id'])
+    assert status['status'] == 'failed'
+    assert status['error'] == 'broken file'
+
+def test_submit_rejects_jobs_when_queue_is_full(app):
+    manager = UploadJobManager(max_workers=1, max_pending=0)
+    manager._slots.acquire()
+
+    with app.app_context(), pytest.raises(UploadQueueFullError):
+        manager.submit(make_file(), 'job', lambda spool_path, progress: {})
+    manager.shutdown(wait=True)
+
+def test_registry_error_releases_the_slot_and_the_spool_file(app, tmp_path):
+    class FailingRegistry(InMemoryUploadJobRegistry):
+        def update(self, job_id, **fields):
+            if fields.get('status') == 'running':
+                raise RuntimeError('registry unavailable')
+            super().update(job_id, **fields)
+
+    manager = UploadJobManager(registry=FailingRegistry(), max_workers=1, max_pending=0, spool_dir=str(tmp_path))
+
+    with app.app_context():
+        job = manager.submit(make_file(), 'job', lambda spool_path, progress: {})
+    manager.shutdown(wait=True)
+
+    assert manager.get(job['job_id'])['status'] == 'failed'
+    assert list(tmp_path.iterdir()) == []
+    # The slot of the job is free again
+    assert manager._slots.acquire(blocking=False)
+
+@pytest.fixture
+def database_registry(tmp_path):
+    """Registry over a SQLite file, every thread opens its own connection as the gunicorn workers do."""
+    from model.upload_job import UploadJob
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    schema_path = tmp_path / 'data_challenge.db'
+
+    @event.listens_for(engine, "connect")
+    def attach_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{schema_path}' AS data_challenge")
+
+    UploadJob.__table__.create(engine)
+    yield DatabaseUploadJobRegistry(engine=engine)
+    engine.dispose()
+
+def test_database_registry_shares_the_jobs_between_workers(app, database_registry):
+    worker = UploadJobManager(registry=database_registry, max_workers=1)
+    other_worker = UploadJobManager(registry=database_registry, max_workers=1)
+
+    def run(spool_path, progress):
+        progress(total_rows=1, valid_rows=1, invalid_rows=0, inserted_rows=0)
+        return {'total_rows': 1, 'valid_rows': 1, 'invalid_rows': 0, 'inserted_rows': 1, 's3_file_path': ''}
+
+    with app.app_context():
+        job = worker.submit(make_file(), 'job', run)
+    worker.shutdown(wait=True)
+
+    status = other_worker.get(job['job_id'])
+    assert (status['status'], status['file_name'], status['inserted_rows']) == ('finished', 'jobs.csv', 1)
+    assert status['elapsed_seconds'] >= 0
+    assert other_worker.get('unknown') is None
@@ -0,0 +1,181 @@
+import pytest
+import pandas as pd
+from contextlib import contextmanager
+from unittest.mock import patch
+from moto import mock_aws
+import boto3
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from service.sqlalchemy.database import Base
+import main_etl_process
+from main_etl_process import run_etl, log_stage_report, prepare_file, combine_shards
+from util.aws_s3 import get_line_ranges
+from service.report_cache import get_report_cache
+
+JOBS = b"1,Software Engineer\n2,Data Scientist\n"
+DEPARTMENTS = b"1,Engineering\n2,Sales\n"
+EMPLOYEES = (b"1,Alice,2021-01-01T00:00:00Z,1,1\n"
+             b"2,Bob,2021-05-01T10:00:00Z,2,2\n"
+             b"3,,2021-07-01T00:00:00Z,1,2\n")
+# Invalid rows that keep the column types of every shard
+MORE_EMPLOYEES = (b"4,Carol,2022-01-01T00:00:00Z,1,1\n"
+                  b"5,Dave,not a date,2,1\n"
+                  b"6,Eve,2022-03-01T00:00:00Z,-2,2\n"
+                  b"7,Frank,2022-04-01T00:00:00Z,2,2\n")
+MANY_EMPLOYEES = b"".join(
+    f"{id},Employee {id},{'bad date' if id % 7 == 0 else '2022-01-01T00:00:00Z'},{id % 3},{id % 5}\n".encode()
+    for id in range(1, 40))
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=main_etl_process.bucket)
+        for file_type, content in (('job', JOBS), ('department', DEPARTMENTS), ('employee', EMPLOYEES)):
+            client.put_object(Bucket=main_etl_process.bucket, Key=main_etl_process.file_keys_map[file_type],
+                              Body=content)
+        with patch('util.aws_s3.s3', client):
+            yield client
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """SQLite file database, every table load opens a connection of its own."""
+    import model.job, model.deparment, model.employee, model.hiring_summary  # noqa: F401 register the tables
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    schema_path = tmp_path / 'data_challenge.db'
+
+    @event.listens_for(engine, "connect")
+    def attach_schema(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{schema_path}' AS data_challenge")
+
+    @contextmanager
+    def create_session():
+        with Session(engine) as session:
+            yield session
+
+    with patch('main_etl_process.create_database_session', create_session), \
+            patch('main_etl_process.create_database_tables', lambda: Base.metadata.create_all(engine)):
+        yield engine
+    engine.dispose()
+
+def shard_lines(content, lines):
+    rows = content.splitlines(keepends=True)
+    return [b''.join(rows[index:index + lines]) for index in range(0, len(rows), lines)]
+
+def test_prepare_file_times_every_stage():
+    df_input, df_errors, stages, _ = prepare_file('employee', EMPLOYEES)
+    assert list(df_input['column1']) == [1, 2]
+    assert len(df_errors.index) == 1
+    assert set(stages) == {'parse', 'cast', 'validate'}
+    assert stages['parse']['rows'] == 3
+    # Only the employees are cast
+    assert set(prepare_file('job', JOBS)[2]) == {'parse', 'validate'}
+
+@pytest.mark.parametrize("lines", [1, 2, 3])
+def test_sharded_file_matches_the_whole_file(lines):
+    content = MORE_EMPLOYEES + EMPLOYEES.replace(b"3,,", b"3,Carl,")
+    df_input, df_errors, _, _ = prepare_file('employee', content)
+    shards = [prepare_file('employee', shard) for shard in shard_lines(content, lines)]
+    # Every shard was parsed with the same column types
+    assert len({dtypes for *_, dtypes in shards}) == 1
+
+    inputs, df_shard_errors = combine_shards(shards)
+    pd.testing.assert_frame_equal(pd.concat(inputs), df_input)
+    pd.testing.assert_frame_equal(df_shard_errors, df_errors)
+
+def test_run_etl_loads_every_table(s3_client, sqlite_engine, caplog):
+    report = run_etl(processes=2)
+    # The reports cached by the API are invalidated
+    assert get_report_cache().data_version == 1
+
+    with sqlite_engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM data_challenge.jobs")).scalar() == 2
+        assert connection.execute(text("SELECT count(*) FROM data_challenge.departments")).scalar() == 2
+        assert connection.execute(text("SELECT count(*) FROM data_challenge.employees")).scalar() == 2
+    # The rows with errors are uploaded next to the file
+    keys = [item['Key'] for item in s3_client.list_objects_v2(Bucket=main_etl_process.bucket)['Contents']]
+    assert any(key.startswith('employees/error_log/') for key in keys)
+
+    assert report['files']['employee']['load']['rows'] == 2
+    assert report['files']['employee']['error_upload']['rows'] == 1
+    assert 'error_upload' not in report['files']['job']
+    assert report['files']['job']['download']['rows'] == 2
+    assert all(stage['seconds'] >= 0 for stages in report['files'].values() for stage in stages.values())
+
+    with caplog.at_level('INFO', logger='main_etl_process'):
+        log_stage_report(report)
+    assert any(record.getMessage().startswith('total       load') for record in caplog.records)
+
+@pytest.mark.parametrize("employees, whole_file", [
+    (MANY_EMPLOYEES, False),
+    # The shard of the last line has no name nor department, both are cast as in the whole file
+    (MANY_EMPLOYEES + b"40,,2022-05-01T00:00:00Z,,1\n", False),
+    # The shard of the last line has no id, its column is parsed as float
+    (MANY_EMPLOYEES + b",Nobody,2022-05-01T00:00:00Z,1,1\n", True),
+])
+def test_run_etl_by_shards(s3_client, sqlite_engine, caplog, employees, whole_file):
+    s3_client.put_object(Bucket=main_etl_process.bucket, Key=main_etl_process.file_keys_map['employee'],
+                         Body=employees)
+    expected_input, expected_errors, _, _ = prepare_file('employee', employees)
+
+    with patch('main_etl_process.plan_file',
+               lambda file_type: get_line_ranges(main_etl_process.bucket, main_etl_process.file_key(file_type), 40)), \
+            patch('main_etl_process.read_file', wraps=main_etl_process.read_file) as read_file, \
+            caplog.at_level('WARNING', logger='main_etl_process'):
+        report = run_etl(types=['employee'], processes=2)
+
+    assert report['files']['employee']['download']['shards'] > 2
+    assert report['files']['employee']['download']['rows'] == len(employees.splitlines())
+    assert report['files']['employee']['load']['rows'] == len(expected_input.index)
+    assert report['files']['employee']['error_upload']['rows'] == len(expected_errors.index)
+    assert any('as a whole' in record.getMessage() for record in caplog.records) == whole_file
+    # The file validated as a whole is streamed from S3
+    assert read_file.called == whole_file
+    with sqlite_engine.connect() as connection:
+        ids = connection.execute(text("SELECT id FROM data_challenge.employees ORDER BY id")).scalars().all()
+        hired = connection.execute(text("SELECT COALESCE(sum(hired), 0) FROM data_challenge.hiring_summary")).scalar()
+    assert ids == sorted(expected_input['column1'])
+    assert hired == len(expected_input.index)
+    # The summary of several shards is updated once, after their loads
+    assert ('summary' in report['files']['employee']) != whole_file
+
+def test_failed_shard_keeps_the_summary_of_the_committed_shards(s3_client, sqlite_engine):
+    s3_client.put_object(Bucket=main_etl_process.bucket, Key=main_etl_process.file_keys_map['employee'],
+                         Body=MANY_EMPLOYEES)
+    load_file = main_etl_process.load_file
+
+    def load_or_fail(file_type, df_input, update_summary=True):
+        assert not update_summary
+        if 1 in set(df_input['column1']):
+            raise RuntimeError("connection lost")
+        load_file(file_type, df_input, update_summary)
+
+    with patch('main_etl_process.plan_file',
+               lambda file_type: get_line_ranges(main_etl_process.bucket, main_etl_process.file_key(file_type), 40)), \
+            patch('main_etl_process.load_file', load_or_fail), \
+            pytest.raises(RuntimeError, match="connection lost"):
+        run_etl(types=['employee'], processes=2)
+
+    with sqlite_engine.connect() as connection:
+        ids = connection.execute(text("SELECT id FROM data_challenge.employees")).scalars().all()
+        hired = connection.execute(text("SELECT sum(hired) FROM data_challenge.hiring_summary")).scalar()
+    # The other shards stay committed, and the summary counts exactly them
+    assert ids and 1 not in ids
+    assert hired == len(ids)
+
+def test_failed_summary_update_rebuilds_the_summary(s3_client, sqlite_engine, caplog):
+    s3_client.put_object(Bucket=main_etl_process.bucket, Key=main_etl_process.file_keys_map['employee'],
+                         Body=MANY_EMPLOYEES)
+
+    with patch('main_etl_process.plan_file',
+               lambda file_type: get_line_ranges(main_etl_process.bucket, main_etl_process.file_key(file_type), 40)), \
+            patch('main_etl_process.Hiring_Summary_Db.increment_data', side_effect=RuntimeError("deadlock detected")), \
+            caplog.at_level('ERROR', logger='main_etl_process'):
+        run_etl(types=['employee'], processes=2)
+
+    with sqlite_engine.connect() as connection:
+        employees = connection.execute(text("SELECT count(*) FROM data_challenge.employees")).scalar()
+        hired = connection.execute(text("SELECT sum(hired) FROM data_challenge.hiring_summary")).scalar()
+    # The summary is not left behind the employees
+    assert hired == employees > 0
+    assert any('rebuilding it' in record.getMessage() for record in caplog.records)
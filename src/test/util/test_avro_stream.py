@@ -0,0 +1,55 @@
+import io
+import pytest
+import avro.datafile
+import avro.io
+import avro.schema
+from util.avro_stream import iter_blocks, iter_row_batches, AvroStreamError
+
+SCHEMA = avro.schema.parse('{"type": "record", "name": "Job", "fields": '
+                           '[{"name": "id", "type": "int"}, {"name": "job", "type": "string"}]}')
+
+class ChunkedStream:
+    """Stream that returns a few bytes on every read, like a network body."""
+
+    def __init__(self, data, chunk_size=7):
+        self._buffer = io.BytesIO(data)
+        self._chunk_size = chunk_size
+
+    def read(self, size=-1):
+        return self._buffer.read(min(size, self._chunk_size) if size and size > 0 else self._chunk_size)
+
+def build_avro_file(rows, codec):
+    buffer = io.BytesIO()
+    writer = avro.datafile.DataFileWriter(buffer, avro.io.DatumWriter(), SCHEMA, codec=codec)
+    for index, row in enumerate(rows):
+        writer.append(row)
+        if index % 100 == 99:
+            # Several blocks in the file
+            writer.flush()
+    writer.flush()
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("codec", ["null", "deflate"])
+@pytest.mark.parametrize("processes", [0, 2])
+def test_iter_row_batches_decodes_every_block(codec, processes):
+    rows = [{'id': i, 'job': f'Job {i}'} for i in range(250)]
+    data = build_avro_file(rows, codec)
+
+    batches = list(iter_row_batches(ChunkedStream(data), ['id', 'job'], processes=processes))
+
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert [row for batch in batches for row in batch] == [(row['id'], row['job']) for row in rows]
+
+def test_iter_blocks_empty_file():
+    assert list(iter_blocks(io.BytesIO(build_avro_file([], "deflate")))) == []
+
+def test_iter_blocks_rejects_other_files():
+    with pytest.raises(AvroStreamError):
+        list(iter_blocks(io.BytesIO(b'id,job\n1,Developer\n')))
+
+def test_iter_blocks_detects_corrupted_sync_marker():
+    data = bytearray(build_avro_file([{'id': 1, 'job': 'Developer'}], "null"))
+    data[-1] ^= 0xFF
+
+    with pytest.raises(AvroStreamError):
+        list(iter_blocks(io.BytesIO(bytes(data))))
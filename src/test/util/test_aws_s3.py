@@ -5,7 +5,8 @@ from io import BytesIO, StringIO
 from moto import mock_aws
 import boto3
 
-from util.aws_s3 import read_file, save_to_s3, get_from_s3
+from util.aws_s3 import (read_file, save_to_s3, get_from_s3, S3MultipartWriter, S3RangeReader, get_line_ranges,
+                         read_byte_range)
 
 BUCKET_NAME = "test-bucket"
 FILE_KEY = "test_file.csv"
@@ -46,6 +47,40 @@ def test_read_file_without_headers(s3_client):
     pd.testing.assert_frame_equal(df, expected_df)
 
 
+@mock_aws
+@pytest.mark.parametrize("use_headers", [True, False])
+def test_read_file_streams_the_body_by_chunks(use_headers):
+    """Test reading a file from S3 as an iterator of DataFrames."""
+    rows = [(index, f"Jos\u00e9 {index}") for index in range(1, 11)]
+    csv_data = ("id,name\n" if use_headers else "") + "".join(f"{index},{name}\n" for index, name in rows)
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket=BUCKET_NAME)
+    client.put_object(Bucket=BUCKET_NAME, Key=FILE_KEY, Body=csv_data.encode("utf-8"))
+
+    with patch("util.aws_s3.s3", client):
+        chunks = list(read_file(BUCKET_NAME, FILE_KEY, use_headers=use_headers, chunksize=4))
+        df_whole = read_file(BUCKET_NAME, FILE_KEY, use_headers=use_headers)
+
+    assert [len(chunk.index) for chunk in chunks] == [4, 4, 2]
+    pd.testing.assert_frame_equal(pd.concat(chunks), df_whole)
+    assert list(df_whole.columns) == (["id", "name"] if use_headers else ["column1", "column2"])
+    assert df_whole.iloc[-1].tolist() == [10, "Jos\u00e9 10"]
+
+
+@patch("util.aws_s3.s3.get_object")
+def test_read_file_closes_the_body(s3_client):
+    """Test the S3 body is closed once it is read, also by chunks."""
+    bodies = [BytesIO(b"1,Alice\n2,Bob\n"), BytesIO(b"1,Alice\n2,Bob\n")]
+    s3_client.side_effect = [{"Body": body} for body in bodies]
+
+    read_file(BUCKET_NAME, FILE_KEY)
+    chunks = read_file(BUCKET_NAME, FILE_KEY, chunksize=1)
+    next(chunks)
+    assert not bodies[1].closed
+    chunks.close()
+
+    assert bodies[0].closed and bodies[1].closed
+
 @patch("util.aws_s3.s3.put_object")
 def test_save_to_s3(mock_put_object):
     """Test saving a file to S3."""
@@ -64,3 +99,80 @@ def test_get_from_s3(mock_download_fileobj):
     get_from_s3(BUCKET_NAME, FILE_KEY, buffer)
     
     mock_download_fileobj.assert_called_once_with(BUCKET_NAME, FILE_KEY, buffer)
+
+
+@mock_aws
+@pytest.mark.parametrize("size, parts", [(10, 0), (11 * 1024 * 1024, 3)])
+def test_s3_multipart_writer(size, parts):
+    """The writer uploads full parts while it is written and completes the object on close."""
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket=BUCKET_NAME)
+    data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+
+    with patch("util.aws_s3.s3", client):
+        with S3MultipartWriter(BUCKET_NAME, FILE_KEY, part_size=5 * 1024 * 1024) as s3_file:
+            for start in range(0, size, 1024 * 1024):
+                s3_file.write(data[start:start + 1024 * 1024])
+                assert len(s3_file._buffer) < s3_file.part_size
+
+    assert s3_file.parts_count == parts
+    assert client.get_object(Bucket=BUCKET_NAME, Key=FILE_KEY)["Body"].read() == data
+
+
+@mock_aws
+def test_s3_multipart_writer_aborts_on_error():
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket=BUCKET_NAME)
+
+    with patch("util.aws_s3.s3", client):
+        with pytest.raises(RuntimeError):
+            with S3MultipartWriter(BUCKET_NAME, FILE_KEY, part_size=5 * 1024 * 1024) as s3_file:
+                s3_file.write(b"a" * (6 * 1024 * 1024))
+                raise RuntimeError("database error")
+
+    assert "Contents" not in client.list_objects_v2(Bucket=BUCKET_NAME)
+    assert client.list_multipart_uploads(Bucket=BUCKET_NAME).get("Uploads", []) == []
+
+
+@mock_aws
+def test_s3_range_reader_downloads_only_the_read_ranges():
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket=BUCKET_NAME)
+    client.put_object(Bucket=BUCKET_NAME, Key=FILE_KEY, Body=b"0123456789")
+
+    with patch("util.aws_s3.s3", client):
+        reader = S3RangeReader(BUCKET_NAME, FILE_KEY)
+        reader.seek(-3, 2)
+        tail = reader.read()
+        reader.seek(2)
+        middle = reader.read(3)
+
+    assert (tail, middle, reader.tell()) == (b"789", b"234", 5)
+    assert reader.bytes_read == 6
+
+@mock_aws
+@pytest.mark.parametrize("shard_size", [1, 7, 16, 1000, 0])
+def test_get_line_ranges(shard_size):
+    content = b"1,Alice\n2,Bob\n3,Carol\n\n4,Dave\n5,Eve"
+    client = boto3.client("s3", region_name="us-east-1")
+    client.create_bucket(Bucket=BUCKET_NAME)
+    client.put_object(Bucket=BUCKET_NAME, Key=FILE_KEY, Body=content)
+
+    with patch("util.aws_s3.s3", client):
+        ranges = get_line_ranges(BUCKET_NAME, FILE_KEY, shard_size, probe_size=3)
+        shards = [read_byte_range(BUCKET_NAME, FILE_KEY, start, end) for start, end in ranges]
+
+    # The ranges cover the object and every one but the last ends with a line break
+    assert b"".join(shards) == content
+    assert all(shard.endswith(b"\n") for shard in shards[:-1])
+    assert len(ranges) == {1: 6, 7: 5, 16: 2, 1000: 1, 0: 1}[shard_size]
+
+
+def test_s3_client_is_created_on_first_use():
+    import util.aws_s3 as aws_s3
+    from util.aws_s3 import get_s3_client
+    with patch.dict(aws_s3.__dict__):
+        aws_s3.__dict__.pop("s3", None)
+        client = get_s3_client()
+        assert aws_s3.s3 is client
+        assert get_s3_client() is client
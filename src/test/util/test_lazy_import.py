@@ -0,0 +1,22 @@
+import sys
+import pytest
+from util.lazy_import import lazy_import
+
+def test_module_runs_on_first_attribute_access(tmp_path, monkeypatch):
+    (tmp_path / "lazy_sample.py").write_text("import builtins\nbuiltins.lazy_sample_loads += 1\nVALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr("builtins.lazy_sample_loads", 0, raising=False)
+    monkeypatch.delitem(sys.modules, "lazy_sample", raising=False)
+
+    module = lazy_import("lazy_sample")
+    import builtins
+    assert builtins.lazy_sample_loads == 0
+    assert module.VALUE == 42
+    assert builtins.lazy_sample_loads == 1
+    # Imported once, later calls return the same module
+    assert lazy_import("lazy_sample") is module
+    sys.modules.pop("lazy_sample", None)
+
+def test_missing_module():
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("module_that_does_not_exist")
@@ -6,7 +6,11 @@ from util.transversal import (
     clean_dataframe,
     set_dynamic_column_names,
     cast_fields,
+    parse_datetime_column,
+    format_datetime_iso,
+    parse_datetime_value,
 )
+from datetime import datetime, timezone
 
 def test_get_current_timestamp():
     # Test with the default format
@@ -50,3 +54,23 @@ def test_set_dynamic_column_names():
     df_empty = pd.DataFrame(columns=[])
     renamed_empty_df = set_dynamic_column_names(df_empty)
     assert list(renamed_empty_df.columns) == []  # Check if empty DataFrame remains empty
+
+def test_parse_datetime_column():
+    parsed = parse_datetime_column(pd.Series(['2021-11-07T02:48:42Z', '2021-11-07', 'not a date', None]))
+
+    assert str(parsed.dtype) == 'datetime64[ns, UTC]'
+    assert parsed[0] == pd.Timestamp('2021-11-07 02:48:42', tz='UTC')
+    assert parsed[1] == pd.Timestamp('2021-11-07', tz='UTC')
+    assert parsed[2:].isna().all()
+
+def test_format_datetime_iso():
+    assert format_datetime_iso(datetime(2021, 11, 7, 2, 48, 42, tzinfo=timezone.utc)) == '2021-11-07T02:48:42Z'
+    assert format_datetime_iso(datetime(2021, 11, 7, 2, 48, 42)) == '2021-11-07T02:48:42Z'
+    assert format_datetime_iso('2021-11-07T02:48:42Z') == '2021-11-07T02:48:42Z'
+    assert format_datetime_iso(None) is None
+
+def test_parse_datetime_value():
+    assert parse_datetime_value('2021-11-07T02:48:42Z') == datetime(2021, 11, 7, 2, 48, 42, tzinfo=timezone.utc)
+    assert parse_datetime_value('2021-11-07T04:48:42+02:00') == datetime(2021, 11, 7, 2, 48, 42, tzinfo=timezone.utc)
+    assert parse_datetime_value('2021-11-07T02:48:42') == datetime(2021, 11, 7, 2, 48, 42, tzinfo=timezone.utc)
+
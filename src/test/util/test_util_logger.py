@@ -1,6 +1,6 @@
 from unittest.mock import patch
 import pandas as pd
-from util.logger import generate_s3_file_path, save_file_to_s3, save_error_log
+from util.logger import generate_s3_file_path, save_file_to_s3, save_error_log, ErrorLogWriter
 
 # Sample DataFrame for testing
 df_sample = pd.DataFrame({
@@ -63,3 +63,11 @@ def test_save_error_log(mock_clean_dataframe, mock_generate_s3_file_path, mock_s
 
     # Check if returned path matches the mocked return value
     assert s3_file_path == "folder/error_log/file_2024-01-01_12-00-00.csv"
+
+@patch("util.aws_s3.save_to_s3")
+def test_error_log_writer_without_errors(mock_save_to_s3):
+    with ErrorLogWriter("test-bucket", "folder/file.csv") as error_log:
+        s3_file_path = error_log.save()
+
+    assert s3_file_path == ''
+    mock_save_to_s3.assert_not_called()
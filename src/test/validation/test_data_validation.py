@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from validation.data_validation import (
+    FAILURE_REASON_COLUMN,
+    validate_data,
+    validate_data_by_row,
+    jobs_schema,
+    employees_schema,
+)
+
+# Frames covering the data problems found in the uploaded files
+JOBS_CASES = [
+    pd.DataFrame({"column1": [1, 2], "column2": ["Developer", "Manager"]}),
+    pd.DataFrame({"column1": [1, -2], "column2": ["Developer", "Manager"]}),
+    pd.DataFrame({"column1": [1, 2], "column2": ["Developer", np.nan]}),
+    pd.DataFrame({"column1": [1.0, np.nan], "column2": ["Developer", "Manager"]}),
+    pd.DataFrame({"column1": [1, "x", 2.0, True], "column2": ["a", "b", "c", "d"]}),
+    pd.DataFrame({"column1": [1, 2], "column2": [3, "Manager"]}),
+    pd.DataFrame({"column1": pd.array([1, None], dtype="Int64"), "column2": ["a", "b"]}),
+    pd.DataFrame({"column1": [1, 2]}),
+]
+
+@pytest.mark.parametrize("df_data", JOBS_CASES)
+def test_validate_data_matches_row_validation(df_data):
+    """The vectorized validation must split the rows exactly like the per-row one."""
+    valid_df, invalid_df = validate_data(df_data.copy(), jobs_schema)
+    expected_valid, expected_invalid = validate_data_by_row(df_data.copy(), jobs_schema)
+
+    assert list(valid_df.index) == list(expected_valid.index)
+    assert list(invalid_df.index) == list(expected_invalid.index)
+    pd.testing.assert_frame_equal(invalid_df.drop(columns=FAILURE_REASON_COLUMN), expected_invalid)
+
+def test_validate_data_failure_reasons():
+    df_data = pd.DataFrame({
+        "column1": [1, 2, 3, -4],
+        "column2": ["Alice", None, "Carol", "Dave"],
+        "column3": ["2021-01-01T00:00:00Z", "2021-01-02T00:00:00Z", "2021-01-03T00:00:00Z", None],
+        "column4": [1, 2, -1, 4],
+        "column5": [1, 2, 3, 4],
+    })
+
+    valid_df, invalid_df = validate_data(df_data, employees_schema)
+
+    assert list(valid_df.index) == [0]
+    assert FAILURE_REASON_COLUMN not in valid_df.columns
+    assert invalid_df[FAILURE_REASON_COLUMN].tolist() == [
+        "column2: null",
+        "column4: greater_than_or_equal_to(0)",
+        "column1: greater_than_or_equal_to(0); column3: null",
+    ]
+
+def test_validate_data_empty_frame():
+    df_data = pd.DataFrame({"column1": pd.Series([], dtype=int), "column2": pd.Series([], dtype=object)})
+
+    valid_df, invalid_df = validate_data(df_data, jobs_schema)
+
+    assert valid_df.empty
+    assert invalid_df.empty
+
+def test_validate_data_rejects_invalid_hire_datetime():
+    df_data = pd.DataFrame({
+        "column1": [1, 2],
+        "column2": ["Alice", "Bob"],
+        "column3": ["2021-11-07T02:48:42Z", "yesterday"],
+        "column4": [1, 2],
+        "column5": [1, 2],
+    })
+
+    valid_df, invalid_df = validate_data(df_data, employees_schema)
+
+    assert list(valid_df.index) == [0]
+    assert invalid_df[FAILURE_REASON_COLUMN].tolist() == ["column3: iso8601_datetime"]
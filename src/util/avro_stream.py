@@ -0,0 +1,164 @@
+import io
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+MAGIC = b'Obj\x01'
+SYNC_SIZE = 16
+# Bytes read from the source stream at once, the varints are read byte by byte from this buffer
+READ_BUFFER_SIZE = 1024 * 1024
+
+class AvroStreamError(Exception):
+    """Raised when a stream is not a valid Avro object container file."""
+
+class _RawStream(io.RawIOBase):
+    """Raw stream over any object with read(size) (e.g. a botocore StreamingBody), to buffer it."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    # Network streams may return less bytes than requested
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise AvroStreamError("Unexpected end of the Avro file")
+        data += chunk
+    return data
+
+def _read_long(stream, allow_eof=False):
+    """Read a zig-zag varint long, None at the end of the stream when `allow_eof` is set."""
+    shift = 0
+    value = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            if allow_eof and shift == 0:
+                return None
+            raise AvroStreamError("Unexpected end of the Avro file")
+        value |= (byte[0] & 0x7F) << shift
+        if not byte[0] & 0x80:
+            return (value >> 1) ^ -(value & 1)
+        shift += 7
+
+def _read_bytes(stream):
+    return _read_exact(stream, _read_long(stream))
+
+def read_header(stream):
+    """
+    Read the header of an Avro object container file.
+
+    Args:
+        stream (file): Readable binary stream positioned at the start of the file.
+
+    Returns:
+        tuple: The metadata (dict of bytes) and the sync marker.
+
+    Raises:
+        AvroStreamError: If the stream is not an Avro file.
+    """
+    if _read_exact(stream, len(MAGIC)) != MAGIC:
+        raise AvroStreamError("Not an Avro object container file")
+    meta = {}
+    while True:
+        count = _read_long(stream)
+        if count == 0:
+            break
+        if count < 0:
+            # Negative counts are followed by the size of the block of entries
+            count = -count
+            _read_long(stream)
+        for _ in range(count):
+            key = _read_bytes(stream).decode('utf-8')
+            meta[key] = _read_bytes(stream)
+    return meta, _read_exact(stream, SYNC_SIZE)
+
+def iter_blocks(stream):
+    """
+    Read the data blocks of an Avro file as they arrive, without decoding them.
+
+    Args:
+        stream (file): Readable binary stream positioned at the start of the file
+                       (e.g. the body of an S3 object).
+
+    Yields:
+        tuple: The writer schema (JSON), the codec, the number of records and the block bytes.
+    """
+    stream = io.BufferedReader(_RawStream(stream), buffer_size=READ_BUFFER_SIZE)
+    meta, sync_marker = read_header(stream)
+    schema_json = meta['avro.schema'].decode('utf-8')
+    codec = meta.get('avro.codec', b'null').decode('utf-8')
+    while True:
+        count = _read_long(stream, allow_eof=True)
+        if count is None:
+            return
+        data = _read_bytes(stream)
+        if _read_exact(stream, SYNC_SIZE) != sync_marker:
+            raise AvroStreamError("Invalid sync marker, the Avro file is corrupted")
+        yield schema_json, codec, count, data
+
+def decode_block(schema_json, codec, count, data, field_names):
+    """
+    Decode the records of an Avro data block.
+
+    It is a module function so it can run in the processes of a pool.
+
+    Args:
+        schema_json (str): Writer schema of the file.
+        codec (str): Compression of the block (null or deflate).
+        count (int): Number of records of the block.
+        data (bytes): The block bytes.
+        field_names (list): Fields of the returned tuples, in order.
+
+    Returns:
+        list: The records as tuples following `field_names`.
+    """
+    # avro is only loaded by the processes that decode
+    import avro.io
+    import avro.schema
+    if codec == 'deflate':
+        data = zlib.decompress(data, -15)
+    elif codec != 'null':
+        raise AvroStreamError(f"Unsupported codec: {codec}")
+    reader = avro.io.DatumReader(avro.schema.parse(schema_json))
+    decoder = avro.io.BinaryDecoder(io.BytesIO(data))
+    rows = []
+    for _ in range(count):
+        record = reader.read(decoder)
+        rows.append(tuple(record[name] for name in field_names))
+    return rows
+
+def iter_row_batches(stream, field_names, processes=0):
+    """
+    Decode an Avro file block by block while it is read.
+
+    Args:
+        stream (file): Readable binary stream of the Avro file.
+        field_names (list): Fields of the returned tuples, in order.
+        processes (int): Decode the blocks in a pool of processes, 0 or 1 decodes them in this process.
+
+    Yields:
+        list: The records of each block as tuples following `field_names`.
+    """
+    if not processes or processes <= 1:
+        for block in iter_blocks(stream):
+            yield decode_block(*block, field_names)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = []
+        for block in iter_blocks(stream):
+            pending.append(executor.submit(decode_block, *block, field_names))
+            # Bound the blocks in memory, the batches keep the file order
+            if len(pending) >= processes * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
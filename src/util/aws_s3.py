@@ -1,8 +1,9 @@
-import boto3
-import pandas as pd
+import json
 import logging
-from io import StringIO
+import threading
+from util.lazy_import import lazy_import
 from util.transversal import set_dynamic_column_names
+pd = lazy_import("pandas")
 logging.basicConfig(
     format="{asctime} - {levelname} - {message}",
     style="{",
@@ -11,16 +12,45 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# AWS configurations
-s3 = boto3.client('s3')
+# AWS configurations, the client (and boto3) are created on first use, see get_s3_client
+_s3_lock = threading.Lock()
 
-def read_file(bucket:str, file_key: str, use_headers=False):
+def get_s3_client():
+    """
+    Get the S3 client of the process, importing boto3 and creating it on first use.
+
+    Returns:
+        botocore.client.S3: The client, also available as the `s3` attribute of this module.
+    """
+    client = globals().get('s3')
+    if client is None:
+        with _s3_lock:
+            client = globals().get('s3')
+            if client is None:
+                import boto3
+                client = boto3.client('s3')
+                globals()['s3'] = client
+    return client
+
+def __getattr__(name):
+    # `util.aws_s3.s3` keeps working (e.g. for mock.patch), the client is created when it is read
+    if name == 's3':
+        return get_s3_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# S3 requires every part of a multipart upload but the last one to have at least 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+def read_file(bucket:str, file_key: str, use_headers=False, chunksize=None, dtype=None):
     """
         Reads a CSV file from an S3 bucket and returns its content as a Pandas DataFrame.
 
         If `use_headers` is set to `False`, the function dynamically assigns column names 
         in the format 'column1', 'column2', ..., 'columnN'. 
 
+        The body of the object is streamed into the CSV parser, which decodes it while
+        it is downloaded: the content is never held as a whole in bytes or in a string.
+
         Parameters:
         -----------
         file_key : str
@@ -28,22 +58,39 @@ def read_file(bucket:str, file_key: str, use_headers=False):
         use_headers : bool, optional
             If `True`, uses the first row of the CSV as column headers. 
             If `False`, assigns dynamic column names. Default is `False`.
+        chunksize : int, optional
+            If set, returns an iterator of DataFrames of `chunksize` rows, only one
+            chunk is in memory at a time. The column types are inferred by chunk.
+        dtype : dict, optional
+            Types of some columns (by name, or by position without headers), the
+            others are inferred.
 
         Returns:
         --------
         pd.DataFrame
-            A Pandas DataFrame containing the content of the CSV file.
-    """
-    # Connect to S3 and read CSV file
-    response = s3.get_object(Bucket=bucket, Key=file_key)
-    csv_data = response['Body'].read().decode('utf-8')
-    # Change CSV into Pandas DataFrame
-    csv_io = StringIO(csv_data)
-    df_data = pd.read_csv(csv_io, header=0 if use_headers else None)
+            A Pandas DataFrame containing the content of the CSV file, or an iterator
+            of DataFrames when `chunksize` is set.
+    """
+    body = open_from_s3(bucket, file_key)
+    if chunksize:
+        return _iter_csv_chunks(body, use_headers, chunksize, dtype)
+    try:
+        df_data = pd.read_csv(body, header=0 if use_headers else None, dtype=dtype)
+    finally:
+        body.close()
     if not use_headers:
         df_data = set_dynamic_column_names(df_data)
     return df_data
 
+def _iter_csv_chunks(body, use_headers, chunksize, dtype=None):
+    # The body is closed when the iteration ends or the iterator is discarded
+    try:
+        with pd.read_csv(body, header=0 if use_headers else None, chunksize=chunksize, dtype=dtype) as reader:
+            for df_chunk in reader:
+                yield df_chunk if use_headers else set_dynamic_column_names(df_chunk)
+    finally:
+        body.close()
+
 def save_to_s3(output_file, bucket, s3_file_path):
     """
     Take a file to save as an oject to save in a S3 bucket.
@@ -53,7 +100,7 @@ def save_to_s3(output_file, bucket, s3_file_path):
         buket (str): Name of bucket to save data
         s3_file_path (str): The file path where the CSV will be stored in S3.
     """
-    s3.put_object(Bucket=bucket, Key=s3_file_path, Body=output_file)
+    get_s3_client().put_object(Bucket=bucket, Key=s3_file_path, Body=output_file)
 
 def get_from_s3(bucket, s3_file_path, avro_buffer):
     """
@@ -64,4 +111,284 @@ def get_from_s3(bucket, s3_file_path, avro_buffer):
         s3_file_path (str): The file path where the CSV will be stored in S3.
         avro_buffer (io.ByteoIO): Data buffer for avro
     """
-    return s3.download_fileobj(bucket, s3_file_path, avro_buffer)
\ No newline at end of file
+    return get_s3_client().download_fileobj(bucket, s3_file_path, avro_buffer)
+
+def open_from_s3(bucket, s3_file_path):
+    """
+    Open an object of an S3 bucket as a stream, the content is downloaded while it is read.
+
+    Args:
+        bucket (str): Name of the bucket.
+        s3_file_path (str): The key of the object.
+
+    Returns:
+        StreamingBody: Readable stream with the object content.
+    """
+    return get_s3_client().get_object(Bucket=bucket, Key=s3_file_path)['Body']
+
+def read_byte_range(bucket, s3_file_path, start, end):
+    """
+    Download a byte range of an object of an S3 bucket with a ranged GET.
+
+    Args:
+        bucket (str): Name of the bucket.
+        s3_file_path (str): The key of the object.
+        start (int): First byte of the range.
+        end (int): Byte after the last one of the range.
+
+    Returns:
+        bytes: The content of the range, empty if the range is.
+    """
+    if end <= start:
+        return b''
+    response = get_s3_client().get_object(Bucket=bucket, Key=s3_file_path, Range=f'bytes={start}-{end - 1}')
+    return response['Body'].read()
+
+def find_line_start(bucket, s3_file_path, position, size, probe_size=64 * 1024):
+    """
+    Find the first line of an S3 object that starts at or after a byte position.
+
+    Args:
+        bucket (str): Name of the bucket.
+        s3_file_path (str): The key of the object.
+        position (int): Byte position.
+        size (int): Size of the object.
+        probe_size (int): Bytes downloaded on each try until a line break is found.
+
+    Returns:
+        int: The position of the line start, `size` if there is no line after the position.
+    """
+    if position <= 0:
+        return 0
+    # The byte before the position is read too, a line may start right at the position
+    offset = position - 1
+    while offset < size:
+        data = read_byte_range(bucket, s3_file_path, offset, min(offset + probe_size, size))
+        index = data.find(b'\n')
+        if index >= 0:
+            return offset + index + 1
+        offset += len(data)
+    return size
+
+def get_line_ranges(bucket, s3_file_path, shard_size, probe_size=64 * 1024):
+    """
+    Split an S3 object of text lines into byte ranges of about `shard_size` bytes
+    that start and end on line boundaries, so each one can be downloaded and
+    parsed on its own. Only a probe around every boundary is downloaded to find it.
+
+    Fields with line breaks inside quotes are not supported, a range could start
+    in the middle of one.
+
+    Args:
+        bucket (str): Name of the bucket.
+        s3_file_path (str): The key of the object.
+        shard_size (int): Bytes of each range, 0 returns the whole object as one range.
+        probe_size (int): Bytes downloaded on each try to find a line break.
+
+    Returns:
+        list: The (start, end) byte positions of the ranges, `end` excluded.
+    """
+    size = get_s3_client().head_object(Bucket=bucket, Key=s3_file_path)['ContentLength']
+    boundaries = [0]
+    if shard_size > 0:
+        for position in range(shard_size, size, shard_size):
+            boundary = find_line_start(bucket, s3_file_path, max(position, boundaries[-1] + 1), size, probe_size)
+            if boundary >= size:
+                break
+            boundaries.append(boundary)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def list_s3_keys(bucket, prefix):
+    """
+    List the keys of the objects under a prefix of an S3 bucket.
+
+    Args:
+        bucket (str): Name of the bucket.
+        prefix (str): Prefix of the keys.
+
+    Returns:
+        list: The sorted keys.
+    """
+    keys = []
+    for page in get_s3_client().get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(item['Key'] for item in page.get('Contents', []))
+    return sorted(keys)
+
+def delete_s3_keys(bucket, keys):
+    """
+    Delete objects of an S3 bucket.
+
+    Args:
+        bucket (str): Name of the bucket.
+        keys (list): The keys to delete.
+    """
+    keys = list(keys)
+    # delete_objects accepts up to 1000 keys per call
+    for start in range(0, len(keys), 1000):
+        get_s3_client().delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]]})
+
+def read_json_from_s3(bucket, s3_file_path):
+    """
+    Read a JSON object from an S3 bucket.
+
+    Args:
+        bucket (str): Name of the bucket.
+        s3_file_path (str): The key of the object.
+
+    Returns:
+        Any: The decoded JSON, None if the object does not exist.
+    """
+    # botocore is already loaded by the client
+    from botocore.exceptions import ClientError
+    try:
+        response = get_s3_client().get_object(Bucket=bucket, Key=s3_file_path)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+    return json.loads(response['Body'].read().decode('utf-8'))
+
+def save_json_to_s3(data, bucket, s3_file_path):
+    """
+    Save a JSON serializable object in an S3 bucket.
+
+    Args:
+        data (Any): The object to save.
+        bucket (str): Name of the bucket.
+        s3_file_path (str): The key of the object.
+    """
+    get_s3_client().put_object(Bucket=bucket, Key=s3_file_path, Body=json.dumps(data, indent=2).encode('utf-8'),
+                  ContentType='application/json')
+
+class S3RangeReader:
+    """
+    Seekable read-only file object over an S3 object that downloads only the ranges it reads.
+
+    Columnar readers (e.g. Parquet) read the footer and then only the byte ranges
+    of the parts they need, so just those bytes are transferred.
+    """
+
+    def __init__(self, bucket, s3_file_path):
+        self.bucket = bucket
+        self.s3_file_path = s3_file_path
+        self.size = get_s3_client().head_object(Bucket=bucket, Key=s3_file_path)['ContentLength']
+        self.bytes_read = 0
+        self.closed = False
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self.size
+        self._position = max(0, min(offset, self.size))
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._position
+        end = min(self._position + size, self.size)
+        if end <= self._position:
+            return b''
+        data = read_byte_range(self.bucket, self.s3_file_path, self._position, end)
+        self._position += len(data)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        self.closed = True
+
+class S3MultipartWriter:
+    """
+    Writable file object that uploads its content to S3 while it is written.
+
+    The data is buffered up to `part_size` bytes and sent as a part of a multipart
+    upload, so the memory used does not depend on the size of the object. Objects
+    smaller than one part are sent with a single put_object. Leaving the context
+    with an exception aborts the upload, no partial object is left in the bucket.
+
+    Example:
+        with S3MultipartWriter(bucket, 'backups/job_backup.avro') as s3_file:
+            s3_file.write(data)
+    """
+
+    def __init__(self, bucket, s3_file_path, part_size=8 * 1024 * 1024):
+        self.bucket = bucket
+        self.s3_file_path = s3_file_path
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.bytes_written = 0
+        self.closed = False
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    @property
+    def parts_count(self):
+        return len(self._parts)
+
+    def tell(self):
+        return self.bytes_written
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def flush(self):
+        # Parts are only sent once they are full
+        pass
+
+    def _upload_part(self, data):
+        if self._upload_id is None:
+            response = get_s3_client().create_multipart_upload(Bucket=self.bucket, Key=self.s3_file_path)
+            self._upload_id = response['UploadId']
+        part_number = len(self._parts) + 1
+        response = get_s3_client().upload_part(Bucket=self.bucket, Key=self.s3_file_path, PartNumber=part_number,
+                                  UploadId=self._upload_id, Body=data)
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self):
+        """Send the buffered data and complete the upload."""
+        if self.closed:
+            return
+        if self._upload_id is None:
+            get_s3_client().put_object(Bucket=self.bucket, Key=self.s3_file_path, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            get_s3_client().complete_multipart_upload(Bucket=self.bucket, Key=self.s3_file_path, UploadId=self._upload_id,
+                                         MultipartUpload={'Parts': self._parts})
+        self._buffer = bytearray()
+        self.closed = True
+
+    def abort(self):
+        """Discard the upload and the parts already sent."""
+        if self.closed:
+            return
+        if self._upload_id is not None:
+            get_s3_client().abort_multipart_upload(Bucket=self.bucket, Key=self.s3_file_path, UploadId=self._upload_id)
+        self._buffer = bytearray()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
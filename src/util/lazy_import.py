@@ -0,0 +1,35 @@
+import importlib.util
+import sys
+import threading
+
+_lock = threading.Lock()
+
+def lazy_import(name):
+    """
+    Import a module the first time one of its attributes is used (importlib.util.LazyLoader).
+
+    The heavy dependencies (pandas, pandera...) are only loaded by the code paths
+    that use them, so importing the API stays fast for the workers that only
+    serve the reports or the login.
+
+    Args:
+        name (str): Name of the module (e.g. 'pandas'). The package of a submodule
+                    is imported right away, so the submodules of heavy packages
+                    (avro.io, pyarrow.parquet) are imported inside the functions
+                    that use them instead.
+
+    Returns:
+        module: The module, loaded or still pending.
+    """
+    with _lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
@@ -1,4 +1,5 @@
 from io import StringIO
+import tempfile
 import util.aws_s3 as aws_s3
 import util.transversal as transversal
 import logging
@@ -56,3 +57,58 @@ def save_error_log(df_errors, bucket_name, base_file_name):
     s3_file_path = generate_s3_file_path(base_file_name)
     save_file_to_s3(df_errors, bucket_name, s3_file_path)
     return s3_file_path
+
+class ErrorLogWriter:
+    """
+    Collect the invalid rows of a file chunk by chunk and save them as one error log in S3.
+
+    The rows are appended to a local temporary file, so only one chunk is kept in
+    memory at a time, and the file is uploaded once with `save`.
+
+    Example:
+        with ErrorLogWriter(bucket, 'employees/file.csv') as error_log:
+            error_log.append(df_invalid)
+            s3_file_path = error_log.save()
+    """
+
+    def __init__(self, bucket_name, base_file_name):
+        self.bucket_name = bucket_name
+        self.base_file_name = base_file_name
+        self.rows = 0
+        self._file = tempfile.TemporaryFile(mode="w+b")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, df_errors):
+        """
+        Append the invalid rows of a chunk to the error log.
+
+        Args:
+            df_errors (pd.DataFrame): The DataFrame containing the errors.
+        """
+        cleaned_df = transversal.clean_dataframe(df_errors)
+        self._file.write(cleaned_df.to_csv(index=False, header=self.rows == 0).encode("utf-8"))
+        self.rows += len(df_errors.index)
+
+    def save(self):
+        """
+        Upload the collected rows to S3, if any.
+
+        Returns:
+            str: The S3 file path of the error log, empty string when there are no errors.
+        """
+        if self.rows == 0:
+            return ''
+        s3_file_path = generate_s3_file_path(self.base_file_name)
+        self._file.seek(0)
+        aws_s3.save_to_s3(output_file=self._file, bucket=self.bucket_name, s3_file_path=s3_file_path)
+        logger.info(f"File log saved as CSV to s3://{self.bucket_name}/{s3_file_path}")
+        return s3_file_path
+
+    def close(self):
+        """Remove the local temporary file."""
+        self._file.close()
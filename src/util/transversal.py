@@ -1,7 +1,8 @@
-import pandas as pd
+from __future__ import annotations
 import re
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Dict
+from util.lazy_import import lazy_import
 import logging
 logging.basicConfig(
     format="{asctime} - {levelname} - {message}",
@@ -10,6 +11,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
+pd = lazy_import("pandas")
 
 def get_current_timestamp(format_str="%Y-%m-%d_%H-%M-%S"):
     """
@@ -65,6 +67,49 @@ def set_dynamic_column_names(df_param: pd.DataFrame):
     df_param.columns = column_names
     return df_param
 
+def parse_datetime_column(series: pd.Series) -> pd.Series:
+    """
+    Parses a column of ISO 8601 strings (e.g. '2021-11-07T02:48:42Z') into UTC timestamps.
+
+    Parameters:
+    - series (pd.Series): Column with the datetime strings.
+
+    Returns:
+    - pd.Series: Column of timezone aware (UTC) timestamps, NaT where the value can not be parsed.
+    """
+    return pd.to_datetime(series, utc=True, format='ISO8601', errors='coerce')
+
+def parse_datetime_value(value: str):
+    """
+    Parses one ISO 8601 string (e.g. '2021-11-07T02:48:42Z') into a UTC datetime.
+
+    Parameters:
+    - value (str): The datetime string.
+
+    Returns:
+    - datetime: Timezone aware datetime, naive values are taken as UTC.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def format_datetime_iso(value):
+    """
+    Formats a datetime as the ISO 8601 UTC string used in the source files (e.g. '2021-11-07T02:48:42Z').
+
+    Parameters:
+    - value (datetime|str|None): The datetime to format, naive values are taken as UTC.
+
+    Returns:
+    - str: The formatted datetime, strings and None are returned as they are.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
 def cast_fields(df_data: pd.DataFrame, string_columns: List[str] = None, int_columns: Dict[str, int] = None
 ) -> pd.DataFrame:
     """
@@ -1,6 +1,10 @@
+import numpy as np
 import pandas as pd
 import pandera as pa
 from pandera import Column, Check
+from pandera.engines import pandas_engine
+from pandera.backends.pandas.register import register_pandas_backends
+from util.transversal import parse_datetime_column
 import logging
 logging.basicConfig(
     format="{asctime} - {levelname} - {message}",
@@ -10,6 +14,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Column added to the invalid rows with the reason why each one was rejected
+FAILURE_REASON_COLUMN = "failure_reason"
+
 # Pandera validation schema for jobs
 jobs_schema = pa.DataFrameSchema({
     "column1": Column(pa.Int, checks=Check.ge(0)),  # Column 1 must be int >= 0
@@ -26,7 +33,8 @@ departments_schema = pa.DataFrameSchema({
 employees_schema = pa.DataFrameSchema({
     "column1": Column(pa.Int, checks=Check.ge(0)),  # Column 1 must be int >= 0
     "column2": Column(pa.String, nullable=False),  # Column 2 must be string
-    "column3": Column(pa.String, nullable=False),  # Column 3 must be string
+    "column3": Column(pa.String, nullable=False,  # Column 3 must be an ISO 8601 datetime string
+                      checks=Check(lambda s: parse_datetime_column(s).notna(), error="iso8601_datetime")),
     "column4": Column(pa.Int, checks=Check.ge(0)),  # Column 4 must be int >= 0
     "column5": Column(pa.Int, checks=Check.ge(0)),  # Column 5 must be int >= 0
 })
@@ -42,13 +50,133 @@ def validate_row(row, schema):
         #logger.debug(e)
         return False
 
-# Function to validate the entire dataframe
-def validate_data(df_data: pd.DataFrame, schema):
-    # Apply validation to each row
-    valid_rows = df_data.apply(lambda row: validate_row(row, schema), axis=1)
-    # Split valid/invalid elements
-    valid_df = df_data[valid_rows]
-    invalid_df = df_data[~valid_rows]
+def _integer_mask(series: pd.Series) -> pd.Series:
+    """
+    Flag the values that pandera accepts as integers once the row is rebuilt as a DataFrame.
+
+    Args:
+        series (pd.Series): Column to check.
+
+    Returns:
+        pd.Series: Boolean mask, True where the value is an integer.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "iu":
+        return pd.Series(True, index=series.index)
+    if isinstance(dtype, np.dtype) and dtype.kind != "O":
+        # float, bool and datetime columns never hold a valid integer
+        return pd.Series(False, index=series.index)
+    # Mixed (object) or extension columns are judged value by value
+    return series.astype(object).map(
+        lambda value: isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+    ).astype(bool)
+
+def _string_mask(series: pd.Series) -> pd.Series:
+    """
+    Flag the values that pandera accepts as strings once the row is rebuilt as a DataFrame.
+
+    Args:
+        series (pd.Series): Column to check.
+
+    Returns:
+        pd.Series: Boolean mask, True where the value is a string.
+    """
+    if isinstance(series.dtype, pd.StringDtype):
+        return series.notna()
+    if series.dtype != object:
+        return pd.Series(False, index=series.index)
+    return series.map(lambda value: isinstance(value, str)).astype(bool)
+
+def _type_mask(series: pd.Series, expected_dtype) -> pd.Series:
+    """
+    Build the data type mask of a column for the dtype declared in the schema.
+
+    Args:
+        series (pd.Series): Column to check.
+        expected_dtype: Pandera data type declared for the column.
+
+    Returns:
+        pd.Series: Boolean mask, True where the value has the expected type.
+    """
+    if pd.api.types.is_integer_dtype(expected_dtype.type):
+        return _integer_mask(series)
+    if str(expected_dtype) == "str":
+        return _string_mask(series)
+    # Any other dtype is delegated to pandera, which answers per column or per value
+    result = expected_dtype.check(pandas_engine.Engine.dtype(series.dtype), series)
+    if isinstance(result, pd.Series):
+        return result.fillna(False).astype(bool)
+    return pd.Series(bool(result), index=series.index)
+
+def _check_mask(series: pd.Series, check) -> pd.Series:
+    """
+    Run a pandera check over a whole column and return its element-wise result.
+
+    Args:
+        series (pd.Series): Column values that already passed the type check.
+        check (pa.Check): Check declared in the schema (e.g. Check.ge(0)).
+
+    Returns:
+        pd.Series: Boolean mask, True where the value passes the check.
+    """
+    if series.empty:
+        return pd.Series(True, index=series.index)
+    check_output = check(series).check_output
+    if isinstance(check_output, pd.Series):
+        return check_output.reindex(series.index, fill_value=False).astype(bool)
+    return pd.Series(bool(check_output), index=series.index)
+
+def get_failure_reasons(df_data: pd.DataFrame, schema) -> pd.Series:
+    """
+    Validate the whole DataFrame against a pandera schema in a single pass.
+
+    Every column declared in the schema is checked with column-wise masks for
+    data type, nulls and its checks (e.g. ge(0)); the result gives the same
+    valid/invalid split as validating each row with `validate_row`.
+
+    Args:
+        df_data (pd.DataFrame): The DataFrame to validate.
+        schema (pa.DataFrameSchema): The pandera schema definition.
+
+    Returns:
+        pd.Series: The failure reason of each row, empty string for the valid ones.
+    """
+    register_pandas_backends()
+    reasons = pd.Series("", index=df_data.index, dtype=object)
+
+    for column_name, column_schema in schema.columns.items():
+        if column_name not in df_data.columns:
+            reasons[:] = reasons + f"{column_name}: missing column; "
+            continue
+        series = df_data[column_name]
+        null_mask = series.isna()
+        type_mask = _type_mask(series, column_schema.dtype) & ~null_mask
+
+        failures = [(~type_mask & ~null_mask, f"expected {column_schema.dtype}")]
+        if not column_schema.nullable:
+            failures.insert(0, (null_mask, "null"))
+        for check in column_schema.checks:
+            passed = _check_mask(series[type_mask], check).reindex(series.index, fill_value=True)
+            failures.append((~passed, check.error or check.name))
+
+        # Only the first failure of each column is reported
+        column_pending = pd.Series(True, index=df_data.index)
+        for mask, reason in failures:
+            hit = mask & column_pending
+            reasons[hit] = reasons[hit] + f"{column_name}: {reason}; "
+            column_pending &= ~mask
+
+    return reasons.str.rstrip("; ")
+
+def log_validation_summary(df_data: pd.DataFrame, valid_df: pd.DataFrame, invalid_df: pd.DataFrame):
+    """
+    Log the number of input, valid and invalid rows of a validation.
+
+    Args:
+        df_data (pd.DataFrame): The validated DataFrame.
+        valid_df (pd.DataFrame): Rows that passed the validation.
+        invalid_df (pd.DataFrame): Rows that failed the validation.
+    """
     logger.debug(' ###################################')
     logger.debug(' ##### DATA VALIDATION SUMMARY #####')
     logger.debug(' ###################################')
@@ -57,10 +185,47 @@ def validate_data(df_data: pd.DataFrame, schema):
     logger.debug(f' INVALID DATA COUNT: {len(invalid_df.index)}')
     logger.debug(' ###################################')
 
-    #logger.debug(' INPUT DATA ########################################')
-    #logger.debug(df_data)
-    #logger.debug(' CORRECT DATA ######################################')
-    #logger.debug(valid_df)
-    #logger.debug(' BAD DATA ##########################################')
-    #logger.debug(invalid_df)
-    return valid_df, invalid_df
\ No newline at end of file
+# Function to validate the entire dataframe
+def validate_data(df_data: pd.DataFrame, schema):
+    """
+    Split a DataFrame into valid and invalid rows using a vectorized validation.
+
+    Args:
+        df_data (pd.DataFrame): The DataFrame to validate.
+        schema (pa.DataFrameSchema): The pandera schema definition.
+
+    Returns:
+        tuple: The valid rows and the invalid rows, the latter with an extra
+               `failure_reason` column describing why each row was rejected.
+    """
+    reasons = get_failure_reasons(df_data, schema)
+    valid_rows = reasons == ""
+    # Split valid/invalid elements
+    valid_df = df_data[valid_rows]
+    invalid_df = df_data[~valid_rows].assign(**{FAILURE_REASON_COLUMN: reasons[~valid_rows]})
+    log_validation_summary(df_data, valid_df, invalid_df)
+    return valid_df, invalid_df
+
+def validate_data_by_row(df_data: pd.DataFrame, schema):
+    """
+    Split a DataFrame into valid and invalid rows running the schema once per row.
+
+    This is the original implementation, kept as the reference for `validate_data`
+    and as the baseline of the validation benchmark.
+
+    Args:
+        df_data (pd.DataFrame): The DataFrame to validate.
+        schema (pa.DataFrameSchema): The pandera schema definition.
+
+    Returns:
+        tuple: The valid rows and the invalid rows.
+    """
+    # Apply validation to each row
+    valid_rows = df_data.apply(lambda row: validate_row(row, schema), axis=1)
+    if df_data.empty:
+        valid_rows = pd.Series(True, index=df_data.index, dtype=bool)
+    # Split valid/invalid elements
+    valid_df = df_data[valid_rows]
+    invalid_df = df_data[~valid_rows]
+    log_validation_summary(df_data, valid_df, invalid_df)
+    return valid_df, invalid_df
@@ -0,0 +1,8 @@
+"""
+WSGI entry point of the API.
+
+    gunicorn --config src/gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app()